@@ -37,7 +37,10 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False,  # Hide the login/logout buttons
+    'SPEC_URL': 'schema-json',  # Swagger UI loads the prebuilt document (loyalty/docs.py)
 }
+# OpenAPI document written by `manage.py generate_openapi` and served at /openapi.json
+LOYALTY_OPENAPI_SCHEMA_PATH = None  # Generated on the first docs request
 
 # Application definition
 
@@ -55,6 +58,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loyalty.metrics.PrometheusMiddleware',  # Request latency per route, served at /metrics
+    'loyalty.profiling.ProfilingMiddleware',  # Opt-in, see LOYALTY_PROFILING
+    'loyalty.query_inspection.QueryInspectionMiddleware',  # N+1 / slow-query log, see LOYALTY_QUERY_INSPECTION
+    'loyalty.db_routers.PrimaryStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,6 +107,70 @@ DATABASES = {
     }
 }
 
+# Read replicas: aliases listed in LOYALTY_READ_REPLICAS receive safe reads (see loyalty.db_routers).
+# Locally 'replica' mirrors 'default', so routing can be exercised with two aliases:
+#   LOYALTY_READ_REPLICAS=replica python manage.py runserver
+DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['loyalty.db_routers.ProgramShardRouter', 'loyalty.db_routers.PrimaryReplicaRouter']
+LOYALTY_READ_REPLICAS = [alias for alias in os.environ.get('LOYALTY_READ_REPLICAS', '').split(',') if alias]
+LOYALTY_PRIMARY_STICKINESS_SECONDS = 5  # Clients read from the primary this long after a write
+LOYALTY_PRIMARY_STICKINESS_CACHE = 'default'  # Pins of API clients; LocMem is enough for a single process
+
+# Shards: aliases listed in LOYALTY_SHARDS hold program data, placed per program (see loyalty.sharding).
+# Locally 'shard_1' is a second database on the same server (createdb loyalty_shard_1, then migrate it):
+#   python manage.py migrate --database shard_1
+#   LOYALTY_SHARDS=default,shard_1 python manage.py configure_shard_sequences
+DATABASES['shard_1'] = {**DATABASES['default'], 'NAME': 'loyalty_shard_1'}
+LOYALTY_SHARDS = [alias for alias in os.environ.get('LOYALTY_SHARDS', 'default').split(',') if alias]
+LOYALTY_SHARD_DIRECTORY_TTL = 5  # Seconds a process may cache a program's shard; moves wait this long
+
+# Liability totals: rows per program that balance writes are spread over (see loyalty.models.ProgramAggregate)
+LOYALTY_AGGREGATE_SLOTS = 16
+
+# Caching
+# Program configuration (tiers, special tasks) is cached per program and config version.
+# Point LOYALTY_CONFIG_CACHE at a shared backend (e.g. Redis) to share entries between workers.
+# Caches that must be shared (see loyalty/checks.py) are only verified by `manage.py check --deploy`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'loyalty-default',
+    }
+}
+LOYALTY_CONFIG_CACHE = 'default'
+LOYALTY_CONFIG_CACHE_TIMEOUT = 3600  # Seconds; entries are also invalidated by version bumps
+
+# N+1 detection and slow-query log (loyalty/query_inspection.py), reported on the `loyalty.queries` logger
+LOYALTY_QUERY_INSPECTION = {
+    'ENABLED': DEBUG,
+    'REPEAT_THRESHOLD': 3,  # Same-shape queries per request reported as a possible N+1
+    'SLOW_QUERY_MS': 100,  # Queries slower than this are logged with their stack
+}
+
+# Prometheus metrics (loyalty/metrics.py). Multi-worker deployments also set PROMETHEUS_MULTIPROC_DIR.
+LOYALTY_METRICS_TOKEN = None  # Bearer token required by /metrics when set
+
+# Request profiling (loyalty/profiling.py); read the results with `manage.py profile_report`
+LOYALTY_PROFILING = {
+    'ENABLED': os.environ.get('LOYALTY_PROFILING') == '1',  # LOYALTY_PROFILING=1 python manage.py runserver
+    'SAMPLE_RATE': 1.0,  # Fraction of requests run under cProfile
+    'SLOW_REQUEST_MS': 200,  # Requests this slow get their view profiled on its next request
+    'DIRECTORY': BASE_DIR.parent / 'profiles',
+    'MAX_PROFILES': 200,  # Oldest profiles are deleted beyond this
+}
+
+# Token-bucket throttling of /api/points/ (see loyalty/throttling.py): `rate` is the sustained refill
+# rate, `burst` the bucket size. Buckets live in LOYALTY_THROTTLE_CACHE, which must be shared between
+# workers (e.g. Redis) for the limits to apply across processes; LocMem only limits each process.
+LOYALTY_THROTTLE_CACHE = 'default'
+LOYALTY_THROTTLE_RATES = {
+    'program': {'rate': '50/s', 'burst': 100},  # Shared by all clients of one loyalty program
+    'client': {'rate': '20/s', 'burst': 40},  # Per authenticated user (or IP)
+}
+
+# Cold storage for archived transactions (see loyalty/archive.py and `manage.py archive_transactions`)
+LOYALTY_ARCHIVE_ROOT = BASE_DIR.parent / 'archive'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -123,7 +194,16 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'loyalty.renderers.ORJSONRenderer',  # orjson-backed, same output as JSONRenderer
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'loyalty.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
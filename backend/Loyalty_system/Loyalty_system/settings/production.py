@@ -4,7 +4,7 @@ import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
-print(BASE_DIR)
+
 # Define get_secret directly
 def get_secret(secret_id, backup=None):
     return os.getenv(secret_id, backup)
@@ -42,7 +42,10 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False,  # Hide the login/logout buttons
+    'SPEC_URL': 'schema-json',  # Swagger UI loads the prebuilt document (loyalty/docs.py)
 }
+# OpenAPI document written by `manage.py generate_openapi` and served at /openapi.json
+LOYALTY_OPENAPI_SCHEMA_PATH = os.getenv("OPENAPI_SCHEMA_PATH", str(BASE_DIR.parent / "openapi.json"))
 
 # Application definition
 INSTALLED_APPS = [
@@ -60,6 +63,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loyalty.metrics.PrometheusMiddleware',  # Request latency per route, served at /metrics
+    'loyalty.profiling.ProfilingMiddleware',  # Opt-in, see LOYALTY_PROFILING
+    'loyalty.query_inspection.QueryInspectionMiddleware',  # N+1 / slow-query log, see LOYALTY_QUERY_INSPECTION
+    'loyalty.db_routers.PrimaryStickinessMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -93,10 +100,79 @@ TEMPLATES = [
 WSGI_APPLICATION = 'Loyalty_system.wsgi.application'
 
 # Database
+# Persistent connections are reused across requests (CONN_MAX_AGE) and health-checked before reuse.
 DATABASES = {
-    "default": dj_database_url.config(default=os.getenv("DATABASE_URL"))
+    "default": dj_database_url.config(default=os.getenv("DATABASE_URL"), conn_max_age=600, conn_health_checks=True)
+}
+
+# Read replicas, e.g. DATABASE_REPLICA_URLS="postgres://...replica1,postgres://...replica2"
+for index, replica_url in enumerate(filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(",")), start=1):
+    DATABASES[f"replica_{index}"] = dj_database_url.parse(replica_url, conn_max_age=600, conn_health_checks=True)
+
+# Shards holding program data, e.g. DATABASE_SHARD_URLS="shard_1=postgres://...,shard_2=postgres://..."
+for shard in filter(None, os.getenv("DATABASE_SHARD_URLS", "").split(",")):
+    shard_alias, shard_url = shard.split("=", 1)
+    DATABASES[shard_alias.strip()] = dj_database_url.parse(shard_url.strip(), conn_max_age=600, conn_health_checks=True)
+
+DATABASE_ROUTERS = ['loyalty.db_routers.ProgramShardRouter', 'loyalty.db_routers.PrimaryReplicaRouter']
+LOYALTY_READ_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica_")]
+LOYALTY_PRIMARY_STICKINESS_SECONDS = int(os.getenv("PRIMARY_STICKINESS_SECONDS", 5))
+LOYALTY_PRIMARY_STICKINESS_CACHE = 'default'  # Pins of API clients; must be shared by all workers (Redis)
+LOYALTY_SHARDS = ["default", *(alias for alias in DATABASES if alias.startswith("shard_"))]
+LOYALTY_SHARD_DIRECTORY_TTL = int(os.getenv("SHARD_DIRECTORY_TTL", 5))
+
+# Liability totals: rows per program that balance writes are spread over (see loyalty.models.ProgramAggregate)
+LOYALTY_AGGREGATE_SLOTS = 16
+
+# Caching
+# Program configuration (tiers, special tasks) is cached per program and config version.
+# Primary stickiness pins and throttle buckets must be seen by every worker, so production caches in Redis (REDIS_URL);
+# `manage.py check --deploy` reports a cache that must be shared but is per process (loyalty/checks.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    }
+}
+LOYALTY_CONFIG_CACHE = 'default'
+LOYALTY_CONFIG_CACHE_TIMEOUT = 3600  # Seconds; entries are also invalidated by version bumps
+
+# N+1 detection and slow-query log (loyalty/query_inspection.py), reported on the `loyalty.queries` logger
+LOYALTY_QUERY_INSPECTION = {
+    'ENABLED': os.getenv("QUERY_INSPECTION_ENABLED") == "1",
+    'REPEAT_THRESHOLD': 3,  # Same-shape queries per request reported as a possible N+1
+    'SLOW_QUERY_MS': 100,  # Queries slower than this are logged with their stack
+}
+
+# Prometheus metrics (loyalty/metrics.py). Multi-worker deployments also set PROMETHEUS_MULTIPROC_DIR.
+LOYALTY_METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # Bearer token required by /metrics when set
+
+# Request profiling (loyalty/profiling.py); read the results with `manage.py profile_report`
+LOYALTY_PROFILING = {
+    'ENABLED': os.getenv("PROFILING_ENABLED") == "1",
+    'SAMPLE_RATE': float(os.getenv("PROFILING_SAMPLE_RATE", 0.01)),  # Fraction of requests run under cProfile
+    'SLOW_REQUEST_MS': int(os.getenv("PROFILING_SLOW_REQUEST_MS", 500)),  # Profile the view again when this slow
+    'DIRECTORY': os.getenv("PROFILING_DIRECTORY", str(BASE_DIR.parent / "profiles")),
+    'MAX_PROFILES': int(os.getenv("PROFILING_MAX_PROFILES", 200)),  # Oldest profiles are deleted beyond this
 }
 
+# Token-bucket throttling of /api/points/ (see loyalty/throttling.py): `rate` is the sustained refill
+# rate, `burst` the bucket size. Buckets live in LOYALTY_THROTTLE_CACHE, which must be shared between
+# workers: Redis here, verified by `manage.py check --deploy`.
+LOYALTY_THROTTLE_CACHE = 'default'
+LOYALTY_THROTTLE_RATES = {
+    'program': {'rate': os.getenv("PROGRAM_THROTTLE_RATE", "50/s"), 'burst': int(os.getenv("PROGRAM_THROTTLE_BURST", 100))},
+    'client': {'rate': os.getenv("CLIENT_THROTTLE_RATE", "20/s"), 'burst': int(os.getenv("CLIENT_THROTTLE_BURST", 40))},
+}
+
+# Program API keys (loyalty/api_keys.py): HMAC secret (SECRET_KEY when unset; changing it invalidates every key)
+# and how often each process re-reads the list of revoked keys, in seconds
+LOYALTY_API_KEY_SECRET = get_secret('API_KEY_SECRET')
+LOYALTY_API_KEY_REVOCATION_TTL = int(os.getenv("API_KEY_REVOCATION_TTL", 30))
+
+# Cold storage for archived transactions (see loyalty/archive.py and `manage.py archive_transactions`)
+LOYALTY_ARCHIVE_ROOT = os.getenv("TRANSACTION_ARCHIVE_ROOT", str(BASE_DIR.parent / "archive"))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -122,7 +198,16 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'loyalty.renderers.ORJSONRenderer',  # orjson-backed, same output as JSONRenderer
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'loyalty.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # Internationalization
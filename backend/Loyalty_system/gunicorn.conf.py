@@ -0,0 +1,23 @@
+"""
+gunicorn settings picked up automatically from the working directory.
+
+When PROMETHEUS_MULTIPROC_DIR is set, every worker writes its metrics to files in that directory
+(see loyalty/metrics.py). The directory is emptied when the master starts, and a dead worker's
+live gauges are removed so /metrics only reports running processes.
+"""
+import os
+import shutil
+
+multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def on_starting(server):
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if multiproc_dir:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -4,5 +4,6 @@ from .models import LoyaltyTier
 @admin.register(LoyaltyTier)
 class LoyaltyTierAdmin(admin.ModelAdmin):
     list_display = ('tier_name', 'program', 'points_to_reach')
+    list_select_related = ('program__owner',)  # LoyaltyProgram.__str__ shows the owner's username
     list_filter = ('program',)
     search_fields = ('tier_name',)
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Program-scoped API keys for server-to-server integrations.
+
+A key is `lpk_<claims>.<signature>`: base64url JSON claims (key id, program id, owner id, scopes,
+expiry) signed with an HMAC of settings.LOYALTY_API_KEY_SECRET (SECRET_KEY by default). Verifying a
+key is pure computation: the claims carry everything a request needs, so hot integration traffic
+costs no authentication query. Revoked keys are rejected through a small in-memory list of revoked
+key ids, refreshed from ProgramApiKey every LOYALTY_API_KEY_REVOCATION_TTL seconds (30 by default).
+
+Viewsets opt in with ProgramApiKeyMixin; a key only reaches its own program and only with its scopes
+('<resource>:read' for safe methods, '<resource>:write' otherwise).
+"""
+import base64
+import json
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.timezone import now
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+
+KEY_PREFIX = 'lpk_'
+RESOURCES = ('balances', 'points', 'transactions', 'tasks', 'tiers')
+SCOPES = tuple(f"{resource}:{access}" for resource in RESOURCES for access in ('read', 'write'))
+
+_revoked = {'ids': frozenset(), 'expires_at': 0.0}
+_revoked_lock = threading.Lock()
+
+
+class ApiKeyClaims:
+    """ What a verified key says about the request: its key, program, the program's owner and scopes """
+
+    def __init__(self, key_id, program_id, owner_id, scopes, expires_at=None):
+        self.key_id = key_id
+        self.program_id = program_id
+        self.owner_id = owner_id
+        self.scopes = frozenset(scopes)
+        self.expires_at = expires_at  # Unix time, or None
+
+    def as_dict(self):
+        return {'kid': self.key_id, 'pid': self.program_id, 'uid': self.owner_id, 'scp': sorted(self.scopes),
+                'exp': self.expires_at}
+
+
+def api_key_secret():
+    return getattr(settings, 'LOYALTY_API_KEY_SECRET', None) or settings.SECRET_KEY
+
+
+def revocation_ttl():
+    return getattr(settings, 'LOYALTY_API_KEY_REVOCATION_TTL', 30)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(encoded_claims):
+    return _b64encode(salted_hmac('loyalty.api_keys', encoded_claims, secret=api_key_secret(),
+                                  algorithm='sha256').digest())
+
+
+def sign_claims(claims):
+    """ The key string for `claims` """
+    encoded = _b64encode(json.dumps(claims.as_dict(), separators=(',', ':')).encode())
+    return f"{KEY_PREFIX}{encoded}.{_signature(encoded)}"
+
+
+def verify_key(key):
+    """ Claims of a valid, unexpired and unrevoked key; raises AuthenticationFailed otherwise. No queries when warm. """
+    if not key.startswith(KEY_PREFIX) or key.count('.') != 1:
+        raise exceptions.AuthenticationFailed('Malformed API key.')
+    encoded, signature = key[len(KEY_PREFIX):].split('.')
+    if not constant_time_compare(signature, _signature(encoded)):
+        raise exceptions.AuthenticationFailed('Invalid API key.')
+    try:
+        data = json.loads(_b64decode(encoded))
+        claims = ApiKeyClaims(data['kid'], data['pid'], data['uid'], data['scp'], data.get('exp'))
+    except (ValueError, KeyError, TypeError):
+        raise exceptions.AuthenticationFailed('Malformed API key.')
+
+    if claims.expires_at is not None and claims.expires_at <= time.time():
+        raise exceptions.AuthenticationFailed('API key expired.')
+    if claims.key_id in revoked_key_ids():
+        raise exceptions.AuthenticationFailed('API key revoked.')
+    return claims
+
+
+def revoked_key_ids():
+    """ Ids of revoked keys that haven't expired yet, re-read at most every revocation_ttl() seconds """
+    if _revoked['expires_at'] > time.monotonic():
+        return _revoked['ids']
+    with _revoked_lock:
+        if _revoked['expires_at'] <= time.monotonic():
+            from .models import ProgramApiKey
+            ids = ProgramApiKey.objects.filter(revoked_at__isnull=False).filter(
+                Q(expires_at__isnull=True) | Q(expires_at__gt=now())).values_list('key_id', flat=True)
+            _revoked['ids'] = frozenset(ids)
+            _revoked['expires_at'] = time.monotonic() + revocation_ttl()
+    return _revoked['ids']
+
+
+def forget_revocations():
+    """ Re-read the revocation list on the next verification """
+    _revoked['expires_at'] = 0.0
+
+
+def issue_api_key(program, scopes, name='', expires_at=None):
+    """ Create a key for `program`; returns (ProgramApiKey, key string). The key string is never stored. """
+    from .models import ProgramApiKey
+    api_key = ProgramApiKey.objects.create(key_id=secrets.token_hex(8), program=program, name=name,
+                                           scopes=sorted(set(scopes)), expires_at=expires_at)
+    claims = ApiKeyClaims(api_key.key_id, program.id, program.owner_id, api_key.scopes,
+                          int(expires_at.timestamp()) if expires_at else None)
+    return api_key, sign_claims(claims)
+
+
+def revoke_api_key(api_key):
+    """ Revoke a key; this process stops accepting it at once, the others within revocation_ttl() seconds """
+    api_key.revoked_at = now()
+    api_key.save(update_fields=['revoked_at'])
+    with _revoked_lock:
+        _revoked['ids'] = _revoked['ids'] | {api_key.key_id}
+
+
+class ProgramApiKeyAuthentication(BaseAuthentication):
+    """
+    `Authorization: Api-Key lpk_...`. The request runs as the program's owner (an unsaved User
+    carrying only the id, enough for ownership checks) with the verified claims as `request.auth`.
+    """
+    keyword = 'Api-Key'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid API key header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Malformed API key.')
+
+        claims = verify_key(key)
+        owner = get_user_model()(id=claims.owner_id)
+        owner._state.adding = False
+        return owner, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+class HasApiKeyScope(BasePermission):
+    """
+    Limits API key requests to the key's program and scopes; other requests pass through.
+    Requests that name no program (listings across programs, bulk lookups) are refused for keys;
+    detail routes are checked against the object's program.
+    """
+    message = 'This API key does not grant access to this resource.'
+
+    def has_permission(self, request, view):
+        claims = request.auth
+        if not isinstance(claims, ApiKeyClaims):
+            return True
+        access = 'read' if request.method in SAFE_METHODS else 'write'
+        if f"{view.api_key_resource}:{access}" not in claims.scopes:
+            return False
+        data = request.data if isinstance(request.data, dict) else {}
+        program_ids = {str(program_id) for program_id in (request.query_params.get('program_id'),
+                       data.get('program_id'), data.get('program'), view.get_shard_program_id(request))
+                       if program_id not in (None, '')}
+        if program_ids:
+            return program_ids == {str(claims.program_id)}  # Every program the request names must be the key's
+        return bool(getattr(view, 'detail', False))
+
+    def has_object_permission(self, request, view, obj):
+        claims = request.auth
+        if not isinstance(claims, ApiKeyClaims):
+            return True
+        program_id = obj.task.program_id if hasattr(obj, 'task') else obj.program_id
+        return program_id == claims.program_id
+
+
+class ProgramApiKeyMixin:
+    """
+    Accept program API keys on a viewset, next to the default authentication classes.
+    `api_key_resource` is the resource part of the scopes the viewset requires.
+    """
+    api_key_resource = None
+
+    def get_authenticators(self):
+        return [*super().get_authenticators(), ProgramApiKeyAuthentication()]
+
+    def get_permissions(self):
+        return [*super().get_permissions(), HasApiKeyScope()]
@@ -5,4 +5,4 @@ class LoyaltyConfig(AppConfig):
     name = "loyalty"  #  Ensure this matches your actual app name
 
     def ready(self):
-        from . import signals
\ No newline at end of file
+        from . import checks, signals  # Registers the signal handlers and system checks
\ No newline at end of file
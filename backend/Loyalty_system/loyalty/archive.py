@@ -0,0 +1,252 @@
+"""
+Cold storage for old ledger rows.
+
+`archive_transactions()` moves transactions older than a cutoff out of the `loyalty_transaction`
+table into gzip-compressed NDJSON files under settings.LOYALTY_ARCHIVE_ROOT, one file per program
+and calendar month per run. Rows are stored exactly as the transaction history API returns them.
+
+Each file is registered in TransactionArchive in the same DB transaction that deletes its rows and
+adds the archived totals to BalanceCheckpoint, so an interrupted run leaves the rows in the table and
+at most an unregistered file on disk, which readers ignore.
+"""
+import gzip
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, time, timezone as dt_timezone
+from pathlib import Path
+
+import orjson
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .fast_serializers import datetime_formatter, serialize_transactions
+from .models import BalanceCheckpoint, LoyaltyProgram, TaskProgressJob, Transaction, TransactionArchive
+from .partitions import add_months, month_bound, month_start
+from .sharding import directory_entry, shard_aliases, update_program, use_shard
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'transaction_type', 'points', 'timestamp', 'program_id')
+
+
+def archive_root():
+    return Path(settings.LOYALTY_ARCHIVE_ROOT)
+
+
+def parse_bound(value):
+    """
+    Parse a `start_date` / `end_date` query parameter the way the ORM filter reads it:
+    a datetime, or a date meaning midnight in the current timezone. Returns None if unparseable.
+    """
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def archive_transactions(before, program_ids=None, chunk_size=5000):
+    """
+    Archive every transaction with a timestamp before `before`, shard by shard.
+    Programs in the middle of a shard move are skipped until the next run.
+    Returns {program_id: archived row count}.
+    """
+    archived = {}
+    for alias in shard_aliases():
+        candidates = Transaction.objects.using(alias).filter(timestamp__lt=before)
+        if program_ids:
+            candidates = candidates.filter(program_id__in=program_ids)
+        for program_id in candidates.order_by().values_list('program_id', flat=True).distinct():
+            if directory_entry(program_id) != (alias, 'active'):
+                continue
+            with use_shard(alias):
+                archived[program_id] = archive_program(program_id, before, chunk_size)
+    return archived
+
+
+def archive_program(program_id, before, chunk_size=5000):
+    """ Archive a program's transactions older than `before`, oldest month first """
+    total = 0
+    while True:
+        oldest = Transaction.objects.filter(
+            program_id=program_id, timestamp__lt=before
+        ).order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            return total
+        month = month_start(oldest.astimezone(dt_timezone.utc))
+        total += archive_month(program_id, month, min(month_bound(add_months(month, 1)), before), chunk_size)
+
+
+def archive_month(program_id, month, upper, chunk_size=5000):
+    """
+    Move one program's transactions before `upper` (all within `month`) into a new archive file.
+    Runs on the program's shard (see `archive_transactions()`).
+    """
+    relative_path = Path(f"program_{program_id}") / f"{month:%Y-%m}-{uuid.uuid4().hex[:12]}.ndjson.gz"
+    path = archive_root() / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    alias = router.db_for_write(Transaction)
+    rows = Transaction.objects.using(alias).filter(program_id=program_id, timestamp__lt=upper)
+    to_datetime = datetime_formatter()
+    totals = defaultdict(lambda: [0, 0, 0])  # user_id -> [earned, redeemed, count]
+    count, first, last = 0, None, None
+
+    try:
+        with transaction.atomic(using=alias):
+            # Serializes archivers of the same program and keeps the cutoff consistent (the shard's mirror row)
+            LoyaltyProgram.objects.using(alias).select_for_update().filter(id=program_id).values_list('id').first()
+
+            with gzip.open(path, 'wb') as archive_file:
+                for id, user_id, transaction_type, points, timestamp, program in rows.order_by(
+                        'timestamp', 'id').values_list(*ARCHIVE_COLUMNS).iterator(chunk_size=chunk_size):
+                    archive_file.write(orjson.dumps({
+                        'id': id,
+                        'user_id': user_id,
+                        'transaction_type': transaction_type,
+                        'points': points,
+                        'timestamp': to_datetime(timestamp),
+                        'program': program,
+                    }) + b'\n')
+                    member = totals[user_id]
+                    member[0 if transaction_type == 'earn' else 1] += points
+                    member[2] += 1
+                    count += 1
+                    first = first or timestamp
+                    last = timestamp
+
+            if not count:
+                path.unlink()
+                return 0
+
+            # Raw delete: the ORM would load every row to cascade to TaskProgressJob, done explicitly here
+            TaskProgressJob.objects.using(alias).filter(transaction_id__in=rows.values('id')).delete()
+            qn = connections[alias].ops.quote_name
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {qn(Transaction._meta.db_table)} WHERE program_id = %s AND {qn('timestamp')} < %s",
+                    [program_id, upper],
+                )
+                if cursor.rowcount != count:
+                    raise RuntimeError(f"Archived {count} transactions of program {program_id} "
+                                       f"but {cursor.rowcount} matched the delete; aborting.")
+
+            add_to_checkpoints(program_id, totals, upper, chunk_size)
+            TransactionArchive.objects.using(alias).create(
+                program_id=program_id, month=month, path=str(relative_path),
+                row_count=count, first_timestamp=first, last_timestamp=last,
+            )
+            update_program(program_id, archived_before=upper)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+    logger.info("Archived %s transactions of program %s to %s", count, program_id, relative_path)
+    return count
+
+
+def add_to_checkpoints(program_id, totals, archived_before, chunk_size=5000):
+    """ Add archived per-member totals to the program's balance checkpoints """
+    user_ids = list(totals)
+    for offset in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[offset:offset + chunk_size]
+        existing = {
+            checkpoint.user_id: checkpoint
+            for checkpoint in BalanceCheckpoint.objects.filter(program_id=program_id, user_id__in=chunk)
+        }
+        created = []
+        for user_id in chunk:
+            earned, redeemed, count = totals[user_id]
+            checkpoint = existing.get(user_id)
+            if checkpoint is None:
+                created.append(BalanceCheckpoint(
+                    user_id=user_id, program_id=program_id, points_earned=earned, points_redeemed=redeemed,
+                    transaction_count=count, archived_before=archived_before,
+                ))
+                continue
+            checkpoint.points_earned += earned
+            checkpoint.points_redeemed += redeemed
+            checkpoint.transaction_count += count
+            checkpoint.archived_before = archived_before
+        BalanceCheckpoint.objects.bulk_create(created)
+        BalanceCheckpoint.objects.bulk_update(
+            existing.values(), ['points_earned', 'points_redeemed', 'transaction_count', 'archived_before'],
+        )
+
+
+def archive_files(program_id, start=None, end=None):
+    """ Manifest entries of a program's files overlapping the inclusive range, in reading order """
+    archives = TransactionArchive.objects.filter(program_id=program_id).order_by('first_timestamp', 'id')
+    if start is not None:
+        archives = archives.filter(last_timestamp__gte=start)
+    if end is not None:
+        archives = archives.filter(first_timestamp__lte=end)
+    return archives
+
+
+def read_archive_file(archive, user_id=None, start=None, end=None):
+    """ Stream the rows of one archive file matching the filters, without loading the file """
+    with gzip.open(archive_root() / archive.path, 'rb') as archive_file:
+        for line in archive_file:
+            row = orjson.loads(line)
+            if user_id is not None and row['user_id'] != user_id:
+                continue
+            if start is not None or end is not None:
+                timestamp = datetime.fromisoformat(row['timestamp'])
+                if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                    continue
+            yield row
+
+
+def read_archived_transactions(program_id, user_id=None, start=None, end=None):
+    """
+    Archived transaction rows of a program, oldest first, shaped like the history API response.
+    `start` and `end` are inclusive bounds; only files overlapping the range are opened.
+    Reads everything matching: the API pages through ArchiveReadThrough instead.
+    """
+    return [row for archive in archive_files(program_id, start, end)
+            for row in read_archive_file(archive, user_id, start, end)]
+
+
+class ArchiveReadThrough:
+    """
+    A program's archived rows followed by its live rows (`live`, a Transaction queryset), as one
+    sliceable sequence for the paginator. A slice only opens the files its rows come from, in
+    manifest order, and skips whole files by their row_count when every row of a file matches
+    (no user_id filter, file inside the range); live rows are sliced in the database.
+    """
+
+    def __init__(self, program_id, live, user_id=None, start=None, end=None):
+        self.program_id = program_id
+        self.live = live.order_by('timestamp', 'id')
+        self.user_id = user_id
+        self.start = start
+        self.end = end
+
+    def __getitem__(self, index):
+        offset, stop = index.start or 0, index.stop
+        rows = []
+        matched = 0  # Matching archived rows before the current position
+        for archive in archive_files(self.program_id, self.start, self.end):
+            exact = self.user_id is None and (self.start is None or archive.first_timestamp >= self.start) and (
+                self.end is None or archive.last_timestamp <= self.end)
+            if exact and matched + archive.row_count <= offset:
+                matched += archive.row_count
+                continue
+            for row in read_archive_file(archive, self.user_id, self.start, self.end):
+                if matched >= offset:
+                    rows.append(row)
+                    if offset + len(rows) == stop:
+                        return rows
+                matched += 1
+
+        live_offset = max(0, offset - matched)  # The archive is exhausted: continue with live rows
+        return rows + serialize_transactions(self.live[live_offset:live_offset + stop - offset - len(rows)])
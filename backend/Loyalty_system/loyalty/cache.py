@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .metrics import CONFIG_CACHE_REQUESTS
+from .models import LoyaltyProgram
+from .sharding import is_sharded, update_program
+
+
+def config_cache():
+    """ Cache backend for program configuration (any alias from settings.CACHES) """
+    return caches[getattr(settings, 'LOYALTY_CONFIG_CACHE', 'default')]
+
+
+def config_cache_timeout():
+    return getattr(settings, 'LOYALTY_CONFIG_CACHE_TIMEOUT', 3600)
+
+
+def response_key(resource, program_id):
+    return f"loyalty:config:{resource}:{program_id}"
+
+
+def get_program_config(resource, program_id):
+    """
+    Return `(version, data)` for a program configuration endpoint.
+    The version is read from the database (one primary-key lookup), so every worker agrees on it whether
+    or not the cache is shared; `data` is the cached response for that version, or None.
+    `version` is None if the program doesn't exist.
+    """
+    version = get_program_config_version(program_id)
+    if version is None:
+        return None, None
+
+    cached = config_cache().get(response_key(resource, program_id))
+    if cached is not None and cached[0] == version:
+        CONFIG_CACHE_REQUESTS.labels(resource, 'hit').inc()
+        return version, cached[1]
+    CONFIG_CACHE_REQUESTS.labels(resource, 'miss').inc()
+    return version, None
+
+
+def get_program_config_version(program_id):
+    """ Current config version of a program (None if it doesn't exist), read from the database """
+    return LoyaltyProgram.objects.filter(id=program_id).values_list('config_version', flat=True).first()
+
+
+def owner_key(program_id):
+    return f"loyalty:owner:{program_id}"
+
+
+def get_program_owner_id(program_id):
+    """
+    Owner of a program (None if it doesn't exist). Owners never change, so the answer is cached
+    without a version; unknown programs are not cached, as they may still be created.
+    """
+    owner_id = config_cache().get(owner_key(program_id))
+    if owner_id is None:
+        owner_id = LoyaltyProgram.objects.filter(id=program_id).values_list('owner_id', flat=True).first()
+        if owner_id is not None:
+            config_cache().set(owner_key(program_id), owner_id, config_cache_timeout())
+    return owner_id
+
+
+def cache_program_config(resource, program_id, version, data):
+    """ Store a rendered configuration list together with the version it was built from """
+    config_cache().set(response_key(resource, program_id), (version, data), config_cache_timeout())
+
+
+def bump_program_config_version(program_id):
+    """ Increment the program's config version; cached responses for older versions stop matching """
+    if is_sharded():
+        update_program(program_id, config_version=F('config_version') + 1)  # Shard mirrors carry it too
+    else:
+        LoyaltyProgram.objects.filter(id=program_id).update(config_version=F('config_version') + 1)
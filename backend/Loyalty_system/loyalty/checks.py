@@ -0,0 +1,39 @@
+"""
+Deployment check for caches that every worker process must share.
+
+Primary stickiness pins (and throttle buckets) only work when all gunicorn workers read and
+write the same entries; a per-process backend such as LocMemCache silently splits them.
+`manage.py check --deploy` reports an error when one of these settings names a per-process
+cache alias.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_settings():
+    """ {setting naming a cache alias: whether the feature using it is enabled} """
+    return {
+        'LOYALTY_PRIMARY_STICKINESS_CACHE': bool(getattr(settings, 'LOYALTY_READ_REPLICAS', [])),
+        'LOYALTY_THROTTLE_CACHE': bool(getattr(settings, 'LOYALTY_THROTTLE_RATES', {})),
+    }
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs=None, **kwargs):
+    """ An error for every enabled cache that must be shared but is private to each process """
+    errors = []
+    for name, enabled in shared_cache_settings().items():
+        alias = getattr(settings, name, 'default')
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if enabled and backend in PROCESS_LOCAL_BACKENDS:
+            errors.append(Error(
+                f"{name} names the cache '{alias}' ({backend}), which each worker process keeps to itself.",
+                hint="Point it at a shared backend such as Redis (see CACHES).",
+                id='loyalty.E001',
+            ))
+    return errors
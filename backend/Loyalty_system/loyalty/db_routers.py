@@ -0,0 +1,130 @@
+import hashlib
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .sharding import current_shard, is_shard_local, is_sharded, shard_for_program
+
+_use_primary = ContextVar('loyalty_use_primary', default=False)
+
+
+def read_replicas():
+    """ Aliases from settings.DATABASES that serve reads (empty list = everything on 'default') """
+    return getattr(settings, 'LOYALTY_READ_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to a random replica and writes to 'default'.
+    Reads stay on the primary while the current request is pinned (see PrimaryStickinessMiddleware)
+    or while a transaction is open on 'default', so a request always sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = read_replicas()
+        if not replicas or _use_primary.get() or connections['default'].in_atomic_block:
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in read_replicas() else None
+
+
+class ProgramShardRouter:
+    """
+    Places shard-local models (see loyalty/sharding.py) on their program's shard: the database an instance
+    came from, the shard of a program passed as instance hint, or the shard selected for the current
+    request or job. Everything else, and everything on 'default', is left to the next router.
+    """
+
+    def db_for_shard_local(self, model, instance=None):
+        if not is_sharded() or not is_shard_local(model):
+            return None
+        if instance is not None and is_shard_local(type(instance)) and instance._state.db:
+            alias = instance._state.db
+        elif instance is not None and instance._meta.model_name == 'loyaltyprogram' and instance.pk:
+            alias = shard_for_program(instance.pk)
+        else:
+            alias = current_shard()
+        return None if alias == 'default' else alias
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_shard_local(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_shard_local(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_shard_local(type(obj1)) or is_shard_local(type(obj2)):
+            return True  # Programs and their owners are mirrored onto every shard holding their rows
+        return None
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Read-your-writes for replicas: unsafe requests (POST, PUT, PATCH, DELETE) run on the primary,
+    and the client stays pinned to it for LOYALTY_PRIMARY_STICKINESS_SECONDS afterwards.
+
+    API clients are recognised by their Authorization header, remembered in LOYALTY_PRIMARY_STICKINESS_CACHE,
+    which must be shared by all workers (enforced by loyalty/checks.py in production);
+    browser sessions get a cookie holding the pin expiry.
+    """
+    cookie_name = 'loyalty_primary_until'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not read_replicas():
+            return self.get_response(request)
+
+        is_write = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        token = _use_primary.set(is_write or self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+
+        if is_write:
+            self.pin(request, response)
+        return response
+
+    @staticmethod
+    def window():
+        return getattr(settings, 'LOYALTY_PRIMARY_STICKINESS_SECONDS', 5)
+
+    @staticmethod
+    def pin_cache():
+        return caches[getattr(settings, 'LOYALTY_PRIMARY_STICKINESS_CACHE', 'default')]
+
+    @staticmethod
+    def client_key(request):
+        authorization = request.headers.get('Authorization')
+        if not authorization:
+            return None
+        return 'loyalty:primary-pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+
+    def is_pinned(self, request):
+        pinned_until = request.COOKIES.get(self.cookie_name, '')
+        if pinned_until.isdigit() and int(pinned_until) > time.time():
+            return True
+        key = self.client_key(request)
+        return key is not None and self.pin_cache().get(key) is not None
+
+    def pin(self, request, response):
+        window = self.window()
+        key = self.client_key(request)
+        if key is not None:
+            self.pin_cache().set(key, 1, window)
+        response.set_cookie(self.cookie_name, str(int(time.time() + window)), max_age=window,
+                            httponly=True, samesite='Lax')
@@ -0,0 +1,90 @@
+"""
+API documentation: Swagger UI and the OpenAPI document it loads.
+
+drf_yasg is only imported when a docs route is hit or the document is generated, so workers don't
+load it at startup. The document is built once, either by `manage.py generate_openapi` at deploy time
+(written to settings.LOYALTY_OPENAPI_SCHEMA_PATH) or on the first request. After that it is served
+from memory with an ETag.
+"""
+import hashlib
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+API_INFO = {
+    'title': "Loyalty System API",
+    'default_version': 'v1',
+    'description': "API documentation for the Loyalty System project",
+    'terms_of_service': "https://www.example.com/terms/",
+    'contact_email': "support@example.com",
+    'license_name': "BSD License",
+}
+
+_lock = threading.Lock()
+_document = None  # (JSON bytes, ETag) once loaded
+
+
+def schema_path():
+    path = getattr(settings, 'LOYALTY_OPENAPI_SCHEMA_PATH', None)
+    return Path(path) if path else None
+
+
+def build_schema():
+    """ Generate the OpenAPI document as JSON bytes """
+    from drf_yasg import openapi
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    info = openapi.Info(
+        title=API_INFO['title'],
+        default_version=API_INFO['default_version'],
+        description=API_INFO['description'],
+        terms_of_service=API_INFO['terms_of_service'],
+        contact=openapi.Contact(email=API_INFO['contact_email']),
+        license=openapi.License(name=API_INFO['license_name']),
+    )
+    schema = OpenAPISchemaGenerator(info).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def schema_document():
+    """ The OpenAPI document and its ETag; read from the prebuilt file or generated once per process """
+    global _document
+    if _document is None:
+        with _lock:
+            if _document is None:
+                path = schema_path()
+                content = path.read_bytes() if path and path.exists() else build_schema()
+                _document = (content, hashlib.sha256(content).hexdigest()[:32])
+    return _document
+
+
+def reset_schema_document():
+    """ Forget the loaded document (tests, or after regenerating the file) """
+    global _document
+    _document = None
+
+
+@require_safe
+@cache_control(public=True, max_age=3600)
+@condition(etag_func=lambda request: schema_document()[1])
+def openapi_schema(request):
+    """ The OpenAPI document as JSON """
+    return HttpResponse(schema_document()[0], content_type='application/json')
+
+
+@require_safe
+def swagger_ui(request):
+    """ Swagger UI page; the document itself is fetched from `openapi_schema` (SWAGGER_SETTINGS['SPEC_URL']) """
+    from drf_yasg.renderers import SwaggerUIRenderer
+
+    renderer = SwaggerUIRenderer()
+    context = {'request': request}
+    renderer.set_context(context)
+    context.update(title=API_INFO['title'], version=API_INFO['default_version'])
+    return HttpResponse(render_to_string(renderer.template, context, request))
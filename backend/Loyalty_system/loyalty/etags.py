@@ -0,0 +1,62 @@
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_program_config, cache_program_config
+
+
+def make_etag(*parts):
+    """ Build a weak ETag from version counters, e.g. W/"tiers-4-17" """
+    return 'W/"{}"'.format('-'.join(str(part) for part in parts))
+
+
+def etag_matches(request, etag):
+    """ True if the request's If-None-Match header contains the ETag (weak comparison) """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+
+    return opaque(etag) in {opaque(candidate) for candidate in header.split(',')}
+
+
+def not_modified(etag):
+    """ Empty 304 response carrying the current ETag """
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+class ProgramConfigETagMixin:
+    """
+    Adds ETag / If-None-Match support and a versioned response cache to list endpoints
+    filtered by `program_id`. Both are keyed by LoyaltyProgram.config_version, so a cached
+    or unchanged list costs one primary-key lookup (the version) and one cache round trip,
+    and never touches the serializer.
+    """
+    etag_resource = None  # Prefix that keeps ETags and cache entries of different endpoints apart
+
+    def list(self, request, *args, **kwargs):
+        program_id = request.query_params.get('program_id')
+        version = data = None
+        if program_id and program_id.isdigit():
+            version, data = get_program_config(self.etag_resource, program_id)
+        if version is None:
+            return super().list(request, *args, **kwargs)
+
+        etag = make_etag(self.etag_resource, program_id, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        if data is not None:
+            return Response(data, headers={'ETag': etag})
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache_program_config(self.etag_resource, program_id, version, [dict(row) for row in response.data])
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,87 @@
+"""
+Read-only fast paths for high-volume list endpoints.
+
+These build response rows straight from `values_list()` tuples instead of model instances
+and ModelSerializer fields. The output is identical to TransactionSerializer and
+PointBalanceSerializer; keep the field lists in sync when those serializers change.
+"""
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+_datetime_field = serializers.DateTimeField()
+
+
+def datetime_formatter():
+    """
+    Return a function formatting datetimes exactly like serializers.DateTimeField.
+    The timezone is resolved once per list instead of once per row.
+    """
+    output_format = api_settings.DATETIME_FORMAT
+    if output_format is None or output_format.lower() != ISO_8601:
+        return _datetime_field.to_representation
+
+    field_timezone = _datetime_field.default_timezone()
+
+    def to_representation(value):
+        if value is None:
+            return None
+        if field_timezone is not None:
+            if timezone.is_aware(value):
+                value = value.astimezone(field_timezone)
+            else:
+                value = timezone.make_aware(value, field_timezone)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return to_representation
+
+
+def serialize_transactions(queryset):
+    """ Rows shaped like TransactionSerializer(many=True).data """
+    to_datetime = datetime_formatter()
+    return [
+        {
+            'id': id,
+            'user_id': user_id,
+            'transaction_type': transaction_type,
+            'points': points,
+            'timestamp': to_datetime(timestamp),
+            'program': program_id,
+        }
+        for id, user_id, transaction_type, points, timestamp, program_id in queryset.values_list(
+            'id', 'user_id', 'transaction_type', 'points', 'timestamp', 'program_id'
+        )
+    ]
+
+
+def serialize_point_balances(queryset):
+    """ Rows shaped like PointBalanceSerializer(many=True).data; tiers come from with_tier() """
+    return [
+        {
+            'id': id,
+            'user_id': user_id,
+            'balance': balance,
+            'program': program_id,
+            'tier': tier_name,
+        }
+        for id, user_id, balance, program_id, tier_name in queryset.with_tier().values_list(
+            'id', 'user_id', 'balance', 'program_id', 'tier_name'
+        )
+    ]
+
+
+MEMBER_COLUMNS = ('user_id', 'balance', 'total_points_earned', 'tier_name')
+
+
+def serialize_members(rows):
+    """ Rows of the program member listing, from PointBalance values_list(*MEMBER_COLUMNS) """
+    return [
+        {
+            'user_id': user_id,
+            'balance': balance,
+            'total_points_earned': total_points_earned,
+            'tier': tier_name,
+        }
+        for user_id, balance, total_points_earned, tier_name in rows
+    ]
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from loyalty.archive import archive_transactions
+
+
+class Command(BaseCommand):
+    help = ("Moves transactions older than a cutoff into compressed per-program, per-month files under "
+            "LOYALTY_ARCHIVE_ROOT and adds their totals to balance checkpoints.")
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--before', metavar='YYYY-MM-DD', help="Archive transactions older than this date (UTC).")
+        group.add_argument('--older-than-days', type=int, help="Archive transactions older than this many days.")
+        parser.add_argument('--program', type=int, action='append', dest='programs',
+                            help="Only archive this program (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows fetched per round trip.")
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.strptime(options['before'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError("--before must look like YYYY-MM-DD.")
+        else:
+            before = timezone.now() - timedelta(days=options['older_than_days'])
+
+        if before > timezone.now():
+            raise CommandError("The cutoff must not be in the future.")
+
+        archived = archive_transactions(before, program_ids=options['programs'], chunk_size=options['chunk_size'])
+        for program_id, count in archived.items():
+            self.stdout.write(f"Program {program_id}: archived {count} transactions")
+        self.stdout.write(self.style.SUCCESS(f"Archived {sum(archived.values())} transactions before {before:%Y-%m-%d}."))
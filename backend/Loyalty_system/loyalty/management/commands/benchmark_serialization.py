@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from loyalty.fast_serializers import serialize_transactions, serialize_point_balances
+from loyalty.models import LoyaltyProgram, LoyaltyTier, PointBalance, Transaction
+from loyalty.renderers import ORJSONRenderer
+from loyalty.serializers import TransactionSerializer, PointBalanceSerializer
+
+
+class Command(BaseCommand):
+    help = ("Measures rows/second of the ModelSerializer + JSONRenderer path against the values() fast path "
+            "+ ORJSONRenderer. Test rows are created inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Rows per list.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best one is reported).")
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+
+        with transaction.atomic():
+            program = self.create_fixture(rows)
+            transactions = Transaction.objects.filter(program=program)
+            balances = PointBalance.objects.filter(program=program)
+
+            results = [
+                ("transactions / ModelSerializer + JSONRenderer", self.measure(repeat, lambda: JSONRenderer().render(
+                    TransactionSerializer(transactions.all(), many=True).data))),
+                ("transactions / values() + ORJSONRenderer", self.measure(repeat, lambda: ORJSONRenderer().render(
+                    serialize_transactions(transactions.all())))),
+                ("balances / ModelSerializer + JSONRenderer", self.measure(repeat, lambda: JSONRenderer().render(
+                    PointBalanceSerializer(balances.all(), many=True).data))),
+                ("balances / values() + ORJSONRenderer", self.measure(repeat, lambda: ORJSONRenderer().render(
+                    serialize_point_balances(balances.all())))),
+            ]
+            transaction.set_rollback(True)
+
+        for label, seconds in results:
+            self.stdout.write(f"{label:<50} {rows / seconds:>12,.0f} rows/s  ({seconds * 1000:.1f} ms)")
+
+    def create_fixture(self, rows):
+        owner = get_user_model().objects.create_user(username=f"benchmark-{time.time_ns()}")
+        program = LoyaltyProgram.objects.create(name="Benchmark", owner=owner)
+        for name, points in (("Bronze", 100), ("Silver", 1000), ("Gold", 5000)):
+            LoyaltyTier.objects.create(program=program, tier_name=name, points_to_reach=points)
+
+        Transaction.objects.bulk_create(
+            Transaction(user_id=str(i % 1000), program=program, transaction_type="earn", points=random.randint(1, 500))
+            for i in range(rows)
+        )
+        PointBalance.objects.bulk_create(
+            PointBalance(user_id=str(i), program=program, balance=i, total_points_earned=i * 3)
+            for i in range(rows)
+        )
+        return program
+
+    @staticmethod
+    def measure(repeat, func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from loyalty.services import compact_task_buckets
+
+
+class Command(BaseCommand):
+    help = ("Deletes daily task progress buckets that fell out of their task's rolling window. "
+            "Run it daily (e.g. from cron) to keep the bucket table bounded.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Buckets deleted per statement.")
+
+    def handle(self, *args, **options):
+        deleted = compact_task_buckets(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired task bucket(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loyalty.sharding import SHARD_ID_STRIDE, configure_shard_sequences, shard_aliases
+
+
+class Command(BaseCommand):
+    help = ("Interleaves the id sequences of shard-local tables so ids never collide between shards. "
+            "Run it once after adding a shard to LOYALTY_SHARDS (and migrating it).")
+
+    def handle(self, *args, **options):
+        if len(shard_aliases()) > SHARD_ID_STRIDE:
+            raise CommandError(f"At most {SHARD_ID_STRIDE} shards are supported.")
+        for alias, start in configure_shard_sequences().items():
+            self.stdout.write(f"{alias}: ids continue at {start} in steps of {SHARD_ID_STRIDE}")
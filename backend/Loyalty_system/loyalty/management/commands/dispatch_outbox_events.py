@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loyalty.outbox import dispatch_outbox_events, purge_delivered_events
+
+
+class Command(BaseCommand):
+    help = "Delivers pending outbox events (tier changes, completed tasks) to merchant webhooks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Events claimed per batch.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Webhooks called in parallel.")
+        parser.add_argument('--timeout', type=float, default=5.0, help="Per-request timeout in seconds.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when no events are due.")
+        parser.add_argument('--retention-days', type=int, default=7,
+                            help="Delivered events older than this are purged on each idle pass.")
+        parser.add_argument('--once', action='store_true', help="Deliver all due events once and exit.")
+
+    def handle(self, *args, **options):
+        total_delivered = total_failed = 0
+
+        while True:
+            delivered, failed = dispatch_outbox_events(
+                batch_size=options['batch_size'],
+                concurrency=options['concurrency'],
+                timeout=options['timeout'],
+            )
+            total_delivered += delivered
+            total_failed += failed
+
+            if delivered or failed:
+                continue  # Keep going while events are due
+            purge_delivered_events(options['retention_days'])
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Delivered {total_delivered} event(s), {total_failed} failed attempt(s)."
+        ))
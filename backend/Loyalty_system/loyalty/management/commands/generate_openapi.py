@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loyalty.docs import build_schema, schema_path
+
+
+class Command(BaseCommand):
+    help = ("Generates the OpenAPI document served at /openapi.json. Run it at build/deploy time so "
+            "web workers never generate the schema themselves.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Where to write the document (default: LOYALTY_OPENAPI_SCHEMA_PATH).")
+
+    def handle(self, *args, **options):
+        path = Path(options['output']) if options['output'] else schema_path()
+        if path is None:
+            raise CommandError("Pass --output or set LOYALTY_OPENAPI_SCHEMA_PATH.")
+
+        content = build_schema()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(content)} bytes to {path}"))
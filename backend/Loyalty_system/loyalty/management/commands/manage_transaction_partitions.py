@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from loyalty.partitions import create_future_partitions, detach_partitions_before, is_partitioned, month_partitions
+from loyalty.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = ("Pre-creates monthly partitions of the transaction table and detaches old months. "
+            "Run it daily (e.g. from cron) so inserts never fall into the default partition.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help="Create partitions from the current month up to this many months ahead.")
+        parser.add_argument('--detach-before', metavar='YYYY-MM',
+                            help="Detach every month partition older than this month.")
+        parser.add_argument('--drop', action='store_true', help="Drop detached partitions instead of keeping them.")
+        parser.add_argument('--list', action='store_true', help="Print the attached month partitions.")
+
+    def handle(self, *args, **options):
+        month = None
+        if options['detach_before']:
+            try:
+                month = datetime.strptime(options['detach_before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--detach-before must look like YYYY-MM.")
+
+        aliases = shard_aliases()
+        for alias in aliases:  # Every shard holds its own partitioned ledger
+            connection = connections[alias]
+            prefix = f"[{alias}] " if len(aliases) > 1 else ""
+            if not is_partitioned(connection):
+                raise CommandError(f"{prefix}loyalty_transaction is not partitioned "
+                                   f"(PostgreSQL with migration 0007 required).")
+
+            for name in create_future_partitions(options['months_ahead'], connection=connection):
+                self.stdout.write(f"{prefix}Created {name}")
+
+            if month is not None:
+                for name in detach_partitions_before(month, drop=options['drop'], connection=connection):
+                    self.stdout.write(f"{prefix}{'Dropped' if options['drop'] else 'Detached'} {name}")
+
+            if options['list']:
+                for partition_month, name in month_partitions(connection):
+                    self.stdout.write(f"{prefix}{partition_month:%Y-%m}  {name}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loyalty.models import LoyaltyProgram
+from loyalty.sharding import move_program, shard_aliases
+
+
+class Command(BaseCommand):
+    help = ("Moves a loyalty program's balances, ledger, tiers and tasks to another shard while it stays online. "
+            "Writes to the program are refused (503) only while the last changes are copied.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('program', type=int, help="Id of the program to move.")
+        parser.add_argument('target', help="Database alias of the target shard (one of LOYALTY_SHARDS).")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows copied per INSERT.")
+
+    def handle(self, *args, **options):
+        if options['target'] not in shard_aliases():
+            raise CommandError(f"{options['target']!r} is not in LOYALTY_SHARDS ({', '.join(shard_aliases())}).")
+        try:
+            alias = move_program(options['program'], options['target'], chunk_size=options['chunk_size'],
+                                 log=self.stdout.write)
+        except LoyaltyProgram.DoesNotExist:
+            raise CommandError(f"Program {options['program']} does not exist.")
+        self.stdout.write(self.style.SUCCESS(f"Program {options['program']} lives on {alias}."))
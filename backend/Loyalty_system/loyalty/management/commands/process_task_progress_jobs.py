@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loyalty.services import process_task_progress_jobs, process_task_rebuild_jobs
+
+
+class Command(BaseCommand):
+    help = "Runs the worker that evaluates queued special task progress jobs and queued task progress rebuilds."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Jobs claimed per batch.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--rebuild-chunk-size', type=int, default=5000,
+                            help="Members per chunk of a queued task progress rebuild.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        while True:
+            processed = process_task_progress_jobs(batch_size=batch_size)
+            total += processed
+            processed += process_task_rebuild_jobs(chunk_size=options['rebuild_chunk_size'])
+
+            if processed:
+                continue  # Keep draining while there is work
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} task progress job(s)."))
@@ -0,0 +1,41 @@
+import pstats
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loyalty.profiling import collected_profiles
+
+
+class Command(BaseCommand):
+    help = ("Aggregates the request profiles collected by ProfilingMiddleware: slowest views, "
+            "then the hottest functions across all (or the selected) profiles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Profile directory (default: LOYALTY_PROFILING['DIRECTORY']).")
+        parser.add_argument('--view', help="Only include profiles of this view name.")
+        parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+                            help="Order of the function table.")
+        parser.add_argument('--limit', type=int, default=25, help="Number of functions to show.")
+
+    def handle(self, *args, **options):
+        profiles = collected_profiles(options['directory'])
+        if options['view']:
+            profiles = [(path, metadata) for path, metadata in profiles if metadata.get('view') == options['view']]
+        if not profiles:
+            raise CommandError("No profiles collected.")
+
+        views = defaultdict(list)
+        for _, metadata in profiles:
+            views[metadata.get('view') or metadata.get('path') or '?'].append(metadata)
+
+        self.stdout.write(f"{len(profiles)} profiles\n")
+        self.stdout.write(f"{'view':<50} {'count':>6} {'avg ms':>10} {'max ms':>10} {'avg queries':>12}")
+        for view, entries in sorted(views.items(), key=lambda item: -sum(e.get('duration_ms', 0) for e in item[1])):
+            durations = [entry.get('duration_ms', 0) for entry in entries]
+            queries = [entry.get('query_count', 0) for entry in entries]
+            self.stdout.write(f"{view:<50} {len(entries):>6} {sum(durations) / len(entries):>10.1f} "
+                              f"{max(durations):>10.1f} {sum(queries) / len(entries):>12.1f}")
+        self.stdout.write("")
+
+        stats = pstats.Stats(*(str(path) for path, _ in profiles), stream=self.stdout)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
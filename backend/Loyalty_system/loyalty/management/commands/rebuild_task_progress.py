@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loyalty.models import SpecialTask
+from loyalty.services import rebuild_task_progress
+from loyalty.sharding import locate
+
+
+class Command(BaseCommand):
+    help = ("Recomputes members' progress on special tasks from the transaction history, e.g. after a task was "
+            "created or its conditions changed. Works in chunks of members, so it is safe on large programs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tasks', nargs='+', type=int, help="IDs of the special tasks to rebuild.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Members per GROUP BY and upsert.")
+
+    def handle(self, *args, **options):
+        for task_id in options['tasks']:
+            alias, _ = locate(SpecialTask, task_id)
+            if alias is None:
+                raise CommandError(f"Special task {task_id} does not exist.")
+            task = SpecialTask.objects.using(alias).get(id=task_id)
+
+            members, completed = rebuild_task_progress(task, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Task {task_id}: rebuilt progress of {members} member(s), {completed} newly completed."))
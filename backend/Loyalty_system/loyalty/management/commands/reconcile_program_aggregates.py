@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from loyalty.models import PointBalance, ProgramAggregate
+from loyalty.services import reconcile_program_aggregate
+from loyalty.sharding import directory_entry, shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the per-program liability totals from the point balances and reports any drift. "
+            "Safe to run while the API is serving; run it after bulk imports or queryset deletes of balances.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--program', type=int, action='append', dest='programs',
+                            help="Only reconcile this program (repeatable).")
+
+    def handle(self, *args, **options):
+        checked = corrected = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                program_ids = set(PointBalance.objects.order_by().values_list('program_id', flat=True).distinct())
+                program_ids |= set(ProgramAggregate.objects.order_by().values_list('program_id', flat=True).distinct())
+                if options['programs']:
+                    program_ids &= set(options['programs'])
+
+                for program_id in sorted(program_ids):
+                    if directory_entry(program_id) != (alias, 'active'):
+                        continue  # Left behind by or in the middle of a shard move
+                    checked += 1
+                    drift = reconcile_program_aggregate(program_id)
+                    if drift:
+                        corrected += 1
+                        details = ', '.join(f"{field} off by {delta:+d}" for field, delta in drift.items())
+                        self.stdout.write(self.style.WARNING(f"Program {program_id}: {details}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {checked} program(s), corrected {corrected}."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from loyalty.services import compact_tier_buckets, requalify_tiers
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the rolling-window qualifying points and tiers of members of programs with "
+            "`tier_window_months`, then deletes expired monthly buckets. Schedule it daily or monthly, "
+            "e.g. right after midnight UTC on the first of the month.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--program', type=int, action='append', dest='programs',
+                            help="Only requalify this program (repeatable).")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Members per locked batch.")
+
+    def handle(self, *args, **options):
+        changed, tier_changes = requalify_tiers(options['programs'], chunk_size=options['chunk_size'])
+        deleted = compact_tier_buckets()
+        self.stdout.write(self.style.SUCCESS(
+            f"Requalified {changed} member(s), {tier_changes} tier change(s); deleted {deleted} expired bucket(s)."))
@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier
+from loyalty.stress import prepare_members, run_balance_stress
+
+
+class Command(BaseCommand):
+    help = ("Hammers a throwaway program with concurrent earns, redeems and transactions from threads or "
+            "processes, checks the balance invariants and reports operations/second. The program and its "
+            "owner are deleted afterwards unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="Concurrent workers.")
+        parser.add_argument('--operations', type=int, default=200, help="Operations per worker.")
+        parser.add_argument('--members', type=int, default=10,
+                            help="Members the operations are spread over; fewer means more contention.")
+        parser.add_argument('--processes', action='store_true', help="Fork processes instead of starting threads.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Keep the program for inspection.")
+
+    def handle(self, *args, **options):
+        owner = get_user_model().objects.create_user(username=f"stress-{time.time_ns()}")
+        program = LoyaltyProgram.objects.create(name="Stress test", owner=owner, tier_window_months=12)
+        for name, points in (("Silver", 500), ("Gold", 2500)):
+            LoyaltyTier.objects.create(program=program, tier_name=name, points_to_reach=points)
+        user_ids = [f"stress-{number}" for number in range(options['members'])]
+        prepare_members(program, user_ids)
+
+        try:
+            report = run_balance_stress(program, user_ids, workers=options['workers'],
+                                        operations=options['operations'], processes=options['processes'],
+                                        seed=options['seed'])
+        finally:
+            if not options['keep']:
+                program.delete()
+                owner.delete()
+
+        for error in report.errors[:20]:
+            self.stdout.write(self.style.WARNING(f"Error: {error}"))
+        for violation in report.violations[:20]:
+            self.stdout.write(self.style.ERROR(f"Violation: {violation}"))
+        mode = "process(es)" if options['processes'] else "thread(s)"
+        summary = f"{options['workers']} {mode}: {report}."
+        if not report.ok:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,142 @@
+"""
+Prometheus metrics, exposed at /metrics.
+
+- loyalty_http_request_duration_seconds     per route (URL name), method and status
+- loyalty_service_duration_seconds          earn_points, redeem_points, update_task_progress, balance_signal
+- loyalty_db_query_duration_seconds         every SQL query per DB alias (the _count series is the query count)
+- loyalty_config_cache_requests_total       program config cache lookups by result (hit / miss)
+- loyalty_queue_depth                       task progress jobs and outbox events by status, read at scrape time
+
+With several worker processes (gunicorn), set PROMETHEUS_MULTIPROC_DIR to an empty, writable directory
+before the workers start: prometheus_client then keeps values in per-process files and /metrics merges
+them. gunicorn.conf.py cleans the directory up. Recording a value is a label lookup plus a locked add
+(an mmap write in multiprocess mode), so instrumentation costs microseconds per request.
+"""
+import os
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+REQUEST_LATENCY = Histogram(
+    'loyalty_http_request_duration_seconds', "HTTP request latency by route.",
+    ['route', 'method', 'status'],
+)
+SERVICE_LATENCY = Histogram(
+    'loyalty_service_duration_seconds', "Latency of service-layer operations.",
+    ['operation'],
+)
+DB_QUERY_LATENCY = Histogram(
+    'loyalty_db_query_duration_seconds', "SQL query latency by database alias.",
+    ['alias'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, float('inf')),
+)
+CONFIG_CACHE_REQUESTS = Counter(
+    'loyalty_config_cache_requests_total', "Program configuration cache lookups.",
+    ['resource', 'result'],
+)
+
+
+def timed(operation):
+    """ Decorator recording the function's latency in loyalty_service_duration_seconds """
+    histogram = SERVICE_LATENCY.labels(operation)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class QueryTimer:
+    """ execute_wrapper installed on every DB connection """
+
+    def __init__(self, alias):
+        self.histogram = DB_QUERY_LATENCY.labels(alias)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.histogram.observe(time.perf_counter() - start)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """ connection_created receiver; the wrapper survives reconnects, so it's only added once """
+    if not any(isinstance(wrapper, QueryTimer) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(QueryTimer(connection.alias))
+
+
+connection_created.connect(install_query_timer, dispatch_uid='loyalty-query-timer')
+
+
+class QueueDepthCollector:
+    """ Reads queue sizes from every shard when /metrics is scraped, so nothing is tracked per job """
+
+    def collect(self):
+        from collections import Counter as Tally
+        from django.db.models import Count
+        from .models import OutboxEvent, TaskProgressJob
+        from .sharding import shard_aliases, use_shard
+
+        gauge = GaugeMetricFamily('loyalty_queue_depth', "Queued items by queue and status.",
+                                  labels=['queue', 'status'])
+        for queue, model in (('task_progress', TaskProgressJob), ('outbox', OutboxEvent)):
+            counts = Tally()
+            for alias in shard_aliases():
+                with use_shard(alias):
+                    counts.update(dict(
+                        model.objects.exclude(status='delivered').values_list('status').annotate(Count('id'))
+                    ))
+            for status in ('pending', 'failed'):
+                gauge.add_metric([queue, status], counts.get(status, 0))
+        yield gauge
+
+
+class ProcessRegistryCollector:
+    """ The process-wide registry, for single-process deployments """
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+class PrometheusMiddleware:
+    """ Records request latency per route; keep it first in MIDDLEWARE so the whole stack is measured """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        REQUEST_LATENCY.labels(
+            match.view_name if match else '<unresolved>', request.method, response.status_code,
+        ).observe(time.perf_counter() - start)
+        return response
+
+
+def metrics_view(request):
+    """ Prometheus exposition; protected by a bearer token when LOYALTY_METRICS_TOKEN is set """
+    token = getattr(settings, 'LOYALTY_METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+
+    registry = CollectorRegistry()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(ProcessRegistryCollector())
+    registry.register(QueueDepthCollector())
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remove_duplicate_progress(apps, schema_editor):
+    """Keep the oldest progress row per (user_id, task) before the unique constraint is added."""
+    UserTaskProgress = apps.get_model('loyalty', 'UserTaskProgress')
+    duplicates = (
+        UserTaskProgress.objects.values('user_id', 'task')
+        .annotate(first_id=models.Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates:
+        UserTaskProgress.objects.filter(user_id=row['user_id'], task=row['task']).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0002_remove_loyaltyprogram_point_conversion_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskProgressJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_progress, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usertaskprogress',
+            constraint=models.UniqueConstraint(fields=('user_id', 'task'), name='unique_progress_per_user_task'),
+        ),
+        migrations.AddField(
+            model_name='taskprogressjob',
+            name='program',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_progress_jobs', to='loyalty.loyaltyprogram'),
+        ),
+        migrations.AddField(
+            model_name='taskprogressjob',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_progress_jobs', to='loyalty.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='taskprogressjob',
+            index=models.Index(fields=['status', 'id'], name='task_job_status_idx'),
+        ),
+    ]
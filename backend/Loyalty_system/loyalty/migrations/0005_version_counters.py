@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0004_outbox_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loyaltyprogram',
+            name='config_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pointbalance',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0005_version_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointbalance',
+            index=models.Index(fields=['program', 'balance'], name='balance_program_balance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pointbalance',
+            index=models.Index(fields=['program', 'total_points_earned'], name='balance_program_earned_idx'),
+        ),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:10
+
+from datetime import date, datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+MONTHS_AHEAD = 3  # Future partitions created up front; `manage_transaction_partitions` keeps extending them
+
+COLUMNS = 'id, user_id, transaction_type, points, "timestamp", program_id'
+
+
+def _months(first, last):
+    month = date(first.year, first.month, 1)
+    while month <= last:
+        yield month
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def partition_transactions(apps, schema_editor):
+    """Rebuild loyalty_transaction as a table range-partitioned by month on "timestamp"."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN("timestamp"), MAX("timestamp"), MAX(id) FROM loyalty_transaction')
+        oldest, newest, max_id = cursor.fetchone()
+
+        today = datetime.now(timezone.utc)
+        ahead = date(today.year + (today.month + MONTHS_AHEAD - 1) // 12, (today.month + MONTHS_AHEAD - 1) % 12 + 1, 1)
+        first = min(oldest, today) if oldest else today
+        last = max(newest.date(), ahead) if newest else ahead
+
+        # The primary key of a partitioned table must include the partition key
+        cursor.execute("""
+            CREATE TABLE loyalty_transaction_partitioned (
+                id bigint NOT NULL,
+                user_id varchar(255) NOT NULL,
+                transaction_type varchar(10) NOT NULL,
+                points integer NOT NULL,
+                "timestamp" timestamp with time zone NOT NULL,
+                program_id bigint NOT NULL,
+                CONSTRAINT loyalty_transaction_partitioned_pkey PRIMARY KEY (id, "timestamp")
+            ) PARTITION BY RANGE ("timestamp")
+        """)
+        cursor.execute("CREATE TABLE loyalty_transaction_default PARTITION OF loyalty_transaction_partitioned DEFAULT")
+        for month in _months(first, last):
+            next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            cursor.execute(
+                f"CREATE TABLE loyalty_transaction_p{month:%Y_%m} PARTITION OF loyalty_transaction_partitioned "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [_bound(month), _bound(next_month)],
+            )
+
+        cursor.execute(f"INSERT INTO loyalty_transaction_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM loyalty_transaction")
+        cursor.execute("DROP TABLE loyalty_transaction")
+        cursor.execute("ALTER TABLE loyalty_transaction_partitioned RENAME TO loyalty_transaction")
+        cursor.execute("ALTER TABLE loyalty_transaction RENAME CONSTRAINT loyalty_transaction_partitioned_pkey "
+                       "TO loyalty_transaction_pkey")
+
+        cursor.execute("CREATE SEQUENCE loyalty_transaction_id_seq OWNED BY loyalty_transaction.id")
+        cursor.execute("SELECT setval('loyalty_transaction_id_seq', %s, false)", [(max_id or 0) + 1])
+        cursor.execute("ALTER TABLE loyalty_transaction ALTER COLUMN id SET DEFAULT nextval('loyalty_transaction_id_seq')")
+
+        cursor.execute('CREATE INDEX loyalty_transaction_program_ts_idx ON loyalty_transaction (program_id, "timestamp")')
+        cursor.execute('CREATE INDEX loyalty_transaction_program_user_ts_idx '
+                       'ON loyalty_transaction (program_id, user_id, "timestamp")')
+        cursor.execute("""
+            ALTER TABLE loyalty_transaction
+            ADD CONSTRAINT loyalty_transaction_program_id_fk_loyalty_loyaltyprogram_id
+            FOREIGN KEY (program_id) REFERENCES loyalty_loyaltyprogram (id) DEFERRABLE INITIALLY DEFERRED
+        """)
+
+
+def unpartition_transactions(apps, schema_editor):
+    """Turn loyalty_transaction back into a plain table."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE loyalty_transaction_plain (
+                id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+                user_id varchar(255) NOT NULL,
+                transaction_type varchar(10) NOT NULL,
+                points integer NOT NULL,
+                "timestamp" timestamp with time zone NOT NULL,
+                program_id bigint NOT NULL
+            )
+        """)
+        cursor.execute(f"INSERT INTO loyalty_transaction_plain ({COLUMNS}) SELECT {COLUMNS} FROM loyalty_transaction")
+        cursor.execute("DROP TABLE loyalty_transaction CASCADE")
+        cursor.execute("ALTER TABLE loyalty_transaction_plain RENAME TO loyalty_transaction")
+        cursor.execute("ALTER SEQUENCE loyalty_transaction_plain_id_seq RENAME TO loyalty_transaction_id_seq")
+        cursor.execute("ALTER TABLE loyalty_transaction ADD CONSTRAINT loyalty_transaction_pkey PRIMARY KEY (id)")
+        cursor.execute("SELECT setval('loyalty_transaction_id_seq', COALESCE(MAX(id), 0) + 1, false) FROM loyalty_transaction")
+        cursor.execute("CREATE INDEX loyalty_transaction_program_id_idx ON loyalty_transaction (program_id)")
+        cursor.execute("""
+            ALTER TABLE loyalty_transaction
+            ADD CONSTRAINT loyalty_transaction_program_id_fk_loyalty_loyaltyprogram_id
+            FOREIGN KEY (program_id) REFERENCES loyalty_loyaltyprogram (id) DEFERRABLE INITIALLY DEFERRED
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0006_member_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskprogressjob',
+            name='transaction',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_progress_jobs', to='loyalty.transaction'),
+        ),
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
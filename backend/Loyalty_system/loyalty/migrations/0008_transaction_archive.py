@@ -0,0 +1,51 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0007_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loyaltyprogram',
+            name='archived_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('path', models.CharField(max_length=500)),
+                ('row_count', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_archives', to='loyalty.loyaltyprogram')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['program', 'first_timestamp'], name='archive_program_range_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('points_earned', models.BigIntegerField(default=0)),
+                ('points_redeemed', models.BigIntegerField(default=0)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('archived_before', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='loyalty.loyaltyprogram')),
+            ],
+            options={
+                'unique_together': {('user_id', 'program')},
+            },
+        ),
+    ]
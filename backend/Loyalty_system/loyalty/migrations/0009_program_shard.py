@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0008_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramShard',
+            fields=[
+                ('program', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to='loyalty.loyaltyprogram')),
+                ('alias', models.CharField(max_length=100)),
+                ('state', models.CharField(choices=[('active', 'Active'), ('moving', 'Moving')], default='active', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['alias'], name='program_shard_alias_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def backfill_aggregates(apps, schema_editor):
+    """ Totals for the balances that already exist on this database """
+    alias = schema_editor.connection.alias
+    PointBalance = apps.get_model('loyalty', 'PointBalance')
+    ProgramAggregate = apps.get_model('loyalty', 'ProgramAggregate')
+    totals = PointBalance.objects.using(alias).order_by().values('program_id').annotate(
+        outstanding=Sum('balance'), earned=Sum('total_points_earned'), members=Count('id'))
+    ProgramAggregate.objects.using(alias).bulk_create([
+        ProgramAggregate(program_id=row['program_id'], outstanding_points=row['outstanding'],
+                         lifetime_earned=row['earned'], lifetime_redeemed=row['earned'] - row['outstanding'],
+                         member_count=row['members'])
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0009_program_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outstanding_points', models.BigIntegerField(default=0)),
+                ('lifetime_earned', models.BigIntegerField(default=0)),
+                ('lifetime_redeemed', models.BigIntegerField(default=0)),
+                ('member_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('program', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='aggregate', to='loyalty.loyaltyprogram')),
+            ],
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0010_program_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='specialtask',
+            name='rolling_window',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='TaskProgressBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('day', models.DateField()),
+                ('points', models.PositiveIntegerField(default=0)),
+                ('transactions', models.PositiveIntegerField(default=0)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_buckets', to='loyalty.specialtask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task', 'day'], name='bucket_task_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='taskprogressbucket',
+            constraint=models.UniqueConstraint(fields=('user_id', 'task', 'day'), name='unique_bucket_per_user_task_day'),
+        ),
+    ]
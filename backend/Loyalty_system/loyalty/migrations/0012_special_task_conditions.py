@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0011_task_progress_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='specialtask',
+            name='conditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0012_special_task_conditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointbalance',
+            index=models.Index(fields=['program', 'user_id'], name='balance_program_user_idx'),
+        ),
+    ]
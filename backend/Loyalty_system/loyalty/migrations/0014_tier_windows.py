@@ -0,0 +1,63 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:52
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+from datetime import timedelta, timezone as dt_timezone
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import now
+
+
+def backfill_tier_buckets(apps, schema_editor):
+    """ Monthly buckets for the earn transactions of the last 36 months already on this database """
+    alias = schema_editor.connection.alias
+    Transaction = apps.get_model('loyalty', 'Transaction')
+    TierPointsBucket = apps.get_model('loyalty', 'TierPointsBucket')
+    months = Transaction.objects.using(alias).filter(
+        transaction_type='earn', timestamp__gte=now() - timedelta(days=36 * 31),
+    ).annotate(month=TruncMonth('timestamp', tzinfo=dt_timezone.utc)).order_by().values(
+        'program_id', 'user_id', 'month').annotate(points=Sum('points'))
+    TierPointsBucket.objects.using(alias).bulk_create(
+        (TierPointsBucket(program_id=row['program_id'], user_id=row['user_id'], month=row['month'].date(),
+                          points=row['points']) for row in months.iterator(chunk_size=5000)),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0013_balance_program_user_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loyaltyprogram',
+            name='tier_window_months',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(36)]),
+        ),
+        migrations.AddField(
+            model_name='pointbalance',
+            name='qualifying_points',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TierPointsBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=255)),
+                ('month', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tier_buckets', to='loyalty.loyaltyprogram')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='tier_bucket_month_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tierpointsbucket',
+            constraint=models.UniqueConstraint(fields=('program', 'user_id', 'month'), name='unique_tier_bucket_per_month'),
+        ),
+        migrations.RunPython(backfill_tier_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-19 12:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0014_tier_windows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramApiKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_id', models.CharField(max_length=32, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('scopes', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_keys', to='loyalty.loyaltyprogram')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('revoked_at__isnull', False)), fields=['revoked_at'], name='api_key_revoked_idx')],
+            },
+        ),
+    ]
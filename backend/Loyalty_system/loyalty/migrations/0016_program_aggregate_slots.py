@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0015_program_api_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='programaggregate',
+            name='slot',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='programaggregate',
+            name='member_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='programaggregate',
+            name='program',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aggregates', to='loyalty.loyaltyprogram'),
+        ),
+        migrations.AddConstraint(
+            model_name='programaggregate',
+            constraint=models.UniqueConstraint(fields=('program', 'slot'), name='unique_aggregate_slot_per_program'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0016_program_aggregate_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRebuildJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('last_user_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('members', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_rebuild_jobs', to='loyalty.loyaltyprogram')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rebuild_jobs', to='loyalty.specialtask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='task_rebuild_status_idx')],
+            },
+        ),
+    ]
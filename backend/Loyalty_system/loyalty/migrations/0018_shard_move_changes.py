@@ -0,0 +1,88 @@
+# Generated by Django 4.2.16 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+# Shard-local models and how their rows reach a program; the trigger logs changes of programs being moved
+CAPTURED_MODELS = {
+    'loyaltytier': 'program', 'specialtask': 'program', 'pointbalance': 'program', 'programaggregate': 'program',
+    'transaction': 'program', 'usertaskprogress': 'task', 'taskprogressbucket': 'task', 'taskprogressjob': 'program',
+    'taskrebuildjob': 'program', 'outboxevent': 'program', 'transactionarchive': 'program',
+    'balancecheckpoint': 'program', 'tierpointsbucket': 'program',
+}
+
+CAPTURE_FUNCTION = """
+CREATE OR REPLACE FUNCTION loyalty_capture_move_change() RETURNS trigger AS $$
+DECLARE
+    changed record;
+    changed_program_id bigint;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM loyalty_shardmovecapture) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN changed := OLD; ELSE changed := NEW; END IF;
+    IF TG_ARGV[1] = 'task' THEN
+        SELECT program_id INTO changed_program_id FROM loyalty_specialtask WHERE id = changed.task_id;
+    ELSE
+        changed_program_id := changed.program_id;
+    END IF;
+    IF EXISTS (SELECT 1 FROM loyalty_shardmovecapture WHERE program_id = changed_program_id) THEN
+        INSERT INTO loyalty_shardmovechange (program_id, model_name, row_id)
+            VALUES (changed_program_id, TG_ARGV[0], changed.id);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def install_capture_triggers(apps, schema_editor):
+    """ Log changes to the rows of programs listed in loyalty_shardmovecapture (used by sharding.move_program) """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CAPTURE_FUNCTION)
+        for name, reached_through in CAPTURED_MODELS.items():
+            table = apps.get_model('loyalty', name)._meta.db_table
+            cursor.execute(f"""
+                CREATE TRIGGER loyalty_capture_move_change AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION loyalty_capture_move_change('{name}', '{reached_through}')
+            """)
+
+
+def remove_capture_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name in CAPTURED_MODELS:
+            table = apps.get_model('loyalty', name)._meta.db_table
+            cursor.execute(f'DROP TRIGGER IF EXISTS loyalty_capture_move_change ON {table}')
+        cursor.execute('DROP FUNCTION IF EXISTS loyalty_capture_move_change()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0017_task_rebuild_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardMoveCapture',
+            fields=[
+                ('program_id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShardMoveChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('program_id', models.BigIntegerField()),
+                ('model_name', models.CharField(max_length=50)),
+                ('row_id', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['program_id', 'model_name'], name='shard_move_change_idx')],
+            },
+        ),
+        migrations.RunPython(install_capture_triggers, remove_capture_triggers),
+    ]
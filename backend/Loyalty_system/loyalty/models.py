@@ -1,6 +1,13 @@
+import zlib
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from datetime import timedelta
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from datetime import timedelta, timezone as dt_timezone
 from django.utils.timezone import now
 
 User = get_user_model()
@@ -16,11 +23,105 @@ class LoyaltyProgram(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp when program was created
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loyalty_programs')
     # The user (owner) who manages this loyalty program
+    webhook_url = models.URLField(blank=True)  # Where tier and task events are delivered (optional)
+    config_version = models.PositiveIntegerField(default=0)  # Bumped whenever tiers or tasks change (ETags)
+    archived_before = models.DateTimeField(blank=True, null=True)  # Older transactions live in cold storage
+    TIER_WINDOW_MAX_MONTHS = 36  # Older monthly tier buckets are deleted by `requalify_tiers`
+    tier_window_months = models.PositiveSmallIntegerField(
+        blank=True, null=True, validators=[MinValueValidator(1), MaxValueValidator(TIER_WINDOW_MAX_MONTHS)])
+    # Tiers count the points earned in the last N calendar months instead of lifetime points (see TierPointsBucket)
+
+    # Maintained with queryset updates only (F() increments, the archiver); save() never writes them back
+    SYSTEM_FIELDS = ('config_version', 'archived_before')
+
+    def save(self, *args, **kwargs):
+        """  Never write stale system fields back; they only change through queryset updates """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SYSTEM_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} (Owner: {self.owner.username})"
 
+### PROGRAM SHARD MODEL ###
+class ProgramShard(models.Model):
+    """
+    Directory entry: the database alias holding a program's balances, ledger, tiers and tasks.
+    Only read and written on 'default'; programs without an entry live on 'default' (see loyalty/sharding.py).
+    """
+    STATE_CHOICES = [
+        ('active', 'Active'),
+        ('moving', 'Moving'),  # Writes are frozen while a move catches up on the target shard
+    ]
+
+    program = models.OneToOneField(LoyaltyProgram, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=100)  # Key of settings.DATABASES
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='active')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['alias'], name='program_shard_alias_idx'),
+        ]
+
+    def __str__(self):
+        return f"Program {self.program_id} on {self.alias} ({self.state})"
+
+class ShardMoveCapture(models.Model):
+    """
+    A program being moved off this shard. While the row exists, database triggers log every insert, update
+    and delete of the program's shard-local rows to ShardMoveChange (see loyalty/sharding.py).
+    """
+    program_id = models.BigIntegerField(primary_key=True)  # No foreign key: exists on whichever shard is the source
+
+class ShardMoveChange(models.Model):
+    """ A shard-local row of a program being moved that changed after the copy started """
+    program_id = models.BigIntegerField()
+    model_name = models.CharField(max_length=50)  # One of sharding.SHARD_LOCAL_MODELS
+    row_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['program_id', 'model_name'], name='shard_move_change_idx'),
+        ]
+
+### PROGRAM API KEY MODEL ###
+class ProgramApiKey(models.Model):
+    """
+    An API key limited to one program and a set of scopes (see loyalty/api_keys.py).
+    Keys are verified from their signature alone; this row only names the key and records its revocation.
+    """
+    key_id = models.CharField(max_length=32, unique=True)  # `kid` claim of the key
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name='api_keys')
+    name = models.CharField(max_length=100, blank=True)  # e.g. "POS integration"
+    scopes = models.JSONField(default=list)  # e.g. ["points:write", "balances:read"]
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['revoked_at'], name='api_key_revoked_idx', condition=Q(revoked_at__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"API key {self.key_id} for program {self.program_id}"
+
 ### POINT BALANCE MODEL ###
+class PointBalanceQuerySet(models.QuerySet):
+    def with_tier(self):
+        """  Annotate `tier_name` with the highest reached tier, computed in the same SELECT """
+        reached_tiers = LoyaltyTier.objects.filter(
+            program=OuterRef('program'),
+            points_to_reach__lte=Coalesce(OuterRef('qualifying_points'), OuterRef('total_points_earned'))
+        ).order_by('-points_to_reach').values('tier_name')[:1]
+
+        return self.annotate(tier_name=Coalesce(Subquery(reached_tiers), Value("No Tier")))
+
+
 class PointBalance(models.Model):
     """
     Tracks the points balance of an application user for a specific loyalty program.
@@ -29,39 +130,236 @@ class PointBalance(models.Model):
     program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name="balances")
     balance = models.IntegerField(default=0)  # Current balance of points
     total_points_earned = models.IntegerField(default=0)  # Total points earned over time
+    qualifying_points = models.IntegerField(blank=True, null=True)
+    # Points earned in the program's tier window (see requalify_tiers); null = tiers use total_points_earned
+    version = models.PositiveIntegerField(default=0)  # Incremented on every write (ETags)
+
+    objects = PointBalanceQuerySet.as_manager()
 
     class Meta:
         unique_together = ('user_id', 'program')  # A user can only have one balance per program
+        indexes = [
+            models.Index(fields=['program', 'balance'], name='balance_program_balance_idx'),
+            models.Index(fields=['program', 'total_points_earned'], name='balance_program_earned_idx'),
+            models.Index(fields=['program', 'user_id'], name='balance_program_user_idx'),  # Keyset walks over members
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_points = (instance.__dict__.get('balance'), instance.__dict__.get('total_points_earned'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+         Bump the row version on every write so clients can revalidate cached copies,
+         and add the balance change to the program's aggregates in the same DB transaction
+        """
+        self.version += 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        adding = self._state.adding
+        previous = (0, 0) if adding else getattr(self, '_saved_points', (None, None))
+        if None in previous:  # Loaded with deferred fields
+            previous = type(self).objects.using(using).filter(pk=self.pk).values_list(
+                'balance', 'total_points_earned').get()
+
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            ProgramAggregate.apply(self.program_id, balance=self.balance - previous[0],
+                                   earned=self.total_points_earned - previous[1], members=int(adding), using=using,
+                                   slot=ProgramAggregate.slot_for(self.user_id))
+        self._saved_points = (self.balance, self.total_points_earned)
+
+    def delete(self, *args, **kwargs):
+        """  Remove the member from the program's aggregates (queryset deletes need `reconcile_program_aggregates`) """
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            result = super().delete(*args, **kwargs)
+            ProgramAggregate.apply(self.program_id, balance=-self.balance, earned=-self.total_points_earned,
+                                   members=-1, using=using, slot=ProgramAggregate.slot_for(self.user_id))
+        return result
+
+    @property
+    def tier_points(self):
+        """  Points the tier is based on: the rolling-window total for windowed programs, else lifetime points """
+        return self.total_points_earned if self.qualifying_points is None else self.qualifying_points
+
+    def lock(self):
+        """
+         Re-read the points of the row under a row lock (SELECT ... FOR UPDATE); call inside a DB transaction.
+         Concurrent earns and redeems of the member then apply their change one after the other instead of
+         overwriting each other's result with values read before the other committed.
+        """
+        locked = type(self).objects.using(self._state.db).select_for_update().values(
+            'balance', 'total_points_earned', 'qualifying_points', 'version').get(pk=self.pk)
+        for name, value in locked.items():
+            setattr(self, name, value)
+        self._saved_points = (self.balance, self.total_points_earned)
 
     def add_points(self, points):
-        """  Add points to the balance and update the total earned points """
-        self.balance += points
-        self.total_points_earned += points
-        self.save(update_fields=['balance', 'total_points_earned'])
+        """  Add points to the balance and update the total earned (and qualifying) points """
+        with transaction.atomic(using=self._state.db):
+            self.lock()
+            previous_points = self.tier_points
+            self.balance += points
+            self.total_points_earned += points
+            if self.qualifying_points is not None:
+                self.qualifying_points += points
+            self.save(update_fields=['balance', 'total_points_earned', 'qualifying_points'])
+            TierPointsBucket.add(self.program_id, self.user_id, points, using=self._state.db)
+            self.record_tier_change(previous_points)
 
     def redeem_points(self, points):
-        """  Redeem points from balance, ensuring it doesn't go negative """
-        if points > self.balance:
-            raise ValueError('Insufficient points')
-        self.balance -= points
-        self.save(update_fields=['balance'])
+        """  Redeem points from balance, ensuring it doesn't go negative (checked on the locked row) """
+        with transaction.atomic(using=self._state.db):
+            self.lock()
+            if points > self.balance:
+                raise ValueError('Insufficient points')
+            self.balance -= points
+            self.save(update_fields=['balance'])
 
     def get_loyalty_tier(self):
-        """  Determine the highest loyalty tier based on total earned points """
+        """  Determine the highest loyalty tier based on total earned (or qualifying) points """
         eligible_tiers = LoyaltyTier.objects.filter(
             program=self.program,
-            points_to_reach__lte=self.total_points_earned
+            points_to_reach__lte=self.tier_points
         ).order_by('-points_to_reach')
 
         return eligible_tiers.first().tier_name if eligible_tiers.exists() else "No Tier"
 
+    def record_tier_change(self, previous_points):
+        """  Write a `tier.changed` outbox event if earning points moved the user into a new tier """
+        if self.tier_points <= previous_points:
+            return None
+
+        reached_tiers = list(
+            LoyaltyTier.objects.filter(program_id=self.program_id, points_to_reach__lte=self.tier_points)
+            .order_by('-points_to_reach')
+            .values_list('tier_name', 'points_to_reach')
+        )
+        new_tier = reached_tiers[0][0] if reached_tiers else None
+        old_tier = next((name for name, points in reached_tiers if points <= previous_points), None)
+        if new_tier == old_tier:
+            return None
+
+        return OutboxEvent.record(self.program_id, 'tier.changed', self.tier_change_payload(old_tier, new_tier),
+                                  using=self._state.db)
+
+    def tier_change_payload(self, previous_tier, tier):
+        """  Data of a `tier.changed` event """
+        payload = {
+            'user_id': self.user_id,
+            'previous_tier': previous_tier,
+            'tier': tier,
+            'total_points_earned': self.total_points_earned,
+        }
+        if self.qualifying_points is not None:
+            payload['qualifying_points'] = self.qualifying_points
+        return payload
+
     def __str__(self):
         return f"User {self.user_id} - {self.program.name}: {self.balance} points (Total Earned: {self.total_points_earned})"
 
+### PROGRAM AGGREGATE MODEL ###
+class ProgramAggregate(models.Model):
+    """
+    Running totals of a program's point balances, so the points liability is a small indexed sum.
+    A program's totals are split over up to LOYALTY_AGGREGATE_SLOTS rows, picked by a hash of the
+    member's user_id, so concurrent balance writes of different members rarely wait on the same row
+    lock; the liability is the sum of the rows. PointBalance.save() / delete() apply their change
+    with F() updates in the same DB transaction; `manage.py reconcile_program_aggregates` recomputes
+    the totals from the balances.
+    """
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name='aggregates')
+    slot = models.PositiveSmallIntegerField(default=0)  # Which of the program's rows this is
+    outstanding_points = models.BigIntegerField(default=0)  # SUM(balance): the points liability
+    lifetime_earned = models.BigIntegerField(default=0)  # SUM(total_points_earned)
+    lifetime_redeemed = models.BigIntegerField(default=0)  # Points that left balances: earned - outstanding
+    member_count = models.IntegerField(default=0)  # PointBalance rows; signed, only the program's sum is meaningful
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['program', 'slot'], name='unique_aggregate_slot_per_program'),
+        ]
+
+    @staticmethod
+    def slot_for(user_id):
+        """  Row of a member's changes; stable across processes, unlike hash() """
+        return zlib.crc32(str(user_id).encode()) % getattr(settings, 'LOYALTY_AGGREGATE_SLOTS', 16)
+
+    @classmethod
+    def apply(cls, program_id, balance=0, earned=0, members=0, using=None, slot=0):
+        """  Add a balance change to one of the program's rows; call inside the transaction that changes the balance """
+        if not (balance or earned or members):
+            return
+        manager = cls.objects.db_manager(using)
+        updated = manager.filter(program_id=program_id, slot=slot).update(
+            outstanding_points=F('outstanding_points') + balance,
+            lifetime_earned=F('lifetime_earned') + earned,
+            lifetime_redeemed=F('lifetime_redeemed') + (earned - balance),
+            member_count=F('member_count') + members,
+            updated_at=now(),
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic(using=manager.db):
+                manager.create(program_id=program_id, slot=slot, outstanding_points=balance, lifetime_earned=earned,
+                               lifetime_redeemed=earned - balance, member_count=members)
+        except IntegrityError:  # Created concurrently by another transaction
+            cls.apply(program_id, balance, earned, members, using=using, slot=slot)
+
+    def __str__(self):
+        return (f"Program {self.program_id} (slot {self.slot}): {self.outstanding_points} points outstanding, "
+                f"{self.member_count} members")
+
+### TIER POINTS BUCKET MODEL ###
+class TierPointsBucket(models.Model):
+    """
+    Points a member earned in one calendar month (UTC), for rolling-window tier qualification.
+    Written on every earn; `manage.py requalify_tiers` sums the last `tier_window_months` buckets
+    into PointBalance.qualifying_points and deletes buckets older than any window.
+    """
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name='tier_buckets')
+    user_id = models.CharField(max_length=255)  # ID of the API user
+    month = models.DateField()  # First day of the month
+    points = models.IntegerField(default=0)  # Points earned that month
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['program', 'user_id', 'month'], name='unique_tier_bucket_per_month'),
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='tier_bucket_month_idx'),  # Compaction
+        ]
+
+    @classmethod
+    def add(cls, program_id, user_id, points, when=None, using=None):
+        """  Add earned points to the member's bucket of the month; call inside the transaction that earns them """
+        if points <= 0:
+            return
+        month = (when or now()).astimezone(dt_timezone.utc).date().replace(day=1)
+        buckets = cls.objects.db_manager(using).filter(program_id=program_id, user_id=user_id, month=month)
+        if buckets.update(points=F('points') + points):
+            return
+        try:
+            with transaction.atomic(using=buckets.db):
+                buckets.create(program_id=program_id, user_id=user_id, month=month, points=points)
+        except IntegrityError:  # Created concurrently by another transaction
+            buckets.update(points=F('points') + points)
+
+    def __str__(self):
+        return f"User {self.user_id} in program {self.program_id}, {self.month:%Y-%m}: {self.points} points"
+
 ### TRANSACTION MODEL ###
 class Transaction(models.Model):
     """
     Represents a transaction where a user earns or redeems points within a loyalty program.
+    On PostgreSQL the table is range-partitioned by month on `timestamp` (see loyalty/partitions.py).
     """
     TRANSACTION_TYPES = [
         ('earn', 'Earn'),
@@ -108,6 +406,10 @@ class SpecialTask(models.Model):
     points_required = models.PositiveIntegerField(default=0)  # Points user must earn to complete the task
     transactions_required = models.PositiveIntegerField(default=0)  # Number of transactions required
     duration_days = models.PositiveIntegerField()  # Time limit to complete the task
+    rolling_window = models.BooleanField(default=False)
+    # Count only the last `duration_days` days of activity ("5 purchases within any 30 days"), see TaskProgressBucket
+    conditions = models.JSONField(default=dict, blank=True)
+    # Which transactions count, e.g. {"min_points": 50, "hours": [17, 22]}; empty = every earn transaction (rules.py)
     reward_points = models.PositiveIntegerField(default=0)  # Bonus points awarded upon completion
     created_at = models.DateTimeField(auto_now_add=True)  # When task was created
 
@@ -129,6 +431,11 @@ class UserTaskProgress(models.Model):
     transactions_count = models.PositiveIntegerField(default=0)  # Transactions completed for the task
     completed_at = models.DateTimeField(blank=True, null=True)  # Timestamp when task was completed
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'task'], name='unique_progress_per_user_task'),
+        ]
+
     def is_completed(self):
         """  Check if the user has met the task requirements """
         return (
@@ -143,10 +450,203 @@ class UserTaskProgress(models.Model):
         if self.is_completed() and not self.completed_at:
             self.completed_at = now()
 
-            # ✅ Debugging statement (remove in production)
-            print(f" User {self.user_id} has completed task '{self.task.name}'. Marking as completed.")
-
-            self.save()
+            with transaction.atomic(using=self._state.db):
+                self.save()
+                OutboxEvent.record(self.task.program_id, 'task.completed', {
+                    'user_id': self.user_id,
+                    'task_id': self.task_id,
+                    'task_name': self.task.name,
+                    'completed_at': self.completed_at,
+                }, using=self._state.db)
 
     def __str__(self):
         return f"Progress: User {self.user_id} on '{self.task.name}' - {self.points_earned}/{self.task.points_required} points"
+
+
+### TASK PROGRESS BUCKET MODEL ###
+class TaskProgressBucket(models.Model):
+    """
+    One day of a member's activity towards a rolling-window task.
+    The window total is the sum of the member's last `duration_days` buckets; older buckets are
+    deleted by the `compact_task_buckets` management command.
+    """
+    user_id = models.CharField(max_length=255)  # ID of the API user
+    task = models.ForeignKey(SpecialTask, on_delete=models.CASCADE, related_name="progress_buckets")
+    day = models.DateField()  # UTC day of the counted transactions
+    points = models.PositiveIntegerField(default=0)  # Points earned that day
+    transactions = models.PositiveIntegerField(default=0)  # Earn transactions that day
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'task', 'day'], name='unique_bucket_per_user_task_day'),
+        ]
+        indexes = [
+            models.Index(fields=['task', 'day'], name='bucket_task_day_idx'),  # Compaction
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id} on task {self.task_id}, {self.day}: {self.points} points, {self.transactions} transactions"
+
+
+### TASK PROGRESS JOB MODEL ###
+class TaskProgressJob(models.Model):
+    """
+    A queued request to evaluate special task progress for a recorded transaction.
+    Jobs are claimed by the `process_task_progress_jobs` management command,
+    so task evaluation never runs inside the API request.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('failed', 'Failed'),
+    ]
+
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name="task_progress_jobs",
+                                    db_constraint=False)  # Partitioned tables can't be referenced by `id` alone
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name="task_progress_jobs")
+    # Copied from the transaction so the worker can group claimed jobs by program
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)  # Failed processing attempts so far
+    last_error = models.TextField(blank=True)  # Error message from the last failed attempt
+    created_at = models.DateTimeField(auto_now_add=True)  # When the job was queued
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='task_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Task progress job {self.id} for transaction {self.transaction_id} ({self.status})"
+
+
+### TASK REBUILD JOB MODEL ###
+class TaskRebuildJob(models.Model):
+    """
+    A queued rebuild of every member's progress on a task (services.rebuild_task_progress).
+    Drained a chunk of members at a time by the `process_task_progress_jobs` worker; `last_user_id`
+    is the keyset cursor, saved in the same DB transaction as each chunk, so an interrupted rebuild
+    resumes where it stopped.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.ForeignKey(SpecialTask, on_delete=models.CASCADE, related_name="rebuild_jobs")
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name="task_rebuild_jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    last_user_id = models.CharField(max_length=255, null=True, blank=True)  # Last member rebuilt so far
+    members = models.PositiveIntegerField(default=0)  # Members rebuilt so far
+    completed = models.PositiveIntegerField(default=0)  # Task completions found so far
+    attempts = models.PositiveIntegerField(default=0)  # Failed chunks so far
+    last_error = models.TextField(blank=True)  # Error message from the last failed chunk
+    created_at = models.DateTimeField(auto_now_add=True)  # When the rebuild was requested; fixes its window
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='task_rebuild_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rebuild job {self.id} for task {self.task_id} ({self.status}, {self.members} members)"
+
+
+### OUTBOX EVENT MODEL ###
+class OutboxEvent(models.Model):
+    """
+    A merchant notification written in the same DB transaction as the state change it describes.
+    Events are delivered to the program's webhook by the `dispatch_outbox_events` management command.
+    """
+    EVENT_TYPES = [
+        ('tier.changed', 'Tier changed'),
+        ('task.completed', 'Task completed'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    ]
+
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name="outbox_events")
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)  # Event data sent to the merchant
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)  # Delivery attempts so far
+    next_attempt_at = models.DateTimeField(default=now)  # Earliest time of the next delivery attempt
+    last_error = models.TextField(blank=True)  # Error from the last failed delivery
+    created_at = models.DateTimeField(auto_now_add=True)  # When the event was recorded
+    delivered_at = models.DateTimeField(blank=True, null=True)  # When the webhook accepted the event
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    @classmethod
+    def record(cls, program_id, event_type, payload, using=None):
+        """  Store an event; call this inside the transaction that changes the state (on its database) """
+        return cls.objects.db_manager(using).create(program_id=program_id, event_type=event_type, payload=payload)
+
+    def as_message(self):
+        """  JSON-ready representation sent to the webhook """
+        return {
+            'id': self.id,
+            'type': self.event_type,
+            'program_id': self.program_id,
+            'created_at': self.created_at.isoformat(),
+            'data': self.payload,
+        }
+
+    def __str__(self):
+        return f"{self.event_type} event {self.id} for program {self.program_id} ({self.status})"
+
+
+### TRANSACTION ARCHIVE MODEL ###
+class TransactionArchive(models.Model):
+    """
+    Manifest entry for one cold-storage file of archived transactions (see loyalty/archive.py).
+    A file holds one program's transactions of one calendar month, written by one archival run.
+    """
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name="transaction_archives")
+    month = models.DateField()  # First day of the archived month (UTC)
+    path = models.CharField(max_length=500)  # File path relative to LOYALTY_ARCHIVE_ROOT
+    row_count = models.PositiveIntegerField()  # Transactions stored in the file
+    first_timestamp = models.DateTimeField()  # Oldest transaction in the file
+    last_timestamp = models.DateTimeField()  # Newest transaction in the file
+    created_at = models.DateTimeField(auto_now_add=True)  # When the file was written
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['program', 'first_timestamp'], name='archive_program_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archive {self.path} ({self.row_count} transactions)"
+
+
+### BALANCE CHECKPOINT MODEL ###
+class BalanceCheckpoint(models.Model):
+    """
+    Per-member totals of a program's archived transactions.
+    Checkpoint totals plus the transactions still in the hot table add up to the member's full ledger.
+    """
+    user_id = models.CharField(max_length=255)  # ID of API user
+    program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name="balance_checkpoints")
+    points_earned = models.BigIntegerField(default=0)  # Sum of archived "earn" transactions
+    points_redeemed = models.BigIntegerField(default=0)  # Sum of archived "redeem" transactions
+    transaction_count = models.PositiveIntegerField(default=0)  # Number of archived transactions
+    archived_before = models.DateTimeField()  # Every transaction older than this is included
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user_id', 'program')
+
+    @property
+    def balance(self):
+        """  Balance contributed by the archived transactions """
+        return self.points_earned - self.points_redeemed
+
+    def __str__(self):
+        return f"Checkpoint for user {self.user_id} in {self.program.name}: {self.balance} points"
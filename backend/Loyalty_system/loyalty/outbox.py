@@ -0,0 +1,140 @@
+import json
+import logging
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import OutboxEvent
+from .sharding import is_sharded, moving_program_ids, shard_aliases, shard_for_program
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8  # Events are marked 'failed' after this many delivery attempts
+BACKOFF_BASE_SECONDS = 5  # Delay after the first failure, doubled on every retry
+BACKOFF_MAX_SECONDS = 3600
+LEASE_MARGIN_SECONDS = 60  # Added to the worst-case delivery time of a claimed batch
+
+
+def backoff_delay(attempts):
+    """ Exponential backoff for an event that has failed `attempts` times """
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def post_webhook(url, events, timeout):
+    """ POST a batch of events to a webhook; raises on network errors and non-2xx responses """
+    body = json.dumps({'events': [event.as_message() for event in events]}, cls=DjangoJSONEncoder)
+    request = urllib.request.Request(
+        url,
+        data=body.encode(),
+        method='POST',
+        headers={'Content-Type': 'application/json', 'User-Agent': 'loyalty-outbox/1.0'},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def _deliver(url, events, timeout):
+    """ Deliver one program's batch and return the error message, or None on success """
+    try:
+        post_webhook(url, events, timeout)
+    except Exception as e:
+        logger.warning("Webhook delivery to %s failed: %s", url, e)
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def dispatch_outbox_events(batch_size=100, concurrency=8, timeout=5.0):
+    """
+    Claims due outbox events on every shard and delivers them, one POST per program, `concurrency` at a time.
+    Failed batches are rescheduled with exponential backoff.
+    Returns a (delivered, failed) tuple with event counts.
+    """
+    moving = moving_program_ids()
+    delivered = failed = 0
+    for alias in shard_aliases():
+        shard_delivered, shard_failed = dispatch_shard_outbox_events(alias, batch_size, concurrency, timeout, moving)
+        delivered += shard_delivered
+        failed += shard_failed
+    return delivered, failed
+
+
+def claim_lease(batches, concurrency, timeout):
+    """ How long claimed events stay hidden from other dispatchers: every delivery round, plus a margin """
+    rounds = -(-batches // concurrency)
+    return timedelta(seconds=timeout * rounds + LEASE_MARGIN_SECONDS)
+
+
+def dispatch_shard_outbox_events(alias, batch_size=100, concurrency=8, timeout=5.0, skip_program_ids=()):
+    """
+    One batch of dispatch_outbox_events() on one database.
+    Events are claimed in a short transaction that leases them (pushes `next_attempt_at` past the
+    delivery time) and commits; webhooks are called with no transaction open, and the outcome is
+    written in a second short transaction. A dispatcher dying mid-batch leaves its events to be
+    retried once the lease runs out.
+    Events of programs without a webhook stay pending until one is configured.
+    """
+    with transaction.atomic(using=alias):
+        events = OutboxEvent.objects.using(alias).select_for_update(skip_locked=True, of=('self',)).filter(
+            status='pending', next_attempt_at__lte=now()).exclude(program__webhook_url='')
+        if skip_program_ids:
+            events = events.exclude(program_id__in=skip_program_ids)
+        events = list(events.select_related('program').order_by('id')[:batch_size])
+        if not events:
+            return 0, 0
+
+        batches = defaultdict(list)
+        for event in events:
+            batches[event.program_id].append(event)
+        if is_sharded():
+            #  Rows left on the source of a finished move are deleted by the move, not delivered twice
+            for program_id in [pid for pid in batches if shard_for_program(pid) != alias]:
+                del batches[program_id]
+
+        OutboxEvent.objects.using(alias).filter(
+            id__in=[event.id for batch in batches.values() for event in batch]
+        ).update(next_attempt_at=now() + claim_lease(len(batches), concurrency, timeout))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {
+            pid: pool.submit(_deliver, batch[0].program.webhook_url, batch, timeout)
+            for pid, batch in batches.items()
+        }
+    errors = {pid: future.result() for pid, future in futures.items()}
+
+    delivered, failed = [], []
+    delivered_at = now()
+    for pid, batch in batches.items():
+        for event in batch:
+            event.attempts += 1
+            if errors[pid] is None:
+                event.status = 'delivered'
+                event.delivered_at = delivered_at
+                event.last_error = ''
+                delivered.append(event)
+            else:
+                event.last_error = errors[pid]
+                event.next_attempt_at = delivered_at + backoff_delay(event.attempts)
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = 'failed'
+                failed.append(event)
+
+    with transaction.atomic(using=alias):
+        OutboxEvent.objects.using(alias).bulk_update(
+            delivered + failed, ['status', 'attempts', 'delivered_at', 'last_error', 'next_attempt_at']
+        )
+
+    return len(delivered), len(failed)
+
+
+def purge_delivered_events(older_than_days=7):
+    """ Delete delivered events older than the retention window """
+    cutoff = now() - timedelta(days=older_than_days)
+    deleted = 0
+    for alias in shard_aliases():
+        deleted += OutboxEvent.objects.using(alias).filter(status='delivered', delivered_at__lt=cutoff).delete()[0]
+    return deleted
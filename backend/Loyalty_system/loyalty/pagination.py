@@ -0,0 +1,51 @@
+from urllib.parse import urlencode
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class NoCountPageNumberPagination(BasePagination):
+    """
+    Page-number pagination that never runs COUNT(*).
+    It fetches `page_size + 1` rows to find out whether a next page exists,
+    so a page always costs exactly one query.
+    """
+    page_size = 50
+    max_page_size = 500
+    page_query_param = 'page'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_number = self._positive_int(request, self.page_query_param, 1)
+        self.page_size = min(self._positive_int(request, self.page_size_query_param, self.page_size),
+                             self.max_page_size)
+
+        offset = (self.page_number - 1) * self.page_size
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        return rows[:self.page_size]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'page': self.page_number,
+            'page_size': self.page_size,
+            'next': self._page_link(self.page_number + 1) if self.has_next else None,
+            'previous': self._page_link(self.page_number - 1) if self.page_number > 1 else None,
+            'results': data,
+        })
+
+    def _page_link(self, page_number):
+        params = self.request.query_params.copy()
+        params[self.page_query_param] = page_number
+        return self.request.build_absolute_uri(f"{self.request.path}?{urlencode(params)}")
+
+    @staticmethod
+    def _positive_int(request, name, default):
+        value = request.query_params.get(name)
+        if value is None:
+            return default
+        if not value.isdigit() or int(value) < 1:
+            raise ValidationError({name: "Must be a positive integer."})
+        return int(value)
@@ -0,0 +1,129 @@
+"""
+Monthly range partitions of the `loyalty_transaction` table (PostgreSQL only).
+
+Migration 0007 turns the table into `PARTITION BY RANGE ("timestamp")` with one partition
+per calendar month (UTC) plus a DEFAULT partition that catches rows without a month partition.
+Date-filtered queries on `timestamp` are pruned to the matching partitions by the planner.
+"""
+import re
+from datetime import date, datetime, timezone
+
+from django.db import connection as default_connection, transaction
+
+TABLE = 'loyalty_transaction'
+DEFAULT_PARTITION = f'{TABLE}_default'
+_PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    """ First day of the month containing `value` (a date or datetime) """
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def month_bound(month):
+    """ Midnight UTC at the start of `month`, the partition boundary """
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def is_partitioned(connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def month_partitions(connection=default_connection):
+    """ Attached month partitions as a sorted list of (month, table name) """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def ensure_month_partition(month, connection=default_connection):
+    """
+    Create the partition for `month` unless it exists. Rows that already landed in the
+    DEFAULT partition for that month are moved into the new partition.
+    Returns True if a partition was created.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    if name in {existing for _, existing in month_partitions(connection)}:
+        return False
+
+    lower, upper = month_bound(month), month_bound(add_months(month, 1))
+    qn = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {qn(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+            )
+            INSERT INTO {qn(name)} SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+            [lower, upper],
+        )
+    return True
+
+
+def create_future_partitions(months_ahead=3, today=None, connection=default_connection):
+    """ Make sure partitions exist from the current month up to `months_ahead` months later """
+    current = month_start(today or datetime.now(timezone.utc))
+    return [
+        partition_name(add_months(current, offset))
+        for offset in range(months_ahead + 1)
+        if ensure_month_partition(add_months(current, offset), connection)
+    ]
+
+
+def detach_partitions_before(month, drop=False, connection=default_connection):
+    """
+    Detach every month partition that ends on or before `month`. Detaching only touches the
+    catalog, so old data leaves the hot table instantly; with `drop=True` the tables are dropped too.
+    Returns the affected table names.
+    """
+    month = month_start(month)
+    qn = connection.ops.quote_name
+    detached = []
+    with connection.cursor() as cursor:
+        for partition_month, name in month_partitions(connection):
+            if partition_month >= month:
+                break
+            cursor.execute(f"ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+            detached.append(name)
+    return detached
@@ -6,7 +6,7 @@ class IsOwnerOfLoyaltyProgram(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         """Check if the requesting user owns the related Loyalty Program"""
         if hasattr(obj, "program"):  # If obj is LoyaltyTier, access program's owner
-            return obj.program.owner == request.user
+            return obj.program.owner_id == request.user.id
         if isinstance(obj, UserTaskProgress):
-            return obj.task.program.owner == request.user  # Fix for UserTaskProgress
-        return obj.owner == request.user  # Default case for LoyaltyProgram
\ No newline at end of file
+            return obj.task.program.owner_id == request.user.id  # Fix for UserTaskProgress
+        return obj.owner_id == request.user.id  # Default case for LoyaltyProgram
\ No newline at end of file
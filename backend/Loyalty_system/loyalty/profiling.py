@@ -0,0 +1,156 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware keeps the profiles of requests that are sampled or slow. A sampled fraction of
+requests runs under cProfile and is always kept. The other requests only get a timer: when one is
+slower than the threshold its view is flagged, and the next request to that view is profiled and
+kept if it is slow again (either way the flag is cleared, and the next slow request sets it again).
+Every kept profile is written as a pstats file plus a JSON sidecar
+(path, view name, status, duration, query count) into a bounded on-disk ring: once it holds
+`MAX_PROFILES` profiles the oldest are deleted. `manage.py profile_report` aggregates them.
+
+Configured with settings.LOYALTY_PROFILING:
+    ENABLED          Off by default; when off the middleware removes itself at startup
+    SAMPLE_RATE      Fraction of requests profiled and kept whatever their duration (1.0 = every request)
+    SLOW_REQUEST_MS  Requests at least this slow get their view profiled on its next request
+    DIRECTORY        Where profiles are written
+    MAX_PROFILES     Size of the ring
+
+cProfile roughly doubles the cost of a profiled request, so keep SAMPLE_RATE low in production
+unless you are chasing a specific slow endpoint.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.01,
+    'SLOW_REQUEST_MS': 500,
+    'DIRECTORY': 'profiles',
+    'MAX_PROFILES': 200,
+}
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'LOYALTY_PROFILING', {})}
+
+
+class QueryCounter:
+    """ execute_wrapper that counts queries and the time spent in them """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        config = profiling_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config['SAMPLE_RATE']
+        self.slow_seconds = config['SLOW_REQUEST_MS'] / 1000
+        self.directory = Path(config['DIRECTORY'])
+        self.max_profiles = config['MAX_PROFILES']
+        self.slow_views = set()  # Views whose next request is profiled, flagged by a slow unprofiled request
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        view = None if sampled or not self.slow_views else self.view_name(request)
+        if not sampled and view not in self.slow_views:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            if time.perf_counter() - start >= self.slow_seconds and request.resolver_match:
+                self.slow_views.add(request.resolver_match.view_name)
+            return response
+
+        self.slow_views.discard(view)
+        profiler = cProfile.Profile()
+        queries = QueryCounter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            try:
+                profiler.enable()
+            except ValueError:  # Another profiler is active on this interpreter
+                return self.get_response(request)
+            start = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - start
+
+        if sampled or duration >= self.slow_seconds:
+            try:
+                self.save(profiler, request, response, duration, queries, sampled)
+            except OSError:
+                logger.exception("Could not write request profile to %s", self.directory)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        try:
+            return resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+
+    def save(self, profiler, request, response, duration, queries, sampled):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}"
+        match = request.resolver_match
+        profiler.dump_stats(self.directory / f"{name}.prof")
+        (self.directory / f"{name}.json").write_text(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'query_count': queries.count,
+            'query_ms': round(queries.seconds * 1000, 2),
+            'sampled': sampled,
+            'timestamp': time.time(),
+        }))
+        self.trim()
+
+    def trim(self):
+        """ Drop the oldest profiles beyond MAX_PROFILES (names start with a nanosecond timestamp) """
+        profiles = sorted(self.directory.glob('*.prof'), key=lambda path: int(path.stem.split('-')[0]))
+        for path in profiles[:max(0, len(profiles) - self.max_profiles)]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.json').unlink(missing_ok=True)
+
+
+def collected_profiles(directory=None):
+    """ (profile path, metadata) of every profile in the ring, oldest first """
+    directory = Path(directory or profiling_settings()['DIRECTORY'])
+    profiles = []
+    for path in sorted(directory.glob('*.prof'), key=lambda path: int(path.stem.split('-')[0])):
+        try:
+            metadata = json.loads(path.with_suffix('.json').read_text())
+        except (OSError, ValueError):
+            metadata = {}
+        profiles.append((path, metadata))
+    return profiles
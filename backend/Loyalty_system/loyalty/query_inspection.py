@@ -0,0 +1,148 @@
+"""
+N+1 detection and slow-query logging for development and tests.
+
+QueryInspector is an execute_wrapper that records every query with its SQL "shape" (literals and
+IN-lists collapsed) and the project stack frames that issued it. Shapes repeated at least
+REPEAT_THRESHOLD times within one request or test are reported as suspected N+1 queries, and any
+query slower than SLOW_QUERY_MS is logged right away on the `loyalty.queries` logger.
+
+Configured with settings.LOYALTY_QUERY_INSPECTION:
+    ENABLED           Turns QueryInspectionMiddleware on (off in production; capturing stacks is not free)
+    REPEAT_THRESHOLD  Same-shape queries per request reported as N+1
+    SLOW_QUERY_MS     Queries slower than this are logged with their stack
+
+Tests use the `assert_no_n_plus_one` fixture from loyalty/tests/conftest.py:
+
+    def test_list(auth_client, assert_no_n_plus_one):
+        with assert_no_n_plus_one():
+            auth_client.get(...)
+"""
+import logging
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('loyalty.queries')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'REPEAT_THRESHOLD': 3,
+    'SLOW_QUERY_MS': 100,
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|0)\s*,?)+\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+_PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+_THIS_FILE = str(Path(__file__).resolve())
+
+
+def inspection_settings():
+    return {**DEFAULTS, **getattr(settings, 'LOYALTY_QUERY_INSPECTION', {})}
+
+
+def sql_shape(sql):
+    """ SQL with literals replaced and IN-lists collapsed, so queries differing only in values match """
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('0', shape)
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def project_stack(limit=6):
+    """ The innermost project frames (no Django, DRF or site-packages) that led to the current query """
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(_PROJECT_ROOT) and frame.filename != _THIS_FILE
+        and 'site-packages' not in frame.filename
+    ]
+    return traceback.format_list(frames[-limit:])
+
+
+@dataclass
+class RepeatedQuery:
+    shape: str
+    count: int = 0
+    seconds: float = 0.0
+    stack: list = field(default_factory=list)  # Stack of the first occurrence
+
+    def __str__(self):
+        return (f"{self.count} queries ({self.seconds * 1000:.1f} ms) with the same shape:\n    {self.shape}\n"
+                f"  first issued from:\n{''.join(self.stack)}")
+
+
+class QueryInspector:
+    """ execute_wrapper grouping queries by shape; use through `inspect_queries()` """
+
+    def __init__(self, repeat_threshold=None, slow_query_ms=None):
+        config = inspection_settings()
+        self.repeat_threshold = repeat_threshold or config['REPEAT_THRESHOLD']
+        self.slow_seconds = (slow_query_ms if slow_query_ms is not None else config['SLOW_QUERY_MS']) / 1000
+        self.queries = {}  # shape -> RepeatedQuery
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.record(sql, params, duration)
+
+    def record(self, sql, params, duration):
+        self.count += 1
+        shape = sql_shape(sql)
+        if shape.startswith(_IGNORED):
+            return
+        entry = self.queries.get(shape)
+        if entry is None:
+            entry = self.queries[shape] = RepeatedQuery(shape, stack=project_stack())
+        entry.count += 1
+        entry.seconds += duration
+
+        if duration >= self.slow_seconds:
+            logger.warning("Slow query (%.1f ms): %s\nparams: %r\n%s",
+                           duration * 1000, sql, params, ''.join(project_stack()))
+
+    def repeated(self):
+        """ Shapes seen at least `repeat_threshold` times, most frequent first """
+        return sorted((entry for entry in self.queries.values() if entry.count >= self.repeat_threshold),
+                      key=lambda entry: -entry.count)
+
+
+@contextmanager
+def inspect_queries(**options):
+    """ Record queries on every configured database while the block runs """
+    inspector = QueryInspector(**options)
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(inspector))
+        yield inspector
+
+
+class QueryInspectionMiddleware:
+    """ Logs suspected N+1 queries per request; removes itself unless LOYALTY_QUERY_INSPECTION['ENABLED'] """
+
+    def __init__(self, get_response):
+        if not inspection_settings()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with inspect_queries() as inspector:
+            response = self.get_response(request)
+
+        for entry in inspector.repeated():
+            logger.warning("Possible N+1 in %s %s: %s", request.method, request.path, entry)
+        response['X-Query-Count'] = str(inspector.count)
+        return response
@@ -0,0 +1,199 @@
+"""
+Special task conditions, compiled into predicates.
+
+A task's `conditions` declare which transactions count towards it, e.g.
+    {"transaction_types": ["earn"], "min_points": 50, "hours": [17, 22], "weekdays": [5, 6]}
+An empty dict keeps the original rule: every earn transaction counts.
+
+The conditions of a program's tasks are compiled once into plain Python predicates and kept in
+process memory per (program, config_version). Saving or deleting a SpecialTask bumps the program's
+config version, which every evaluation reads from the database (one primary-key lookup), so the
+next evaluation in any worker recompiles; until then the tasks' conditions are not read at all.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+
+from .cache import get_program_config_version
+from .models import SpecialTask
+
+TRANSACTION_TYPES = ('earn', 'redeem')
+DEFAULT_CONDITIONS = {'transaction_types': ['earn']}
+
+_compiled = OrderedDict()  # program_id -> (config_version, ProgramRules), least recently used first
+_lock = threading.Lock()
+
+
+def compiled_rules_max():
+    return getattr(settings, 'LOYALTY_COMPILED_RULES_MAX', 1024)
+
+
+def normalize_conditions(conditions):
+    """
+    Validate task conditions and return them in canonical form, raising ValueError on bad input.
+        transaction_types: list of 'earn' / 'redeem' (default ['earn'])
+        min_points / max_points: bounds on the transaction's points, inclusive
+        hours: [from, to] UTC hours, from inclusive and to exclusive; wraps past midnight when from > to
+        weekdays: list of UTC weekdays, 0 = Monday
+    """
+    if conditions is None:
+        conditions = {}
+    if not isinstance(conditions, dict):
+        raise ValueError("Conditions must be an object.")
+    unknown = set(conditions) - {'transaction_types', 'min_points', 'max_points', 'hours', 'weekdays'}
+    if unknown:
+        raise ValueError(f"Unknown condition(s): {', '.join(sorted(unknown))}.")
+
+    normalized = dict(DEFAULT_CONDITIONS)
+    if 'transaction_types' in conditions:
+        types = conditions['transaction_types']
+        if not isinstance(types, list) or not types or any(kind not in TRANSACTION_TYPES for kind in types):
+            raise ValueError(f"transaction_types must be a non-empty list of {', '.join(TRANSACTION_TYPES)}.")
+        normalized['transaction_types'] = sorted(set(types))
+    for key in ('min_points', 'max_points'):
+        if conditions.get(key) is not None:
+            if not _is_int(conditions[key]) or conditions[key] < 0:
+                raise ValueError(f"{key} must be a non-negative integer.")
+            normalized[key] = conditions[key]
+    if normalized.get('min_points', 0) > normalized.get('max_points', float('inf')):
+        raise ValueError("min_points cannot be greater than max_points.")
+    if conditions.get('hours') is not None:
+        hours = conditions['hours']
+        if (not isinstance(hours, list) or len(hours) != 2 or not all(_is_int(hour) for hour in hours)
+                or not 0 <= hours[0] <= 23 or not 0 <= hours[1] <= 24 or hours[0] == hours[1]):
+            raise ValueError("hours must be [from, to] with 0 <= from <= 23, 0 <= to <= 24 and from != to.")
+        normalized['hours'] = list(hours)
+    if conditions.get('weekdays') is not None:
+        weekdays = conditions['weekdays']
+        if not isinstance(weekdays, list) or not weekdays or not all(
+                _is_int(day) and 0 <= day <= 6 for day in weekdays):
+            raise ValueError("weekdays must be a non-empty list of integers from 0 (Monday) to 6.")
+        normalized['weekdays'] = sorted(set(weekdays))
+    return normalized
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def compile_conditions(conditions):
+    """
+    Turn task conditions into a predicate `transaction -> bool`.
+    Only the checks a task actually declares end up in the predicate.
+    """
+    conditions = normalize_conditions(conditions)
+    checks = []
+
+    types = frozenset(conditions['transaction_types'])
+    if len(types) == 1:
+        (kind,) = types
+        checks.append(lambda transaction: transaction.transaction_type == kind)
+    elif types != frozenset(TRANSACTION_TYPES):
+        checks.append(lambda transaction: transaction.transaction_type in types)
+
+    if 'min_points' in conditions:
+        low = conditions['min_points']
+        checks.append(lambda transaction: transaction.points >= low)
+    if 'max_points' in conditions:
+        high = conditions['max_points']
+        checks.append(lambda transaction: transaction.points <= high)
+
+    if 'hours' in conditions:
+        start, end = conditions['hours']
+        if start < end:
+            checks.append(lambda transaction: start <= _utc(transaction).hour < end)
+        else:  # e.g. [22, 6]: late evening and early morning
+            checks.append(lambda transaction: not end <= _utc(transaction).hour < start)
+    if 'weekdays' in conditions:
+        weekdays = frozenset(conditions['weekdays'])
+        checks.append(lambda transaction: _utc(transaction).weekday() in weekdays)
+
+    if not checks:
+        return lambda transaction: True
+    if len(checks) == 1:
+        return checks[0]
+    return lambda transaction: all(check(transaction) for check in checks)
+
+
+def filter_by_conditions(transactions, conditions):
+    """
+    The same conditions applied in SQL to a Transaction queryset, for evaluating history in bulk.
+    Hours and weekdays are extracted in UTC like the compiled predicates.
+    """
+    conditions = normalize_conditions(conditions)
+    transactions = transactions.filter(transaction_type__in=conditions['transaction_types'])
+    if 'min_points' in conditions:
+        transactions = transactions.filter(points__gte=conditions['min_points'])
+    if 'max_points' in conditions:
+        transactions = transactions.filter(points__lte=conditions['max_points'])
+    if 'hours' in conditions:
+        start, end = conditions['hours']
+        transactions = transactions.annotate(utc_hour=ExtractHour('timestamp', tzinfo=dt_timezone.utc))
+        if start < end:
+            transactions = transactions.filter(utc_hour__gte=start, utc_hour__lt=end)
+        else:
+            transactions = transactions.exclude(utc_hour__gte=end, utc_hour__lt=start)
+    if 'weekdays' in conditions:
+        transactions = transactions.annotate(utc_weekday=ExtractIsoWeekDay('timestamp', tzinfo=dt_timezone.utc))
+        iso_weekdays = [day + 1 for day in conditions['weekdays']]  # ISO weekdays start at Monday = 1
+        transactions = transactions.filter(utc_weekday__in=iso_weekdays)
+    return transactions
+
+
+def _utc(transaction):
+    return transaction.timestamp.astimezone(dt_timezone.utc)
+
+
+class ProgramRules:
+    """
+    The compiled conditions of one program's tasks.
+    Tasks declaring the same conditions share one predicate, so a transaction is tested once per
+    distinct rule rather than once per task.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        groups = {}
+        for task in self.tasks:
+            conditions = normalize_conditions(task.conditions)
+            key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                               for name, value in conditions.items()))
+            if key not in groups:
+                groups[key] = (compile_conditions(conditions), [])
+            groups[key][1].append(task)
+        self.groups = [(predicate, tuple(grouped)) for predicate, grouped in groups.values()]
+
+    def tasks_advanced_by(self, transaction):
+        """ Tasks the transaction counts towards """
+        return [task for predicate, tasks in self.groups if predicate(transaction) for task in tasks]
+
+
+def program_rules(program_id):
+    """
+    Compiled rules of a program for its current config version.
+    Tasks are read (on the current shard) only when the version changed since the last compilation.
+    """
+    version = get_program_config_version(program_id)
+    with _lock:
+        entry = _compiled.get(program_id)
+        if entry is not None and version is not None and entry[0] == version:
+            _compiled.move_to_end(program_id)
+            return entry[1]
+
+    rules = ProgramRules(SpecialTask.objects.filter(program_id=program_id).order_by('id'))
+    if version is not None:
+        with _lock:
+            _compiled[program_id] = (version, rules)
+            _compiled.move_to_end(program_id)
+            while len(_compiled) > compiled_rules_max():
+                _compiled.popitem(last=False)
+    return rules
+
+
+def reset_compiled_rules():
+    """ Forget every compiled program (tests, or after a bulk change bypassing the config version) """
+    with _lock:
+        _compiled.clear()
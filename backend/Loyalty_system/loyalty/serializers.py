@@ -1,5 +1,8 @@
 from rest_framework import serializers
-from .models import LoyaltyProgram, PointBalance, Transaction, LoyaltyTier, UserTaskProgress, SpecialTask
+from .api_keys import SCOPES
+from .models import LoyaltyProgram, PointBalance, Transaction, LoyaltyTier, UserTaskProgress, SpecialTask, \
+    ProgramAggregate, ProgramApiKey, TaskRebuildJob
+from .rules import normalize_conditions
 
 
 from django.contrib.auth.models import User
@@ -21,20 +24,85 @@ class LoyaltyProgramSerializer(serializers.ModelSerializer):
     class Meta:
         model = LoyaltyProgram
         fields = '__all__'
-        read_only_fields = ['owner']  #
+        read_only_fields = ['owner', 'config_version', 'archived_before']
+
+
+class ProgramApiKeySerializer(serializers.ModelSerializer):
+    """
+    A program API key without its secret part; the key string is only returned when issued.
+    """
+    scopes = serializers.ListField(child=serializers.ChoiceField(choices=SCOPES), min_length=1)
+
+    class Meta:
+        model = ProgramApiKey
+        fields = ['key_id', 'name', 'scopes', 'created_at', 'expires_at', 'revoked_at']
+        read_only_fields = ['key_id', 'created_at', 'revoked_at']
 
 
 class PointBalanceSerializer(serializers.ModelSerializer):
     tier = serializers.SerializerMethodField()
 
     def get_tier(self, obj):
-        return obj.get_loyalty_tier()  #  Include tier dynamically
+        tier_name = getattr(obj, 'tier_name', None)  # Set by PointBalance.objects.with_tier()
+        return tier_name if tier_name is not None else obj.get_loyalty_tier()  #  Include tier dynamically
 
     class Meta:
         model = PointBalance
         fields = ['id', 'user_id', 'balance', 'program', 'tier']
 
 
+class TaskRebuildJobSerializer(serializers.ModelSerializer):
+    """
+    State of a queued task progress rebuild, for polling.
+    """
+    class Meta:
+        model = TaskRebuildJob
+        fields = ['id', 'task', 'status', 'members', 'completed', 'attempts', 'last_error', 'created_at',
+                  'updated_at']
+
+
+class ProgramLiabilitySerializer(serializers.ModelSerializer):
+    """
+    Points liability of a program, read from its running aggregates.
+    """
+    class Meta:
+        model = ProgramAggregate
+        fields = ['program', 'outstanding_points', 'lifetime_earned', 'lifetime_redeemed', 'member_count',
+                  'updated_at']
+
+
+class BulkPointBalanceLookupSerializer(serializers.Serializer):
+    """
+    Input for the bulk balance lookup.
+    `program_ids` is optional: without it a member is looked up across all of the owner's programs.
+    """
+    user_ids = serializers.ListField(child=serializers.CharField(max_length=255), min_length=1, max_length=1000)
+    program_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+
+
+class MemberFilterSerializer(serializers.Serializer):
+    """
+    Query parameters of the program member listing.
+    """
+    ORDERING_CHOICES = ['user_id', 'balance', '-balance', 'total_points_earned', '-total_points_earned']
+
+    min_balance = serializers.IntegerField(required=False)
+    max_balance = serializers.IntegerField(required=False)
+    min_total_earned = serializers.IntegerField(required=False)
+    max_total_earned = serializers.IntegerField(required=False)
+    tier = serializers.CharField(required=False, max_length=40)
+    ordering = serializers.ChoiceField(choices=ORDERING_CHOICES, required=False, default='user_id')
+
+
+class MemberSummaryQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the member summary.
+    """
+    user_id = serializers.CharField(max_length=255)
+    program_id = serializers.IntegerField()
+    transactions = serializers.IntegerField(required=False, default=10, min_value=0, max_value=100)
+
+
 class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
@@ -67,6 +135,29 @@ class SpecialTaskSerializer(serializers.ModelSerializer):
         model = SpecialTask
         fields = '__all__'
 
+    def validate_conditions(self, value):
+        """ Conditions are stored in canonical form, so they compile exactly as validated """
+        try:
+            return normalize_conditions(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class SpecialTaskBulkSerializer(SpecialTaskSerializer):
+    """
+    Items of the special task bulk endpoint; their program is given once for the whole payload.
+    """
+    class Meta(SpecialTaskSerializer.Meta):
+        read_only_fields = ['program']
+
+
+class ProgramBulkSerializer(serializers.Serializer):
+    """
+    Payload of the tier / task bulk endpoints: one program and its items.
+    """
+    program = serializers.IntegerField()
+    items = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=1000)
+
 
 class UserTaskProgressSerializer(serializers.ModelSerializer):
     """
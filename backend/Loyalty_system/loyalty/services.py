@@ -1,6 +1,26 @@
-from .models import PointBalance, Transaction, LoyaltyProgram, UserTaskProgress, SpecialTask
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
 
+from django.db import router, transaction as db_transaction
+from django.db.models import Count, FilteredRelation, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import now
 
+from .fast_serializers import serialize_transactions
+from .metrics import timed
+from .models import PointBalance, Transaction, LoyaltyProgram, UserTaskProgress, SpecialTask, TaskProgressJob, \
+    TaskRebuildJob, ProgramAggregate, TaskProgressBucket, LoyaltyTier, OutboxEvent, TierPointsBucket
+from .rules import filter_by_conditions, program_rules
+from .sharding import directory_entry, is_sharded, moving_program_ids, shard_aliases, shard_for_program, \
+    use_program_shard, use_shard
+
+logger = logging.getLogger(__name__)
+
+TASK_PROGRESS_MAX_ATTEMPTS = 5  # Jobs are parked as 'failed' after this many errors
+
+
+@timed('earn_points')
 def earn_points(user_id, program_id, points):
     """Earn points for a user in a loyalty program."""
     balance, _ = PointBalance.objects.get_or_create(user_id=user_id, program_id=program_id)
@@ -8,38 +28,559 @@ def earn_points(user_id, program_id, points):
     balance.add_points(points)  # This updates balance and total_points_earned
     return balance
 
+@timed('redeem_points')
 def redeem_points(user_id, program_id, points):
     """Redeem points for a user in a loyalty program."""
     balance = PointBalance.objects.get(user_id=user_id, program_id=program_id)
 
-    if balance.balance < points:
-        raise ValueError("Insufficient points")
-
-    balance.redeem_points(points)
+    balance.redeem_points(points)  # Checks the balance under a row lock
     return balance
 
 
+AGGREGATE_TOTALS = ('outstanding_points', 'lifetime_earned', 'lifetime_redeemed', 'member_count')
+
+
+def program_liability(program_id):
+    """ Outstanding points and lifetime totals of a program: the sum of its ProgramAggregate rows, unsaved """
+    totals = ProgramAggregate.objects.filter(program_id=program_id).aggregate(
+        **{field: Sum(field, default=0) for field in AGGREGATE_TOTALS}, updated_at=Max('updated_at'))
+    return ProgramAggregate(program_id=program_id, **totals)
+
+
+def member_summary(balance, recent=10):
+    """
+    A member's wallet: balance, tier and the points still missing to the next one, the `recent`
+    latest transactions and progress on the program's tasks the member hasn't completed yet.
+    Three queries (tiers, transactions, tasks with the member's progress) whatever their number.
+    """
+    tiers = list(LoyaltyTier.objects.filter(program_id=balance.program_id).order_by('points_to_reach').values_list(
+        'tier_name', 'points_to_reach'))
+    points = balance.tier_points
+    reached = [name for name, points_to_reach in tiers if points_to_reach <= points]
+    upcoming = [(name, points_to_reach) for name, points_to_reach in tiers if points_to_reach > points]
+
+    transactions = Transaction.objects.filter(program_id=balance.program_id, user_id=balance.user_id).order_by(
+        '-timestamp', '-id')[:recent]
+    tasks = SpecialTask.objects.filter(program_id=balance.program_id).annotate(
+        progress=FilteredRelation('user_progress', condition=Q(user_progress__user_id=balance.user_id)),
+    ).filter(progress__completed_at__isnull=True).order_by('id').values_list(
+        'id', 'name', 'description', 'points_required', 'transactions_required', 'reward_points',
+        'progress__points_earned', 'progress__transactions_count')
+
+    return {
+        'user_id': balance.user_id,
+        'program': balance.program_id,
+        'balance': balance.balance,
+        'total_points_earned': balance.total_points_earned,
+        'qualifying_points': balance.qualifying_points,
+        'tier': reached[-1] if reached else "No Tier",
+        'next_tier': upcoming[0][0] if upcoming else None,
+        'points_to_next_tier': upcoming[0][1] - points if upcoming else None,
+        'recent_transactions': serialize_transactions(transactions),
+        'tasks': [
+            {
+                'task': task_id,
+                'task_name': name,
+                'task_description': description,
+                'points_earned': points_earned or 0,
+                'points_required': points_required,
+                'transactions_count': transactions_count or 0,
+                'transactions_required': transactions_required,
+                'reward_points': reward_points,
+                'percent': task_completion_percent(points_earned or 0, points_required, transactions_count or 0,
+                                                   transactions_required),
+            }
+            for task_id, name, description, points_required, transactions_required, reward_points, points_earned,
+            transactions_count in tasks
+        ],
+    }
+
+
+def task_completion_percent(points_earned, points_required, transactions_count, transactions_required):
+    """ Progress towards a task as a whole percentage: the least advanced of its requirements, capped at 100 """
+    ratios = [min(done / required, 1) for done, required in ((points_earned, points_required),
+                                                              (transactions_count, transactions_required)) if required]
+    return int(min(ratios, default=1) * 100)
+
+
+def reconcile_program_aggregate(program_id):
+    """
+    Recompute a program's aggregates from its balances and return the drift that was corrected
+    as {field: stored - actual}. All of the program's aggregate rows are locked first, so balance
+    changes committed later still add their delta on top of the recomputed totals; the totals are
+    written to slot 0 and the other rows are reset.
+    """
+    using = router.db_for_write(ProgramAggregate)
+    with db_transaction.atomic(using=using):
+        rows = ProgramAggregate.objects.using(using).filter(program_id=program_id)
+        ProgramAggregate.objects.using(using).bulk_create([ProgramAggregate(program_id=program_id, slot=0)],
+                                                          ignore_conflicts=True)
+        stored = {field: 0 for field in AGGREGATE_TOTALS}
+        for row in rows.select_for_update().order_by('slot'):  # One lock order, whatever the caller
+            for field in AGGREGATE_TOTALS:
+                stored[field] += getattr(row, field)
+        totals = PointBalance.objects.using(using).filter(program_id=program_id).aggregate(
+            outstanding=Sum('balance', default=0), earned=Sum('total_points_earned', default=0), members=Count('id'))
+        actual = {
+            'outstanding_points': totals['outstanding'],
+            'lifetime_earned': totals['earned'],
+            'lifetime_redeemed': totals['earned'] - totals['outstanding'],
+            'member_count': totals['members'],
+        }
+        drift = {field: stored[field] - value for field, value in actual.items() if stored[field] != value}
+        if drift:
+            rows.filter(slot=0).update(**actual, updated_at=now())
+            rows.exclude(slot=0).update(**{field: 0 for field in AGGREGATE_TOTALS}, updated_at=now())
+    return drift
+
+
+def tier_window_start(months, today=None):
+    """ First day of the oldest month of a tier window: the current UTC month and the `months - 1` before it """
+    today = today or now().astimezone(dt_timezone.utc).date()
+    index = today.year * 12 + today.month - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def requalify_tiers(program_ids=None, chunk_size=5000, today=None):
+    """
+    Recompute the qualifying points, and so the tiers, of members of programs with a tier window,
+    shard by shard. Members of programs whose window was removed go back to lifetime points.
+    Returns (members whose qualifying points changed, tier changes).
+    """
+    windows = dict(LoyaltyProgram.objects.filter(tier_window_months__isnull=False).values_list(
+        'id', 'tier_window_months'))
+    moving = moving_program_ids()
+    changed = tier_changes = 0
+    for alias in shard_aliases():
+        with use_shard(alias):
+            candidates = set(windows) | set(PointBalance.objects.filter(qualifying_points__isnull=False).order_by()
+                                            .values_list('program_id', flat=True).distinct())
+            if program_ids:
+                candidates &= set(program_ids)
+            for program_id in sorted(candidates - set(moving)):
+                if is_sharded() and directory_entry(program_id) != (alias, 'active'):
+                    continue  # Lives on another shard, or left behind by a move
+                counts = requalify_program_tiers(program_id, windows.get(program_id), chunk_size, today)
+                changed += counts[0]
+                tier_changes += counts[1]
+    return changed, tier_changes
+
+
+def requalify_program_tiers(program_id, months, chunk_size=5000, today=None):
+    """
+    requalify_tiers() for one program on the current shard. Members are walked in keyset chunks;
+    per chunk the balances are locked, the window's monthly buckets summed in one GROUP BY and the
+    changes written with one bulk UPDATE, plus `tier.changed` events for members who moved tier.
+    """
+    since = tier_window_start(months, today) if months else None
+    tiers = list(LoyaltyTier.objects.filter(program_id=program_id).order_by('-points_to_reach').values_list(
+        'tier_name', 'points_to_reach'))
+
+    def tier_of(points):
+        return next((name for name, points_to_reach in tiers if points_to_reach <= points), None)
+
+    members = PointBalance.objects.filter(program_id=program_id).order_by('user_id')
+    if not months:
+        members = members.filter(qualifying_points__isnull=False)  # Back to lifetime points
+    user_ids = members.values_list('user_id', flat=True)
+
+    changed = tier_changes = 0
+    last = None
+    while True:
+        chunk = list((user_ids if last is None else user_ids.filter(user_id__gt=last))[:chunk_size])
+        if not chunk:
+            break
+        last = chunk[-1]
+        with db_transaction.atomic(using=router.db_for_write(PointBalance)):
+            balances = list(PointBalance.objects.select_for_update().filter(program_id=program_id, user_id__in=chunk)
+                            .only('user_id', 'total_points_earned', 'qualifying_points', 'version').order_by('id'))
+            totals = {}
+            if months:
+                totals = dict(TierPointsBucket.objects.filter(program_id=program_id, user_id__in=chunk,
+                                                              month__gte=since)
+                              .values('user_id').annotate(total=Sum('points')).values_list('user_id', 'total'))
+            updates, events = [], []
+            for balance in balances:
+                qualifying = totals.get(balance.user_id, 0) if months else None
+                if qualifying == balance.qualifying_points:
+                    continue
+                previous_tier = tier_of(balance.tier_points)
+                balance.qualifying_points = qualifying
+                balance.version += 1  # Cached copies (ETags) are stale
+                updates.append(balance)
+                tier = tier_of(balance.tier_points)
+                if tier != previous_tier:
+                    events.append(OutboxEvent(program_id=program_id, event_type='tier.changed',
+                                              payload=balance.tier_change_payload(previous_tier, tier)))
+            PointBalance.objects.bulk_update(updates, ['qualifying_points', 'version'])
+            OutboxEvent.objects.bulk_create(events)
+        changed += len(updates)
+        tier_changes += len(events)
+    return changed, tier_changes
+
+
+def compact_tier_buckets(today=None):
+    """ Delete monthly tier buckets older than the longest allowed tier window, on every shard """
+    oldest = tier_window_start(LoyaltyProgram.TIER_WINDOW_MAX_MONTHS, today)
+    return sum(TierPointsBucket.objects.using(alias).filter(month__lt=oldest).delete()[0]
+               for alias in shard_aliases())
+
+
 def update_task_progress_for_transaction(transaction):
     """ Updates the user's task progress when a transaction is created. """
+    update_task_progress_for_transactions(transaction.program_id, [transaction])
 
 
-    user_id = transaction.user_id
+@timed('update_task_progress')
+def update_task_progress_for_transactions(program_id, transactions):
+    """
+    Updates task progress for a batch of transactions belonging to one program.
+    The program's compiled rules decide which tasks each transaction advances before anything is
+    written; every affected progress row is then written in bulk.
+    Rolling-window tasks count daily buckets instead, and their progress shows the current window.
+    Progress rows are only built for tasks that still exist when the write starts.
+    """
+    rules = program_rules(program_id)
+    if not rules.tasks or not transactions:
+        return
 
-    #  Retrieve all special tasks for this program
-    special_tasks = SpecialTask.objects.filter(program=transaction.program)
+    #  Sum matching points and transactions per (user, task), and per (user, task, day) for rolling tasks
+    deltas = defaultdict(lambda: [0, 0])
+    daily = defaultdict(lambda: [0, 0])
+    window_ends = {}
+    for transaction in transactions:
+        day = bucket_day(transaction.timestamp)
+        window_ends[transaction.user_id] = max(window_ends.get(transaction.user_id, day), day)
+        for task in rules.tasks_advanced_by(transaction):
+            if task.rolling_window:
+                delta = daily[transaction.user_id, task.id, day]
+            else:
+                delta = deltas[transaction.user_id, task.id]
+            delta[0] += transaction.points
+            delta[1] += 1  # Assume each transaction counts as one
 
-    for task in special_tasks:
-        #  Get or create progress entry for this user and task
-        progress, created = UserTaskProgress.objects.get_or_create(
-            user_id=user_id, task=task
+    with db_transaction.atomic(using=router.db_for_write(UserTaskProgress)):
+        #  The rules may predate a task's deletion; its rows would fail the foreign key check at commit
+        existing = set(SpecialTask.objects.filter(id__in=[task.id for task in rules.tasks]).values_list(
+            'id', flat=True))
+        special_tasks = [task for task in rules.tasks if task.id in existing]
+        if not special_tasks:
+            return
+        #  Make sure every (user, task) pair has a progress row, then lock them all
+        UserTaskProgress.objects.bulk_create(
+            [UserTaskProgress(user_id=user_id, task_id=task.id) for user_id in window_ends for task in special_tasks],
+            ignore_conflicts=True,
+        )
+        progress_rows = list(
+            UserTaskProgress.objects.select_for_update()
+            .filter(user_id__in=window_ends.keys(), task__in=special_tasks)
+            .order_by('id')
         )
 
-        #  Update points and transaction count
-        if transaction.transaction_type == "earn":
-            progress.points_earned += transaction.points
-            progress.transactions_count += 1  # Assume each transaction counts as one
+        rolling_tasks = [task for task in special_tasks if task.rolling_window]
+        windows = record_task_buckets(rolling_tasks, daily, window_ends) if rolling_tasks else {}
+
+        tasks_by_id = {task.id: task for task in special_tasks}
+        for progress in progress_rows:
+            progress.task = tasks_by_id[progress.task_id]
+            if progress.task.rolling_window:
+                progress.points_earned, progress.transactions_count = windows.get(
+                    (progress.user_id, progress.task_id), (0, 0))
+                continue
+            points, count = deltas.get((progress.user_id, progress.task_id), (0, 0))
+            progress.points_earned += points
+            progress.transactions_count += count
+
+        UserTaskProgress.objects.bulk_update(progress_rows, ['points_earned', 'transactions_count'])
+
+        #  Check if any task is now completed
+        for progress in progress_rows:
+            progress.reward_user()
+
+
+def bucket_day(timestamp):
+    """ UTC day a transaction is counted on """
+    return timestamp.astimezone(dt_timezone.utc).date()
+
+
+def record_task_buckets(tasks, daily, window_ends):
+    """
+    Add per-day activity {(user_id, task_id, day): [points, transactions]} to the members' buckets of
+    rolling-window tasks and return the window totals {(user_id, task_id): (points, transactions)}.
+    Each member's window is the `duration_days` days ending on their latest transaction day, so
+    a total costs at most `duration_days` bucket rows however long the member has been active.
+    """
+    user_ids = list(window_ends)
+    if daily:
+        TaskProgressBucket.objects.bulk_create(
+            [TaskProgressBucket(user_id=user_id, task_id=task_id, day=day) for user_id, task_id, day in daily],
+            ignore_conflicts=True,
+        )
+        buckets = list(
+            TaskProgressBucket.objects.select_for_update()
+            .filter(task_id__in={task_id for _, task_id, _ in daily}, user_id__in={user_id for user_id, _, _ in daily},
+                    day__in={day for _, _, day in daily})
+            .order_by('id')
+        )
+        changed = []
+        for bucket in buckets:
+            activity = daily.get((bucket.user_id, bucket.task_id, bucket.day))
+            if activity:
+                bucket.points += activity[0]
+                bucket.transactions += activity[1]
+                changed.append(bucket)
+        TaskProgressBucket.objects.bulk_update(changed, ['points', 'transactions'])
+
+    tasks_by_id = {task.id: task for task in tasks}
+    oldest = min(window_ends.values()) - timedelta(days=max(task.duration_days for task in tasks))
+    totals = defaultdict(lambda: [0, 0])
+    for user_id, task_id, day, points, count in TaskProgressBucket.objects.filter(
+            task__in=tasks, user_id__in=user_ids, day__gt=oldest).values_list(
+            'user_id', 'task_id', 'day', 'points', 'transactions'):
+        end = window_ends[user_id]
+        if end - timedelta(days=tasks_by_id[task_id].duration_days) < day <= end:
+            total = totals[user_id, task_id]
+            total[0] += points
+            total[1] += count
+    return {key: tuple(total) for key, total in totals.items()}
+
+
+def compact_task_buckets(today=None, chunk_size=5000):
+    """
+    Delete buckets that fell out of their task's window (and buckets of tasks no longer windowed),
+    shard by shard and in chunks. Returns the number of deleted buckets.
+    """
+    today = today or now().astimezone(dt_timezone.utc).date()
+    deleted = 0
+    for alias in shard_aliases():
+        buckets = TaskProgressBucket.objects.using(alias)
+        expired = [buckets.filter(task__rolling_window=False)]
+        for task_id, duration_days in SpecialTask.objects.using(alias).filter(rolling_window=True).values_list(
+                'id', 'duration_days'):
+            expired.append(buckets.filter(task_id=task_id, day__lte=today - timedelta(days=duration_days)))
+        for queryset in expired:
+            while True:
+                ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                deleted += buckets.filter(id__in=ids).delete()[0]
+    return deleted
+
+
+def rebuild_task_progress(task, chunk_size=5000, today=None):
+    """
+    Recompute every member's progress on a task from the transaction ledger, so members get credit
+    for activity from before the task was created or its conditions changed.
+    Matching transactions of the last `duration_days` UTC days count (the window of rolling tasks).
+    Members are walked in keyset chunks of `chunk_size` user ids; each chunk is one GROUP BY over
+    the ledger and one bulk upsert, in its own transaction. Transactions still queued for the worker
+    are left to it. Returns (members, newly completed).
+    The API queues a TaskRebuildJob instead, drained by the worker (process_task_rebuild_jobs).
+    """
+    since = rebuild_since(task, today)
+    members = completed = 0
+    last = None
+    with use_program_shard(task.program_id):
+        alias = router.db_for_write(UserTaskProgress)
+        while True:
+            chunk = next_rebuild_chunk(task, alias, last, chunk_size)
+            if not chunk:
+                break
+            members += len(chunk)
+            completed += rebuild_task_progress_chunk(task, alias, chunk, since)
+            last = chunk[-1]
+    return members, completed
+
+
+def rebuild_since(task, today=None):
+    """ Start of the window a rebuild counts: the last `duration_days` UTC days up to `today` """
+    today = today or now().astimezone(dt_timezone.utc).date()
+    return datetime.combine(today - timedelta(days=task.duration_days - 1), time.min, tzinfo=dt_timezone.utc)
+
+
+def next_rebuild_chunk(task, alias, last, chunk_size):
+    """ The next `chunk_size` member user ids of the task's program after `last`, sorted """
+    user_ids = PointBalance.objects.using(alias).filter(program_id=task.program_id).order_by(
+        'user_id').values_list('user_id', flat=True)
+    if last is not None:
+        user_ids = user_ids.filter(user_id__gt=last)
+    return list(user_ids[:chunk_size])
+
+
+def enqueue_task_rebuild(task):
+    """ Queue a rebuild of the task's progress, or return the one already queued or running """
+    with use_program_shard(task.program_id):
+        job = TaskRebuildJob.objects.filter(task=task, status__in=('pending', 'running')).order_by('id').first()
+        return job or TaskRebuildJob.objects.create(task=task, program_id=task.program_id)
+
+
+def process_task_rebuild_jobs(max_chunks=10, chunk_size=5000):
+    """
+    Run up to `max_chunks` chunks of queued task rebuilds per shard, oldest job first, and return
+    the number of chunks run. Each chunk locks its job row (SKIP LOCKED, so workers share the queue)
+    and advances the job's cursor in the chunk's transaction. Jobs of programs being moved wait.
+    """
+    moving = moving_program_ids()
+    chunks = 0
+    for alias in shard_aliases():
+        with use_shard(alias):
+            for _ in range(max_chunks):
+                if not run_task_rebuild_chunk(alias, chunk_size, moving):
+                    break
+                chunks += 1
+    return chunks
+
+
+def run_task_rebuild_chunk(alias, chunk_size, skip_program_ids=()):
+    """ One chunk of the oldest unfinished rebuild job on the database; False when there is none """
+    with db_transaction.atomic(using=alias):
+        jobs = TaskRebuildJob.objects.using(alias).select_for_update(skip_locked=True, of=('self',)).filter(
+            status__in=('pending', 'running'))
+        if skip_program_ids:
+            jobs = jobs.exclude(program_id__in=skip_program_ids)
+        job = jobs.select_related('task').order_by('id').first()
+        if job is None:
+            return False
+        try:
+            with db_transaction.atomic(using=alias):  # Savepoint: a failed chunk keeps the cursor
+                chunk = next_rebuild_chunk(job.task, alias, job.last_user_id, chunk_size)
+                if chunk:
+                    since = rebuild_since(job.task, job.created_at.astimezone(dt_timezone.utc).date())
+                    job.completed += rebuild_task_progress_chunk(job.task, alias, chunk, since)
+                    job.members += len(chunk)
+                    job.last_user_id = chunk[-1]
+                job.status = 'running' if chunk else 'done'
+        except Exception as e:
+            logger.exception("Rebuild of task %s failed", job.task_id)
+            record_job_failure([job], e)  # Retried from the same cursor until out of attempts
+        job.save(using=alias)
+    return True
+
+
+def rebuild_task_progress_chunk(task, alias, user_ids, since):
+    """ One chunk of rebuild_task_progress() for the sorted `user_ids`; returns the number of completions """
+    progress = UserTaskProgress.objects.using(alias)
+    with db_transaction.atomic(using=alias):
+        #  Lock the chunk's progress rows first: a worker holding them commits before the ledger is read
+        progress.bulk_create([UserTaskProgress(user_id=user_id, task_id=task.id) for user_id in user_ids],
+                             ignore_conflicts=True)
+        list(progress.select_for_update().filter(task=task, user_id__in=user_ids).order_by('id').values_list('id'))
+
+        ledger = filter_by_conditions(
+            Transaction.objects.using(alias).filter(program_id=task.program_id, timestamp__gte=since,
+                                                    user_id__gte=user_ids[0], user_id__lte=user_ids[-1]),
+            task.conditions,
+        ).exclude(id__in=TaskProgressJob.objects.using(alias).filter(
+            program_id=task.program_id, status='pending').values('transaction_id')).order_by()
+
+        totals = defaultdict(lambda: [0, 0])
+        if task.rolling_window:
+            daily = list(ledger.annotate(day=TruncDate('timestamp', tzinfo=dt_timezone.utc)).values(
+                'user_id', 'day').annotate(points=Sum('points'), transactions=Count('id')))
+            TaskProgressBucket.objects.using(alias).filter(task=task, user_id__in=user_ids).delete()
+            TaskProgressBucket.objects.using(alias).bulk_create(
+                [TaskProgressBucket(user_id=row['user_id'], task_id=task.id, day=row['day'], points=row['points'],
+                                    transactions=row['transactions']) for row in daily])
+        else:
+            daily = ledger.values('user_id').annotate(points=Sum('points'), transactions=Count('id'))
+        for row in daily:
+            total = totals[row['user_id']]
+            total[0] += row['points']
+            total[1] += row['transactions']
+
+        progress.bulk_create(
+            [UserTaskProgress(user_id=user_id, task_id=task.id, points_earned=totals[user_id][0],
+                              transactions_count=totals[user_id][1]) for user_id in user_ids],
+            update_conflicts=True, unique_fields=['user_id', 'task'],
+            update_fields=['points_earned', 'transactions_count'],
+        )
+
+        #  Completions are never revoked; new ones are rewarded like in the worker
+        finished = list(progress.filter(task=task, user_id__in=user_ids, completed_at__isnull=True,
+                                        points_earned__gte=task.points_required,
+                                        transactions_count__gte=task.transactions_required))
+        for row in finished:
+            row.task = task
+            row.reward_user()
+    return len(finished)
+
+
+def enqueue_task_progress(transaction):
+    """ Queues a task progress evaluation for the transaction instead of running it inline. """
+    return TaskProgressJob.objects.create(transaction=transaction, program_id=transaction.program_id)
+
+
+def process_task_progress_jobs(batch_size=100):
+    """
+    Claims up to `batch_size` pending jobs per shard and evaluates them grouped by program.
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several workers can run side by side.
+    Jobs of programs being moved between shards are left for after the move.
+    Returns the number of claimed jobs.
+    """
+    moving = moving_program_ids()
+    claimed = 0
+    for alias in shard_aliases():
+        with use_shard(alias):
+            claimed += process_shard_task_progress_jobs(alias, batch_size, moving)
+    return claimed
+
+
+def process_shard_task_progress_jobs(alias, batch_size=100, skip_program_ids=()):
+    """
+    One batch of process_task_progress_jobs() on one database.
+    If the batch transaction fails as a whole (e.g. a deferred constraint check at commit), its
+    jobs get a failed attempt recorded in a second transaction, so they can't stay pending forever.
+    """
+    claimed_ids = []
+    try:
+        with db_transaction.atomic(using=alias):
+            jobs = TaskProgressJob.objects.using(alias).select_for_update(skip_locked=True, of=('self',)).filter(
+                status='pending')
+            if skip_program_ids:
+                jobs = jobs.exclude(program_id__in=skip_program_ids)
+            jobs = list(jobs.select_related('transaction').order_by('id')[:batch_size])
+            if not jobs:
+                return 0
+
+            jobs_by_program = defaultdict(list)
+            for job in jobs:
+                jobs_by_program[job.program_id].append(job)
+            if is_sharded():
+                #  Rows left on the source of a finished move are deleted by the move, not processed twice
+                for program_id in [pid for pid in jobs_by_program if shard_for_program(pid) != alias]:
+                    del jobs_by_program[program_id]
+            claimed_ids = [job.id for program_jobs in jobs_by_program.values() for job in program_jobs]
+
+            finished_ids = []
+            failed_jobs = []
+            for program_id, program_jobs in jobs_by_program.items():
+                try:
+                    with db_transaction.atomic(using=alias):  # Savepoint: one bad program doesn't roll back the others
+                        update_task_progress_for_transactions(program_id, [job.transaction for job in program_jobs])
+                except Exception as e:
+                    logger.exception("Task progress evaluation failed for program %s", program_id)
+                    record_job_failure(program_jobs, e)
+                    failed_jobs.extend(program_jobs)
+                else:
+                    finished_ids.extend(job.id for job in program_jobs)
+
+            TaskProgressJob.objects.using(alias).filter(id__in=finished_ids).delete()
+            TaskProgressJob.objects.using(alias).bulk_update(failed_jobs, ['attempts', 'last_error', 'status'])
+    except Exception as e:
+        if not claimed_ids:
+            raise
+        logger.exception("Task progress batch failed on %s", alias)
+        with db_transaction.atomic(using=alias):
+            jobs = list(TaskProgressJob.objects.using(alias).select_for_update(skip_locked=True).filter(
+                id__in=claimed_ids, status='pending'))  # Jobs another worker claimed meanwhile are left to it
+            record_job_failure(jobs, e)
+            TaskProgressJob.objects.using(alias).bulk_update(jobs, ['attempts', 'last_error', 'status'])
+    return len(claimed_ids)
 
-        progress.save()
 
-        #  Check if the task is now completed
-        progress.reward_user()
\ No newline at end of file
+def record_job_failure(jobs, error):
+    """ Count a failed attempt on each job; jobs out of attempts are marked failed """
+    for job in jobs:
+        job.attempts += 1
+        job.last_error = str(error)
+        job.status = 'failed' if job.attempts >= TASK_PROGRESS_MAX_ATTEMPTS else 'pending'
@@ -0,0 +1,486 @@
+"""
+Horizontal sharding of program data by program_id.
+
+settings.LOYALTY_SHARDS lists the database aliases that hold program data; the default ['default']
+means no sharding and none of this code adds queries. With several shards:
+
+- Users, tokens and LoyaltyProgram live on 'default' (the directory). ProgramShard records which alias
+  holds each program's rows; new programs are placed on the shard with the fewest programs.
+- Every shard-local model (balances, aggregates, transactions, tiers, tasks, progress, jobs, events, archives)
+  is stored on its program's shard. The program row and its owner are mirrored onto that shard so
+  foreign keys and joins such as `program__owner` keep working there.
+- ProgramShardRouter sends shard-local models to the shard selected for the current request or job
+  (`use_program_shard()` / `use_shard()`, a ContextVar like the replica pinning in db_routers.py), or to
+  the database an instance was loaded from.
+- Listings spanning several programs of one owner are fanned out per shard and merged.
+- `move_program()` moves a program between shards online: copy, freeze writes, catch up, flip the
+  directory entry, clean up the source (see `manage.py move_program_shard`).
+
+Primary keys of shard-local tables are kept unique across shards by `configure_shard_sequences()`,
+which gives every shard its own interleaved id sequence; rows keep their ids when a program moves.
+"""
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import total_ordering
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Count
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+_current_shard = ContextVar('loyalty_current_shard', default=None)
+_directory = {}  # program_id -> (alias, state, expires_at); per-process cache of ProgramShard rows
+
+SHARD_ID_STRIDE = 64  # Upper bound on the number of shards; ids on shard i are congruent to i modulo this
+
+# Shard-local models in foreign key order: rows are copied in this order and deleted in reverse
+SHARD_LOCAL_MODELS = (
+    'loyaltytier', 'specialtask', 'pointbalance', 'programaggregate', 'transaction', 'usertaskprogress',
+    'taskprogressbucket', 'taskprogressjob', 'taskrebuildjob', 'outboxevent', 'transactionarchive',
+    'balancecheckpoint', 'tierpointsbucket',
+)
+TASK_LOCAL_MODELS = ('usertaskprogress', 'taskprogressbucket')  # Reach their program through the task
+
+
+class ProgramMoving(APIException):
+    """ Writes to a program are refused while it is being moved between shards """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "This loyalty program is being moved; retry in a few seconds."
+    default_code = 'program_moving'
+
+
+def shard_aliases():
+    return list(getattr(settings, 'LOYALTY_SHARDS', ['default']))
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def is_shard_local(model):
+    return model._meta.app_label == 'loyalty' and model._meta.model_name in SHARD_LOCAL_MODELS
+
+
+def shard_local_models():
+    from django.apps import apps
+    return [apps.get_model('loyalty', name) for name in SHARD_LOCAL_MODELS]
+
+
+def program_field(model):
+    """ Lookup from a shard-local model to its program id """
+    return 'task__program_id' if model._meta.model_name in TASK_LOCAL_MODELS else 'program_id'
+
+
+def current_shard():
+    """ Alias selected for the current request or job ('default' when none was selected) """
+    return _current_shard.get() or 'default'
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def use_program_shard(program_id):
+    return use_shard(shard_for_program(program_id))
+
+
+### DIRECTORY ###
+
+def directory_ttl():
+    """ How long processes may cache directory entries; moves wait this long between phases """
+    return getattr(settings, 'LOYALTY_SHARD_DIRECTORY_TTL', 5)
+
+
+def directory_entry(program_id):
+    """ (alias, state) of a program; programs without an entry live on 'default' """
+    if not is_sharded():
+        return 'default', 'active'
+    program_id = int(program_id)
+    cached = _directory.get(program_id)
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
+
+    from .models import ProgramShard
+    alias, state = ProgramShard.objects.using('default').filter(program_id=program_id).values_list(
+        'alias', 'state').first() or ('default', 'active')
+    _directory[program_id] = (alias, state, time.monotonic() + directory_ttl())
+    return alias, state
+
+
+def shard_for_program(program_id):
+    return directory_entry(program_id)[0]
+
+
+def forget_directory_entry(program_id=None):
+    if program_id is None:
+        _directory.clear()
+    else:
+        _directory.pop(int(program_id), None)
+
+
+def group_by_shard(program_ids):
+    """ {alias: [program ids]} with one directory query """
+    from .models import ProgramShard
+    program_ids = [int(program_id) for program_id in program_ids]
+    placed = dict(ProgramShard.objects.using('default').filter(program_id__in=program_ids).values_list(
+        'program_id', 'alias'))
+    groups = {}
+    for program_id in program_ids:
+        groups.setdefault(placed.get(program_id, 'default'), []).append(program_id)
+    return groups
+
+
+def locate(model, pk):
+    """
+    (alias, program_id) of the `model` row `pk`, searching every shard; (None, None) if it doesn't exist.
+    Rows left behind on the source of a finished move are skipped.
+    """
+    for alias in shard_aliases():
+        program_id = model.objects.using(alias).filter(pk=pk).values_list(program_field(model), flat=True).first()
+        if program_id is not None and shard_for_program(program_id) == alias:
+            return alias, program_id
+    return None, None
+
+
+def assign_shard(program):
+    """ Place a new program on the shard with the fewest programs and mirror it there """
+    from .models import ProgramShard
+    counts = dict(ProgramShard.objects.using('default').values_list('alias').annotate(Count('program')))
+    alias = min(shard_aliases(), key=lambda candidate: (counts.get(candidate, 0), shard_aliases().index(candidate)))
+    mirror_program(program, alias)
+    ProgramShard.objects.using('default').create(program_id=program.id, alias=alias)
+    forget_directory_entry(program.id)
+    return alias
+
+
+def mirror_program(program, alias):
+    """ Copy a program row and its owner onto a shard (no-op for 'default', where the originals live) """
+    from .models import LoyaltyProgram
+    if alias == 'default':
+        return
+    User = get_user_model()
+    owner = User.objects.using('default').get(id=program.owner_id)
+    User.objects.using(alias).bulk_create(
+        [User(id=owner.id, username=owner.username, password='!', is_active=owner.is_active)],
+        update_conflicts=True, unique_fields=['id'], update_fields=['username', 'is_active'],
+    )
+    fields = [field.attname for field in LoyaltyProgram._meta.concrete_fields if not field.primary_key]
+    source = LoyaltyProgram.objects.using('default').get(id=program.id)
+    LoyaltyProgram.objects.using(alias).bulk_create(
+        [LoyaltyProgram(id=source.id, **{name: getattr(source, name) for name in fields})],
+        update_conflicts=True, unique_fields=['id'], update_fields=fields,
+    )
+
+
+def update_program(program_id, **updates):
+    """ Queryset update of a program row on 'default' and on its shard mirror """
+    from .models import LoyaltyProgram
+    updated = LoyaltyProgram.objects.using('default').filter(id=program_id).update(**updates)
+    alias = shard_for_program(program_id)
+    if alias != 'default':
+        LoyaltyProgram.objects.using(alias).filter(id=program_id).update(**updates)
+    return updated
+
+
+def moving_program_ids():
+    """ Programs frozen for a move; workers leave their jobs alone until the move is done """
+    if not is_sharded():
+        return []
+    from .models import ProgramShard
+    return list(ProgramShard.objects.using('default').filter(state='moving').values_list('program_id', flat=True))
+
+
+### SEQUENCES ###
+
+def configure_shard_sequences():
+    """
+    Interleave the id sequences of shard-local tables: shard i hands out ids i, i + STRIDE, ... starting
+    above the highest id on any shard, so a program's rows can be copied to another shard unchanged.
+    Run it once when shards are added (PostgreSQL only). Returns {alias: restart value of the first table}.
+    """
+    aliases = shard_aliases()
+    result = {}
+    for model in shard_local_models():
+        table = model._meta.db_table
+        highest = 0
+        for alias in aliases:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {connections[alias].ops.quote_name(table)}')
+                highest = max(highest, cursor.fetchone()[0])
+        base = (highest // SHARD_ID_STRIDE + 1) * SHARD_ID_STRIDE
+        for index, alias in enumerate(aliases):
+            connection = connections[alias]
+            if connection.vendor != 'postgresql':
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f'ALTER SEQUENCE {sequence} INCREMENT BY {SHARD_ID_STRIDE} RESTART WITH {base + index}')
+            result.setdefault(alias, base + index)
+    return result
+
+
+### MOVES ###
+
+def program_rows(model, program_id, alias):
+    """ Queryset of a program's rows of one shard-local model on `alias` """
+    return model.objects.using(alias).filter(**{program_field(model): program_id})
+
+
+def upsert_rows(model, rows, target):
+    """ Insert or overwrite `rows` on `target`, keeping their primary keys """
+    if model._meta.model_name == 'transaction':
+        # Partitioned table: its primary key is (id, timestamp), so conflicts can't target id alone.
+        # Transactions are never updated in place, so skipping copies that already exist is enough.
+        model.objects.using(target).bulk_create(rows, ignore_conflicts=True)
+    else:
+        fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+        model.objects.using(target).bulk_create(rows, update_conflicts=True, unique_fields=['id'], update_fields=fields)
+
+
+def copy_program_rows(program_id, source, target, chunk_size=2000):
+    """ Upsert every shard-local row of a program from `source` into `target`, keeping primary keys """
+    for model in shard_local_models():
+        rows = program_rows(model, program_id, source).order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(rows.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1].pk
+            upsert_rows(model, chunk, target)
+
+
+@contextmanager
+def capture_changes(program_id, alias):
+    """
+    Log changes to a program's shard-local rows on `alias` while the block runs (PostgreSQL triggers
+    installed by migration 0018 write them to ShardMoveChange). Yields a function returning the log as
+    {model name: set of changed row ids}.
+    """
+    from .models import ShardMoveCapture, ShardMoveChange
+    if connections[alias].vendor != 'postgresql':
+        raise ValueError("Moving programs between shards needs PostgreSQL")
+    ShardMoveChange.objects.using(alias).filter(program_id=program_id).delete()  # Left over from a failed move
+    ShardMoveCapture.objects.using(alias).get_or_create(program_id=program_id)
+
+    def changes():
+        changed = {}
+        for name, row_id in ShardMoveChange.objects.using(alias).filter(program_id=program_id).values_list(
+                'model_name', 'row_id').distinct():
+            changed.setdefault(name, set()).add(row_id)
+        return changed
+
+    try:
+        yield changes
+    finally:
+        ShardMoveCapture.objects.using(alias).filter(program_id=program_id).delete()
+        ShardMoveChange.objects.using(alias).filter(program_id=program_id).delete()
+
+
+def apply_changes(changed, source, target, chunk_size=2000):
+    """
+    Bring the rows listed in `changed` ({model name: row ids}) up to date on `target`: rows still on
+    `source` are upserted, the others deleted. Unchanged rows are not read.
+    """
+    removed = {}
+    for model in shard_local_models():
+        row_ids = sorted(changed.get(model._meta.model_name, ()))
+        present = set()
+        for index in range(0, len(row_ids), chunk_size):
+            rows = list(model.objects.using(source).filter(pk__in=row_ids[index:index + chunk_size]))
+            present.update(row.pk for row in rows)
+            if rows:
+                upsert_rows(model, rows, target)
+        removed[model] = set(row_ids) - present
+    for model in reversed(shard_local_models()):
+        if removed[model]:
+            model.objects.using(target).filter(pk__in=removed[model]).delete()
+
+
+def delete_program_rows(program_id, alias):
+    """ Remove a program's shard-local rows (and its mirror) from a shard it no longer lives on """
+    for model in reversed(shard_local_models()):
+        program_rows(model, program_id, alias).delete()
+    if alias != 'default':
+        from .models import LoyaltyProgram
+        LoyaltyProgram.objects.using(alias).filter(id=program_id).delete()
+
+
+def move_program(program_id, target, chunk_size=2000, settle=None, log=lambda message: None):
+    """
+    Move a program's rows to another shard while it stays online:
+      1. copy all rows while the program keeps serving reads and writes on the source,
+      2. freeze writes (state 'moving'; the API answers 503, workers skip the program),
+      3. wait until every process sees the freeze, then catch up on the rows that changed during the copy
+         (logged by database triggers on the source, so the catch-up reads only those rows),
+      4. flip the directory entry to the target and unfreeze,
+      5. wait until every process sees the flip, then delete the rows from the source.
+    Only the catch-up runs while writes are frozen.
+    """
+    from .models import LoyaltyProgram, ProgramShard
+    if target not in shard_aliases():
+        raise ValueError(f"Unknown shard {target!r}")
+    settle = directory_ttl() if settle is None else settle
+    program = LoyaltyProgram.objects.using('default').get(id=program_id)
+    source = shard_for_program(program_id)
+    if source == target:
+        return source
+
+    ProgramShard.objects.using('default').get_or_create(program_id=program_id, defaults={'alias': source})
+    mirror_program(program, target)
+
+    with capture_changes(program_id, source) as changes:
+        time.sleep(settle)  # Writes already under way when the capture started must land before the copy reads
+        log(f"Copying program {program_id} from {source} to {target}")
+        copy_program_rows(program_id, source, target, chunk_size)
+
+        log("Freezing writes")
+        ProgramShard.objects.using('default').filter(pk=program_id).update(state='moving')
+        forget_directory_entry(program_id)
+        try:
+            time.sleep(settle)
+            changed = changes()
+            log(f"Catching up on {sum(map(len, changed.values()))} changed row(s)")
+            with transaction.atomic(using=target):
+                apply_changes(changed, source, target, chunk_size)
+            ProgramShard.objects.using('default').filter(pk=program_id).update(alias=target, state='active')
+        except BaseException:
+            ProgramShard.objects.using('default').filter(pk=program_id).update(state='active')
+            raise
+        finally:
+            forget_directory_entry(program_id)
+
+    log(f"Program {program_id} now lives on {target}; cleaning up {source}")
+    time.sleep(settle)
+    delete_program_rows(program_id, source)
+    return target
+
+
+### VIEWS ###
+
+class ProgramShardMixin:
+    """
+    Runs a request on the shard of the program it addresses: `program_id` from the query string or
+    the body (`program_id` / `program`), or for detail routes the shard holding the object.
+    List requests that address no program are fanned out over all shards and merged.
+    Writes to a program that is being moved are answered with 503. Does nothing unless sharded.
+    """
+    _shard_token = None
+
+    def get_shard_program_id(self, request):
+        program_id = request.query_params.get('program_id')
+        if program_id is None and isinstance(request.data, dict):
+            program_id = request.data.get('program_id') or request.data.get('program')
+        return program_id
+
+    def use_shard_of(self, program_id, alias=None):
+        """ Select the program's shard for the rest of the request """
+        if self._shard_token is not None:
+            return
+        entry_alias, state = directory_entry(program_id)
+        if state == 'moving' and self.request.method not in SAFE_METHODS:
+            raise ProgramMoving()
+        self._shard_token = _current_shard.set(alias or entry_alias)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not is_sharded():
+            return
+        program_id = self.get_shard_program_id(request)
+        if program_id is not None and str(program_id).isdigit():
+            self.use_shard_of(program_id)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._shard_token is not None:
+            _current_shard.reset(self._shard_token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_object(self):
+        if is_sharded() and self._shard_token is None:
+            lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')
+            model = self.get_queryset().model
+            if is_shard_local(model) and str(lookup).isdigit():
+                alias, program_id = locate(model, lookup)
+                if alias is not None:
+                    self.use_shard_of(program_id, alias)
+        return super().get_object()
+
+    def list(self, request, *args, **kwargs):
+        if not is_sharded() or self._shard_token is not None or not is_shard_local(self.queryset.model):
+            return super().list(request, *args, **kwargs)
+
+        querysets = {}
+        for alias in shard_aliases():
+            with use_shard(alias):
+                querysets[alias] = self.filter_queryset(self.get_queryset()).using(alias)
+        objects = ShardFanOut(querysets)
+
+        page = self.paginate_queryset(objects)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(list(objects), many=True).data)
+
+
+@total_ordering
+class Descending:
+    """ Sort key wrapper inverting the order of a `-field` """
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class ShardFanOut:
+    """
+    One listing spread over several shards, merged in the queryset's ordering (then pk). Slicing reads at most
+    `stop` rows from each shard and merges them, so a page costs one query per shard whatever the totals are.
+    Mid-move, a program's rows exist on two shards; only the copy its directory entry points to is read.
+    """
+    def __init__(self, querysets):
+        model = next(iter(querysets.values())).model
+        self.ordering = [*(next(iter(querysets.values())).query.order_by or model._meta.ordering), 'pk']
+        field = program_field(model)
+        present = set()
+        for queryset in querysets.values():
+            present.update(queryset.order_by().values_list(field, flat=True).distinct())
+        placed = group_by_shard(present)
+        self.querysets = [queryset.filter(**{f'{field}__in': placed[alias]}).order_by(*self.ordering)
+                          for alias, queryset in querysets.items() if placed.get(alias)]
+
+    def sort_key(self, obj):
+        return tuple(Descending(getattr(obj, name[1:])) if name.startswith('-') else getattr(obj, name)
+                     for name in self.ordering)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or (index.step or 1) != 1:
+            raise TypeError("ShardFanOut only supports contiguous slices")
+        start, stop = index.start or 0, index.stop
+        rows = [queryset if stop is None else queryset[:stop] for queryset in self.querysets]
+        return list(islice(heapq.merge(*rows, key=self.sort_key), start, stop))
@@ -1,25 +1,77 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Transaction, PointBalance
+from .cache import bump_program_config_version
+from .metrics import timed
+from .models import Transaction, PointBalance, LoyaltyProgram, LoyaltyTier, SpecialTask, TierPointsBucket
+from .sharding import assign_shard, delete_program_rows, forget_directory_entry, is_sharded, mirror_program, \
+    shard_for_program
 
 @receiver(post_save, sender=Transaction)
-def update_balance(sender, instance, created, **kwargs):
-    """Automatically updates PointBalance when a new Transaction is created."""
+@timed('balance_signal')
+def update_balance(sender, instance, created, using, **kwargs):
+    """Automatically updates PointBalance when a new Transaction is created (on the transaction's database)."""
     if created:  # Only update on new transactions
         try:
-            point_balance, created = PointBalance.objects.get_or_create(
-                user_id=instance.user_id,
-                program=instance.program
-            )
-
-            if instance.transaction_type == 'earn':
-                point_balance.balance += instance.points
-                point_balance.total_points_earned += instance.points
-            elif instance.transaction_type == 'redeem':
-                point_balance.balance -= instance.points
-                if point_balance.balance < 0:
-                    point_balance.balance = 0  # Ensure balance doesn't go negative
-
-            point_balance.save()
+            with transaction.atomic(using=using):
+                # Locked until commit, so concurrent transactions of the member apply one after the other
+                point_balance, created = PointBalance.objects.db_manager(using).select_for_update().get_or_create(
+                    user_id=instance.user_id,
+                    program=instance.program
+                )
+                previous_points = point_balance.tier_points
+
+                if instance.transaction_type == 'earn':
+                    point_balance.balance += instance.points
+                    point_balance.total_points_earned += instance.points
+                    if point_balance.qualifying_points is not None:
+                        point_balance.qualifying_points += instance.points
+                    TierPointsBucket.add(instance.program_id, instance.user_id, instance.points, instance.timestamp,
+                                         using=using)
+                elif instance.transaction_type == 'redeem':
+                    point_balance.balance -= instance.points
+                    if point_balance.balance < 0:
+                        point_balance.balance = 0  # Ensure balance doesn't go negative
+
+                point_balance.save()
+                point_balance.record_tier_change(previous_points)  # Outbox event, same DB transaction
         except Exception as e:
             print(f"Error updating balance: {e}")
+
+
+@receiver(post_save, sender=LoyaltyTier)
+@receiver(post_delete, sender=LoyaltyTier)
+@receiver(post_save, sender=SpecialTask)
+@receiver(post_delete, sender=SpecialTask)
+def update_program_config_version(sender, instance, **kwargs):
+    """Invalidate the program's cached tier/task lists and ETags whenever its configuration changes."""
+    bump_program_config_version(instance.program_id)
+
+
+@receiver(post_save, sender=LoyaltyProgram)
+@receiver(post_delete, sender=LoyaltyProgram)
+def update_own_config_version(sender, instance, **kwargs):
+    """Editing or deleting the program itself also invalidates its cached configuration."""
+    bump_program_config_version(instance.id)
+
+
+@receiver(post_save, sender=LoyaltyProgram)
+def place_program_on_shard(sender, instance, created, using, **kwargs):
+    """Give new programs a shard and keep the program's mirror on its shard up to date."""
+    if not is_sharded() or using != 'default':
+        return
+    if created:
+        assign_shard(instance)
+    else:
+        mirror_program(instance, shard_for_program(instance.id))
+
+
+@receiver(pre_delete, sender=LoyaltyProgram)
+def delete_program_shard_data(sender, instance, using, **kwargs):
+    """Cascade a program delete to its rows on another shard; Django only cascades on 'default'."""
+    if not is_sharded() or using != 'default':
+        return
+    alias = shard_for_program(instance.id)
+    if alias != 'default':
+        delete_program_rows(instance.id, alias)
+    forget_directory_entry(instance.id)
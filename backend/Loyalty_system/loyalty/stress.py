@@ -0,0 +1,203 @@
+"""
+Concurrency stress runs for point balances.
+
+run_balance_stress() hammers one program with a random mix of earns (earn_points), redeems
+(redeem_points) and earn and redeem transactions (Transaction rows, applied by the balance signal,
+which clamps redeems at the balance) from many threads or processes at once, then checks the
+invariants a correct implementation keeps however the operations interleave:
+
+- no balance is negative,
+- every member's earned, qualifying and bucketed points equal what the workers earned for them,
+  and their balance equals that minus the redeems that succeeded and what redeem transactions deducted,
+- the earn and redeem transactions in the ledger add up to what the workers recorded,
+- the program's aggregate equals the sum of its balances,
+- every member got exactly one `tier.changed` event per tier they reached.
+
+Used by `manage.py stress_balances` and loyalty/tests/test_concurrency.py.
+"""
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter
+
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+
+from .models import LoyaltyTier, OutboxEvent, PointBalance, TierPointsBucket, Transaction
+from .services import earn_points, program_liability, redeem_points
+from .sharding import current_shard, use_program_shard
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('earn', 'redeem', 'transaction', 'redeem_transaction')
+
+
+class StressReport:
+    """ Outcome of a stress run: throughput, unexpected errors and broken invariants """
+
+    def __init__(self, operations, seconds, rejected, clamped, errors, violations):
+        self.operations = operations  # Operations attempted
+        self.seconds = seconds
+        self.rejected = rejected  # Redeems refused for insufficient points (expected)
+        self.clamped = clamped  # Redeem transactions larger than the balance, which the signal clamps to 0
+        self.errors = errors  # Unexpected exceptions, as strings
+        self.violations = violations  # Broken invariants, as strings
+
+    @property
+    def ops_per_second(self):
+        return self.operations / self.seconds if self.seconds else 0.0
+
+    @property
+    def ok(self):
+        return not (self.errors or self.violations)
+
+    def __str__(self):
+        return (f"{self.operations} operations in {self.seconds:.2f}s ({self.ops_per_second:,.0f} ops/s), "
+                f"{self.rejected} redeem(s) rejected, {self.clamped} redeem transaction(s) clamped, "
+                f"{len(self.errors)} error(s), "
+                f"{len(self.violations)} invariant violation(s)")
+
+
+def prepare_members(program, user_ids):
+    """ Empty balances for the members, counting qualifying points so the tier window path is exercised too """
+    for user_id in user_ids:  # save() also counts them in the program's aggregate
+        PointBalance.objects.create(user_id=user_id, program=program, qualifying_points=0)
+
+
+def run_worker(program_id, user_ids, operations, seed):
+    """
+    Run `operations` random operations; returns {'earned': Counter, 'redeemed': Counter, 'ledger': Counter,
+    'ledger_redeemed': Counter, 'rejected': int, 'clamped': int, 'errors': [str]} with points per user id.
+    `redeemed` counts what left the balances, `ledger_redeemed` the points of the redeem transactions.
+    """
+    rng = random.Random(seed)
+    result = {'earned': Counter(), 'redeemed': Counter(), 'ledger': Counter(), 'ledger_redeemed': Counter(),
+              'rejected': 0, 'clamped': 0, 'errors': []}
+    try:
+        with use_program_shard(program_id):
+            for _ in range(operations):
+                user_id, points, operation = rng.choice(user_ids), rng.randint(1, 50), rng.choice(OPERATIONS)
+                try:
+                    if operation == 'earn':
+                        earn_points(user_id, program_id, points)
+                        result['earned'][user_id] += points
+                    elif operation == 'redeem':
+                        redeem_points(user_id, program_id, points)
+                        result['redeemed'][user_id] += points
+                    elif operation == 'transaction':
+                        Transaction.objects.create(user_id=user_id, program_id=program_id, transaction_type='earn',
+                                                   points=points)
+                        result['earned'][user_id] += points
+                        result['ledger'][user_id] += points
+                    else:
+                        # Lock the balance first (the signal locks it again) to know what the redeem will deduct
+                        with transaction.atomic(using=current_shard()):
+                            balance = PointBalance.objects.select_for_update().filter(
+                                user_id=user_id, program_id=program_id).values_list('balance', flat=True).get()
+                            Transaction.objects.create(user_id=user_id, program_id=program_id,
+                                                       transaction_type='redeem', points=points)
+                        result['redeemed'][user_id] += min(points, balance)
+                        result['ledger_redeemed'][user_id] += points
+                        result['clamped'] += points > balance
+                except ValueError:
+                    result['rejected'] += 1
+                except Exception as e:
+                    result['errors'].append(f"{operation} for {user_id}: {e!r}")
+    finally:
+        connections.close_all()  # Connections are per thread / process
+    return result
+
+
+def _process_worker(queue, *args):
+    queue.put(run_worker(*args))
+
+
+def run_balance_stress(program, user_ids, workers=8, operations=100, processes=False, seed=0):
+    """
+    Run `workers` concurrent workers of `operations` operations each on the members of `program`
+    (prepared with prepare_members) and check the invariants; returns a StressReport.
+    Processes are forked, so the parent's connections are closed first.
+    """
+    user_ids = list(user_ids)
+    args = [(program.id, user_ids, operations, seed + index) for index in range(workers)]
+    start = time.perf_counter()
+    if processes:
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        children = [context.Process(target=_process_worker, args=(queue, *worker_args)) for worker_args in args]
+        for child in children:
+            child.start()
+        results = [queue.get() for _ in children]
+        for child in children:
+            child.join()
+    else:
+        results = [None] * workers
+
+        def run(index):
+            results[index] = run_worker(*args[index])
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    seconds = time.perf_counter() - start
+
+    earned, redeemed, ledger, ledger_redeemed = Counter(), Counter(), Counter(), Counter()
+    for result in results:
+        earned.update(result['earned'])
+        redeemed.update(result['redeemed'])
+        ledger.update(result['ledger'])
+        ledger_redeemed.update(result['ledger_redeemed'])
+    with use_program_shard(program.id):
+        violations = check_balance_invariants(program.id, user_ids, earned, redeemed, ledger, ledger_redeemed)
+    report = StressReport(workers * operations, seconds, sum(result['rejected'] for result in results),
+                          sum(result['clamped'] for result in results), [error for result in results for error in result['errors']], violations)
+    logger.info("Balance stress, %d %s: %s", workers, "process(es)" if processes else "thread(s)", report)
+    return report
+
+
+def check_balance_invariants(program_id, user_ids, earned, redeemed, ledger, ledger_redeemed):
+    """ Broken invariants of the program's balances after a stress run, as readable strings """
+    violations = []
+    balances = {balance.user_id: balance for balance in PointBalance.objects.filter(program_id=program_id)}
+    buckets = dict(TierPointsBucket.objects.filter(program_id=program_id).order_by().values('user_id').annotate(
+        total=Sum('points')).values_list('user_id', 'total'))
+    transactions = {(user_id, transaction_type): total for user_id, transaction_type, total in (
+        Transaction.objects.filter(program_id=program_id).order_by().values('user_id', 'transaction_type')
+        .annotate(total=Sum('points')).values_list('user_id', 'transaction_type', 'total'))}
+    events = Counter(OutboxEvent.objects.filter(program_id=program_id, event_type='tier.changed')
+                     .values_list('payload__user_id', flat=True))
+    tiers = sorted(LoyaltyTier.objects.filter(program_id=program_id).values_list('points_to_reach', flat=True))
+
+    for user_id in user_ids:
+        balance = balances[user_id]
+        expected_balance = earned[user_id] - redeemed[user_id]
+        if balance.balance < 0:
+            violations.append(f"user {user_id}: negative balance {balance.balance}")
+        if balance.balance != expected_balance:
+            violations.append(f"user {user_id}: balance {balance.balance}, expected {expected_balance}")
+        for label, actual in (("total earned", balance.total_points_earned),
+                              ("qualifying points", balance.qualifying_points),
+                              ("tier buckets", buckets.get(user_id, 0))):
+            if actual != earned[user_id]:
+                violations.append(f"user {user_id}: {label} {actual}, expected {earned[user_id]}")
+        for transaction_type, expected in (("earn", ledger[user_id]), ("redeem", ledger_redeemed[user_id])):
+            recorded = transactions.get((user_id, transaction_type), 0)
+            if recorded != expected:
+                violations.append(f"user {user_id}: ledger {transaction_type}s {recorded}, expected {expected}")
+        reached = sum(1 for points_to_reach in tiers if points_to_reach <= earned[user_id])
+        if events[user_id] != reached:
+            violations.append(f"user {user_id}: {events[user_id]} tier.changed event(s), expected {reached}")
+
+    totals = PointBalance.objects.filter(program_id=program_id).aggregate(
+        outstanding=Sum('balance', default=0), earned=Sum('total_points_earned', default=0), members=Count('id'))
+    aggregate = program_liability(program_id)
+    actual = (aggregate.outstanding_points, aggregate.lifetime_earned, aggregate.member_count)
+    expected = (totals['outstanding'], totals['earned'], totals['members'])
+    if actual != expected:
+        violations.append(f"aggregate (outstanding, earned, members) {actual}, expected {expected}")
+    return violations
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+
+import pytest
+from django.core.cache import caches
+
+from loyalty.api_keys import forget_revocations
+from loyalty.query_inspection import inspect_queries
+from loyalty.rules import reset_compiled_rules
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """ Start every test with empty caches so cached responses, compiled rules and revocations never leak """
+    for cache in caches.all():
+        cache.clear()
+    reset_compiled_rules()
+    forget_revocations()
+    yield
+
+
+@pytest.fixture
+def assert_no_n_plus_one():
+    """
+    Context manager failing the test when a SQL shape repeats REPEAT_THRESHOLD or more times inside it:
+        with assert_no_n_plus_one():
+            auth_client.get(...)
+    """
+    @contextmanager
+    def guard(repeat_threshold=None):
+        with inspect_queries(repeat_threshold=repeat_threshold) as inspector:
+            yield inspector
+        repeated = inspector.repeated()
+        if repeated:
+            pytest.fail("Possible N+1 queries:\n" + "\n".join(str(entry) for entry in repeated), pytrace=False)
+
+    return guard
@@ -0,0 +1,80 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from loyalty import docs
+
+# API Endpoints
+SWAGGER_URL = "/"
+SCHEMA_URL = "/openapi.json"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def fresh_document():
+    """ Every test starts without a loaded document """
+    docs.reset_schema_document()
+    yield
+    docs.reset_schema_document()
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+def test_schema_is_served_as_json(api_client):
+    response = api_client.get(SCHEMA_URL)
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert "max-age=3600" in response["Cache-Control"]
+    schema = json.loads(response.content)
+    assert schema["info"]["title"] == "Loyalty System API"
+    assert "/points/" in schema["paths"]
+    assert schema["basePath"] == "/api"
+
+
+def test_schema_is_generated_once(api_client, monkeypatch):
+    """ Later requests reuse the document and answer If-None-Match with 304 """
+    first = api_client.get(SCHEMA_URL)
+    monkeypatch.setattr(docs, "build_schema", lambda: pytest.fail("schema generated twice"))
+
+    second = api_client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=first["ETag"])
+
+    assert second.status_code == 304
+
+
+def test_prebuilt_document_is_served(api_client, settings, tmp_path, monkeypatch):
+    """ generate_openapi writes the document; workers serve that file without generating it """
+    settings.LOYALTY_OPENAPI_SCHEMA_PATH = tmp_path / "openapi.json"
+    call_command("generate_openapi")
+    monkeypatch.setattr(docs, "build_schema", lambda: pytest.fail("schema generated at request time"))
+
+    response = api_client.get(SCHEMA_URL)
+
+    assert response.content == (tmp_path / "openapi.json").read_bytes()
+
+
+def test_swagger_ui_points_at_cached_schema(api_client):
+    response = api_client.get(SWAGGER_URL)
+
+    assert response.status_code == 200
+    assert b'"url": "/openapi.json"' in response.content
+
+
+def test_url_conf_does_not_load_schema_generator():
+    """ Workers import the URL conf without drf_yasg's generator and views """
+    code = (
+        "import sys, django; django.setup(); import Loyalty_system.urls; "
+        "print(sorted(name for name in sys.modules if name.startswith('drf_yasg.')))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env={"DJANGO_SETTINGS_MODULE": "Loyalty_system.settings.local", "PATH": ""})
+
+    assert result.stdout.strip() == "[]"
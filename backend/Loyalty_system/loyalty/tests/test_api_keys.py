@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.api_keys import issue_api_key
+from loyalty.models import LoyaltyProgram, LoyaltyTier, PointBalance, ProgramApiKey
+
+# API Endpoints
+API_KEYS_URL = "/api/loyalty-programs/{}/api-keys/"
+REVOKE_URL = "/api/loyalty-programs/{}/api-keys/{}/revoke/"
+POINTS_URL = "/api/points/"
+POINT_BALANCE_URL = "/api/point-balances/"
+LOYALTY_TIER_LIST_URL = "/api/loyalty-tiers/"
+TRANSACTION_LIST_URL = "/api/transactions/"
+LOGOUT_URL = "/api/logout/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def programs(owner):
+    return (LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner),
+            LoyaltyProgram.objects.create(name="Coffee Club", owner=owner))
+
+
+@pytest.fixture
+def token_client(owner):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client
+
+
+def key_client(key):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Api-Key {key}")
+    return client
+
+
+def earn(client, program, points=10):
+    return client.post(POINTS_URL + "?action=earn", {"user_id": "1", "program_id": program.id, "points": points},
+                       format="json")
+
+
+def test_owner_issues_lists_and_revokes_keys(token_client, programs):
+    vip, _ = programs
+
+    response = token_client.post(API_KEYS_URL.format(vip.id), {"name": "POS", "scopes": ["points:write"]},
+                                 format="json")
+    assert response.status_code == 201
+    key, key_id = response.data["key"], response.data["key_id"]
+    assert earn(key_client(key), vip).status_code == 200
+
+    listed = token_client.get(API_KEYS_URL.format(vip.id)).data
+    assert [(row["key_id"], row["name"], row["scopes"]) for row in listed] == [(key_id, "POS", ["points:write"])]
+    assert "key" not in listed[0]
+
+    assert token_client.post(REVOKE_URL.format(vip.id, key_id)).data["revoked_at"] is not None
+    assert earn(key_client(key), vip).status_code == 401
+
+    response = token_client.post(API_KEYS_URL.format(vip.id), {"scopes": ["points:delete"]}, format="json")
+    assert response.status_code == 400
+
+
+def test_hot_requests_make_no_auth_queries(programs):
+    vip, _ = programs
+    _, key = issue_api_key(vip, ["points:write"])
+    client = key_client(key)
+    earn(client, vip)  # Loads the revocation list
+
+    with CaptureQueriesContext(connection) as context:
+        assert earn(client, vip).status_code == 200
+
+    tables = " ".join(query["sql"] for query in context.captured_queries)
+    assert "authtoken_token" not in tables
+    assert "auth_user" not in tables
+    assert "loyalty_programapikey" not in tables
+
+
+def test_keys_are_limited_to_their_program_and_scopes(programs):
+    vip, coffee = programs
+    _, key = issue_api_key(vip, ["points:write", "tiers:read"])
+    client = key_client(key)
+    coffee_tier = LoyaltyTier.objects.create(program=coffee, tier_name="Gold", points_to_reach=100)
+
+    assert earn(client, coffee).status_code == 403
+    assert client.post(TRANSACTION_LIST_URL + f"?program_id={vip.id}", {
+        "user_id": "1", "program": coffee.id, "transaction_type": "earn", "points": 5}, format="json").status_code == 403
+    assert client.get(LOYALTY_TIER_LIST_URL, {"program_id": vip.id}).status_code == 200
+    assert client.get(LOYALTY_TIER_LIST_URL).status_code == 403  # Listing across programs
+    assert client.get(f"{LOYALTY_TIER_LIST_URL}{coffee_tier.id}/").status_code == 403
+    assert client.post(LOYALTY_TIER_LIST_URL, {"program": vip.id, "tier_name": "Silver", "points_to_reach": 10},
+                       format="json").status_code == 403  # No tiers:write
+    assert client.post(LOGOUT_URL).status_code == 401  # Only program endpoints accept keys
+    assert not PointBalance.objects.filter(program=coffee).exists()
+
+
+def test_invalid_keys_are_rejected(programs):
+    vip, _ = programs
+    _, key = issue_api_key(vip, ["points:write"])
+    forged = key[:-2] + ("AA" if not key.endswith("AA") else "BB")
+    _, expired = issue_api_key(vip, ["points:write"], expires_at=now() - timedelta(seconds=1))
+
+    for bad_key in (forged, expired, "lpk_garbage", "not-a-key"):
+        assert earn(key_client(bad_key), vip).status_code == 401
+
+    with override_settings(LOYALTY_API_KEY_SECRET="rotated"):
+        assert earn(key_client(key), vip).status_code == 401
+
+
+@override_settings(LOYALTY_API_KEY_REVOCATION_TTL=0)
+def test_revocations_from_other_processes_are_picked_up(programs):
+    vip, _ = programs
+    api_key, key = issue_api_key(vip, ["balances:read"])
+    PointBalance.objects.create(user_id="1", program=vip, balance=5)
+    client = key_client(key)
+    assert client.get(POINT_BALANCE_URL, {"user_id": "1", "program_id": vip.id}).status_code == 200
+
+    ProgramApiKey.objects.filter(id=api_key.id).update(revoked_at=now())  # As done by another process
+
+    assert client.get(POINT_BALANCE_URL, {"user_id": "1", "program_id": vip.id}).status_code == 401
@@ -0,0 +1,120 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.cache import get_program_config_version
+from loyalty.models import LoyaltyProgram, LoyaltyTier, SpecialTask
+
+# API Endpoints
+TIER_BULK_URL = "/api/loyalty-tiers/bulk/"
+SPECIAL_TASK_BULK_URL = "/api/special-tasks/bulk/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def program(owner):
+    return LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+@pytest.fixture
+def auth_client(owner):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client
+
+
+def task_item(number, **fields):
+    return {"name": f"Task {number}", "description": f"Catalog task {number}", "duration_days": 30,
+            "transactions_required": number, **fields}
+
+
+def test_bulk_create_tasks_in_one_round_trip(auth_client, program):
+    version = get_program_config_version(program.id)
+    items = [task_item(number, conditions={"min_points": number}) for number in range(1, 201)]
+
+    with CaptureQueriesContext(connection) as context:
+        response = auth_client.post(SPECIAL_TASK_BULK_URL, {"program": program.id, "items": items}, format="json")
+
+    assert response.status_code == 201
+    assert len(response.data) == 200
+    assert response.data[0]["program"] == program.id
+    assert response.data[199]["conditions"] == {"transaction_types": ["earn"], "min_points": 200}
+    assert SpecialTask.objects.filter(program=program).count() == 200
+    assert len([query for query in context.captured_queries if "INSERT" in query["sql"]]) == 1
+    assert len(context.captured_queries) <= 8  # Token, ownership, insert, savepoint and version bump
+    assert get_program_config_version(program.id) != version
+
+
+def test_bulk_create_is_all_or_nothing(auth_client, program):
+    items = [task_item(1), task_item(2, conditions={"hours": [9, 25]}), task_item(3, duration_days=None)]
+
+    response = auth_client.post(SPECIAL_TASK_BULK_URL, {"program": program.id, "items": items}, format="json")
+
+    assert response.status_code == 400
+    assert response.data["items"][0] == {}
+    assert "conditions" in response.data["items"][1]
+    assert "duration_days" in response.data["items"][2]
+    assert not SpecialTask.objects.exists()
+
+
+def test_bulk_requires_the_program_owner(program):
+    intruder = User.objects.create_user(username="intruder", password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=intruder).key}")
+
+    response = client.post(TIER_BULK_URL, {"program": program.id, "items": [
+        {"tier_name": "Gold", "points_to_reach": 100}]}, format="json")
+
+    assert response.status_code == 400
+    assert "program" in response.data
+    assert not LoyaltyTier.objects.exists()
+
+
+def test_bulk_tiers_refuse_duplicate_names(auth_client, program):
+    LoyaltyTier.objects.create(program=program, tier_name="Gold", points_to_reach=500)
+
+    for items in ([{"tier_name": "Gold", "points_to_reach": 100}],
+                  [{"tier_name": "Silver", "points_to_reach": 100}, {"tier_name": "Silver", "points_to_reach": 200}]):
+        response = auth_client.post(TIER_BULK_URL, {"program": program.id, "items": items}, format="json")
+        assert response.status_code == 400
+        assert "Duplicate tier_name" in str(response.data["items"])
+    assert LoyaltyTier.objects.count() == 1
+
+
+def test_bulk_update_tiers(auth_client, program):
+    silver = LoyaltyTier.objects.create(program=program, tier_name="Silver", points_to_reach=100)
+    gold = LoyaltyTier.objects.create(program=program, tier_name="Gold", points_to_reach=500)
+    other = LoyaltyTier.objects.create(program=LoyaltyProgram.objects.create(name="Other", owner=program.owner),
+                                       tier_name="Bronze", points_to_reach=10)
+
+    response = auth_client.patch(TIER_BULK_URL, {"program": program.id, "items": [
+        {"id": silver.id, "tier_name": "Silver+", "points_to_reach": 200},
+        {"id": gold.id, "tier_name": "Platinum", "description": "Top tier"}]}, format="json")
+
+    assert response.status_code == 200
+    assert list(LoyaltyTier.objects.filter(program=program).values_list("tier_name", "points_to_reach")) == [
+        ("Silver+", 200), ("Platinum", 500)]
+
+    response = auth_client.patch(TIER_BULK_URL, {"program": program.id, "items": [
+        {"id": silver.id, "tier_name": "Platinum"}, {"id": gold.id, "tier_name": "Silver+"}]}, format="json")
+    assert response.status_code == 400  # Swapping names trips the per-row unique constraint; nothing is written
+    assert LoyaltyTier.objects.get(id=silver.id).tier_name == "Silver+"
+
+    response = auth_client.patch(TIER_BULK_URL, {"program": program.id, "items": [
+        {"id": other.id, "points_to_reach": 20}]}, format="json")
+    assert response.status_code == 400
+    assert LoyaltyTier.objects.get(id=other.id).points_to_reach == 10
+
+    response = auth_client.patch(TIER_BULK_URL, {"program": program.id, "items": [
+        {"id": silver.id, "points_to_reach": 0}]}, format="json")
+    assert response.status_code == 400
+    assert "points_to_reach" in response.data["items"][0]
@@ -0,0 +1,36 @@
+import pytest
+from django.contrib.auth.models import User
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier
+from loyalty.stress import prepare_members, run_balance_stress
+
+# Transactional tests: the workers run on their own connections and must see committed rows
+pytestmark = pytest.mark.django_db(transaction=True)
+
+USER_IDS = [f"member-{number}" for number in range(4)]  # Few members, so workers collide on the same rows
+
+
+@pytest.fixture
+def program():
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner, tier_window_months=12)
+    for name, points in (("Silver", 200), ("Gold", 1000)):
+        LoyaltyTier.objects.create(program=program, tier_name=name, points_to_reach=points)
+    prepare_members(program, USER_IDS)
+    return program
+
+
+def test_threads_keep_balances_consistent(program):
+    report = run_balance_stress(program, USER_IDS, workers=8, operations=40)
+
+    assert report.errors == []
+    assert report.violations == []
+    assert report.clamped > 0  # Members start empty, so some redeem transactions exceed the balance
+    assert report.ops_per_second > 0
+
+
+def test_processes_keep_balances_consistent(program):
+    report = run_balance_stress(program, USER_IDS, workers=4, operations=40, processes=True, seed=100)
+
+    assert report.errors == []
+    assert report.violations == []
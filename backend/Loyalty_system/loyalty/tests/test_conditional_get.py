@@ -0,0 +1,107 @@
+import pytest
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from loyalty.models import LoyaltyProgram, PointBalance, LoyaltyTier, SpecialTask
+
+# API Endpoints
+POINT_BALANCE_LIST_URL = "/api/point-balances/"
+LOYALTY_TIER_LIST_URL = "/api/loyalty-tiers/"
+SPECIAL_TASK_LIST_URL = "/api/special-tasks/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def api_client():
+    """ Returns an APIClient instance """
+    return APIClient()
+
+
+@pytest.fixture
+def auth_client(api_client):
+    """ Authenticated API client for the program owner """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    token = Token.objects.create(user=owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return api_client, owner
+
+
+@pytest.fixture
+def create_program(auth_client):
+    """ Program with a tier, a task and one member balance """
+    _, owner = auth_client
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    LoyaltyTier.objects.create(program=program, tier_name="Bronze", points_to_reach=100)
+    SpecialTask.objects.create(name="Buy once", program=program, description="One purchase",
+                               transactions_required=1, duration_days=7)
+    PointBalance.objects.create(user_id="12345", program=program, balance=100, total_points_earned=100)
+    return program
+
+
+def test_point_balance_not_modified(auth_client, create_program, django_assert_num_queries):
+    """ A matching If-None-Match is answered with 304 from the version check alone """
+    api_client, _ = auth_client
+    url = f"{POINT_BALANCE_LIST_URL}?user_id=12345&program_id={create_program.id}"
+
+    response = api_client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    with django_assert_num_queries(2):  # Token lookup + version check
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+
+
+def test_point_balance_etag_changes_on_write(auth_client, create_program):
+    """ Earning points bumps the balance version and therefore the ETag """
+    api_client, _ = auth_client
+    url = f"{POINT_BALANCE_LIST_URL}?user_id=12345&program_id={create_program.id}"
+    etag = api_client.get(url)["ETag"]
+
+    PointBalance.objects.get(user_id="12345", program=create_program).add_points(10)
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data["balance"] == 110
+    assert response["ETag"] != etag
+
+
+def test_point_balance_etag_changes_with_tiers(auth_client, create_program):
+    """ The balance response includes the tier, so tier edits invalidate it too """
+    api_client, _ = auth_client
+    url = f"{POINT_BALANCE_LIST_URL}?user_id=12345&program_id={create_program.id}"
+    etag = api_client.get(url)["ETag"]
+
+    LoyaltyTier.objects.create(program=create_program, tier_name="Silver", points_to_reach=50)
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("url", [LOYALTY_TIER_LIST_URL, SPECIAL_TASK_LIST_URL])
+def test_program_config_not_modified(auth_client, create_program, url):
+    """ Tier and task lists revalidate against the program's config version """
+    api_client, _ = auth_client
+    url = f"{url}?program_id={create_program.id}"
+
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert len(response.data) == 1
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    assert response.status_code == 304
+
+
+def test_program_config_etag_changes_on_edit(auth_client, create_program):
+    """ Saving or deleting a task changes the task list ETag """
+    api_client, _ = auth_client
+    url = f"{SPECIAL_TASK_LIST_URL}?program_id={create_program.id}"
+    etag = api_client.get(url)["ETag"]
+
+    SpecialTask.objects.get(program=create_program).delete()
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data == []
@@ -0,0 +1,99 @@
+import pytest
+from django.db.models import F
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from loyalty.models import LoyaltyProgram, LoyaltyTier, SpecialTask
+
+# API Endpoints
+LOYALTY_TIER_LIST_URL = "/api/loyalty-tiers/"
+SPECIAL_TASK_LIST_URL = "/api/special-tasks/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def api_client():
+    """ Returns an APIClient instance """
+    return APIClient()
+
+
+@pytest.fixture
+def auth_client(api_client):
+    """ Authenticated API client for the program owner """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    token = Token.objects.create(user=owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return api_client, owner
+
+
+@pytest.fixture
+def create_program(auth_client):
+    """ Program with one tier and one task """
+    _, owner = auth_client
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    LoyaltyTier.objects.create(program=program, tier_name="Bronze", points_to_reach=100)
+    SpecialTask.objects.create(name="Buy once", program=program, description="One purchase",
+                               transactions_required=1, duration_days=7)
+    return program
+
+
+@pytest.mark.parametrize("url", [LOYALTY_TIER_LIST_URL, SPECIAL_TASK_LIST_URL])
+def test_config_list_served_from_cache(auth_client, create_program, url, django_assert_num_queries):
+    """ Once cached, a configuration list costs the version lookup on top of authentication """
+    api_client, _ = auth_client
+    url = f"{url}?program_id={create_program.id}"
+    first = api_client.get(url)
+
+    with django_assert_num_queries(2):  # Token lookup + config version
+        second = api_client.get(url)
+
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert second["ETag"] == first["ETag"]
+
+
+def test_tier_save_invalidates_cache(auth_client, create_program):
+    """ Saving a tier bumps the program version, so the next read is rebuilt """
+    api_client, _ = auth_client
+    url = f"{LOYALTY_TIER_LIST_URL}?program_id={create_program.id}"
+    api_client.get(url)
+
+    LoyaltyTier.objects.create(program=create_program, tier_name="Silver", points_to_reach=300)
+
+    response = api_client.get(url)
+    assert [tier["tier_name"] for tier in response.data] == ["Bronze", "Silver"]
+
+
+def test_task_delete_invalidates_cache(auth_client, create_program):
+    """ Deleting a task through the API drops it from the cached list """
+    api_client, _ = auth_client
+    url = f"{SPECIAL_TASK_LIST_URL}?program_id={create_program.id}"
+    task_id = api_client.get(url).data[0]["id"]
+
+    api_client.delete(f"{SPECIAL_TASK_LIST_URL}{task_id}/")
+
+    assert api_client.get(url).data == []
+
+
+def test_program_save_bumps_version(create_program):
+    """ Editing the program itself bumps its configuration version """
+    version = LoyaltyProgram.objects.get(id=create_program.id).config_version
+    create_program.name = "Gold Rewards"
+    create_program.save()
+
+    assert LoyaltyProgram.objects.get(id=create_program.id).config_version == version + 1
+
+
+def test_version_is_read_from_the_database(auth_client, create_program):
+    """ A bump made by another worker (not seen by this process's cache) invalidates the cached list at once """
+    api_client, _ = auth_client
+    url = f"{LOYALTY_TIER_LIST_URL}?program_id={create_program.id}"
+    etag = api_client.get(url)["ETag"]
+
+    LoyaltyTier.objects.bulk_create([LoyaltyTier(program=create_program, tier_name="Gold", points_to_reach=900)])
+    LoyaltyProgram.objects.filter(id=create_program.id).update(config_version=F("config_version") + 1)
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert [tier["tier_name"] for tier in response.data] == ["Bronze", "Gold"]
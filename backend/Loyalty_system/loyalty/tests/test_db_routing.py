@@ -0,0 +1,123 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.checks import run_checks
+from django.db import connections, transaction
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.checks import check_shared_caches
+from loyalty.db_routers import PrimaryReplicaRouter
+from loyalty.models import LoyaltyProgram, Transaction
+
+# API Endpoints
+TRANSACTION_LIST_URL = "/api/transactions/"
+
+# Transactional tests: inside the usual per-test transaction every read would stay on the primary
+pytestmark = [
+    pytest.mark.django_db(databases=["default", "replica"], transaction=True),
+    pytest.mark.usefixtures("use_replica"),
+]
+
+
+@pytest.fixture
+def use_replica():
+    """ Route reads to the 'replica' alias (a test mirror of 'default') """
+    with override_settings(LOYALTY_READ_REPLICAS=["replica"], LOYALTY_PRIMARY_STICKINESS_SECONDS=60):
+        yield
+    connections["replica"].close()
+
+
+@pytest.fixture
+def auth_client():
+    """ Authenticated API client for the program owner and their program """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    token = Token.objects.create(user=owner)
+    api_client = APIClient()
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return api_client, LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+@pytest.fixture
+def record_aliases(monkeypatch):
+    """ Record which alias every read is routed to """
+    aliases = []
+    original = PrimaryReplicaRouter.db_for_read
+
+    def db_for_read(self, model, **hints):
+        alias = original(self, model, **hints)
+        aliases.append(alias)
+        return alias
+
+    monkeypatch.setattr(PrimaryReplicaRouter, "db_for_read", db_for_read)
+    return aliases
+
+
+def test_reads_go_to_replica_and_writes_to_primary():
+    """ Safe reads use a replica alias, writes always use 'default' """
+    router = PrimaryReplicaRouter()
+
+    assert router.db_for_read(Transaction) == "replica"
+    assert router.db_for_write(Transaction) == "default"
+    assert router.allow_migrate("replica", "loyalty") is False
+
+
+def test_reads_inside_transaction_stay_on_primary():
+    """ Reads in an open transaction on the primary never go to a replica """
+    with transaction.atomic():
+        assert PrimaryReplicaRouter().db_for_read(Transaction) == "default"
+
+
+@override_settings(LOYALTY_READ_REPLICAS=[])
+def test_no_replicas_configured():
+    """ Without replicas everything stays on 'default' """
+    assert PrimaryReplicaRouter().db_for_read(Transaction) == "default"
+
+
+def test_client_is_pinned_to_primary_after_write(auth_client, record_aliases):
+    """ A GET right after a POST from the same client reads from the primary """
+    api_client, program = auth_client
+    url = f"{TRANSACTION_LIST_URL}?program_id={program.id}"
+
+    api_client.get(url)
+    assert "replica" in record_aliases
+
+    data = {"user_id": "12345", "program": program.id, "transaction_type": "earn", "points": 100}
+    assert api_client.post(TRANSACTION_LIST_URL, data).status_code == 201
+
+    record_aliases.clear()
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert len(response.data) == 1
+    assert set(record_aliases) == {"default"}
+
+
+def test_other_clients_keep_reading_from_replica(auth_client, record_aliases):
+    """ Pinning is per client: a different token is not affected by another client's write """
+    api_client, program = auth_client
+    data = {"user_id": "12345", "program": program.id, "transaction_type": "earn", "points": 100}
+    api_client.post(TRANSACTION_LIST_URL, data)
+
+    other_user = User.objects.create_user(username="reader", password="securepassword")
+    other_client = APIClient()
+    other_client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=other_user).key}")
+
+    record_aliases.clear()
+    other_client.get("/api/loyalty-programs/")
+    assert set(record_aliases) == {"replica"}
+
+
+def test_stickiness_pins_require_a_shared_cache():
+    """ The deployment check reports a per-process pin cache """
+    redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://cache:6379"}}
+    with override_settings(LOYALTY_THROTTLE_RATES={}):
+        errors = check_shared_caches()
+    assert [error.id for error in errors] == ["loyalty.E001"]
+    assert "LOYALTY_PRIMARY_STICKINESS_CACHE" in errors[0].msg
+    with override_settings(CACHES=redis):
+        assert check_shared_caches() == []
+    with override_settings(LOYALTY_READ_REPLICAS=[], LOYALTY_THROTTLE_RATES={}):
+        assert check_shared_caches() == []  # No replicas, no pins
+
+    assert "loyalty.E001" in [error.id for error in run_checks(include_deployment_checks=True)]
+    assert "loyalty.E001" not in [error.id for error in run_checks()]  # Other commands keep working
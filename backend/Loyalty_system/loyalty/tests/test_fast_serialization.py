@@ -0,0 +1,94 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from loyalty.fast_serializers import serialize_transactions, serialize_point_balances
+from loyalty.models import LoyaltyProgram, LoyaltyTier, PointBalance, Transaction
+from loyalty.renderers import ORJSONRenderer
+from loyalty.serializers import TransactionSerializer, PointBalanceSerializer
+
+# API Endpoints
+TRANSACTION_LIST_URL = "/api/transactions/"
+POINT_BALANCE_BULK_URL = "/api/point-balances/bulk/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def create_program(db):
+    """ Program with tiers, a few transactions and balances """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    LoyaltyTier.objects.create(program=program, tier_name="Bronze", points_to_reach=100)
+    for user_id, points in (("1", 50), ("2", 150), ("1", 75)):
+        Transaction.objects.create(user_id=user_id, program=program, transaction_type="earn", points=points)
+    return program
+
+
+def test_fast_transactions_match_model_serializer(create_program):
+    """ The values() fast path produces exactly the TransactionSerializer output """
+    queryset = Transaction.objects.filter(program=create_program).order_by("id")
+
+    assert serialize_transactions(queryset) == TransactionSerializer(queryset, many=True).data
+
+
+def test_fast_point_balances_match_model_serializer(create_program):
+    """ The values() fast path produces exactly the PointBalanceSerializer output, tiers included """
+    queryset = PointBalance.objects.filter(program=create_program).order_by("id")
+
+    assert serialize_point_balances(queryset) == PointBalanceSerializer(queryset, many=True).data
+
+
+def test_orjson_renderer_matches_json_renderer(create_program):
+    """ ORJSONRenderer emits the same JSON as DRF's JSONRenderer, including fallback types """
+    data = {
+        "rows": TransactionSerializer(Transaction.objects.order_by("id"), many=True).data,
+        "amount": Decimal("1.50"),
+        "created": Transaction.objects.first().timestamp,
+    }
+
+    assert json.loads(ORJSONRenderer().render(data)) == json.loads(JSONRenderer().render(data))
+
+
+def test_transaction_list_uses_orjson(create_program):
+    """ The transaction list responds with JSON rendered by the fast path """
+    api_client = APIClient()
+    token = Token.objects.create(user=create_program.owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    response = api_client.get(f"{TRANSACTION_LIST_URL}?program_id={create_program.id}&user_id=1")
+
+    assert response.status_code == 200
+    assert response["Content-Type"] == "application/json"
+    assert [row["points"] for row in response.json()] == [50, 75]
+
+
+def test_orjson_parser_handles_json_bodies(create_program):
+    """ JSON request bodies go through ORJSONParser; malformed bodies are a 400 """
+    api_client = APIClient()
+    token = Token.objects.create(user=create_program.owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    data = {"user_id": "3", "program": create_program.id, "transaction_type": "earn", "points": 10}
+    response = api_client.post(TRANSACTION_LIST_URL, data, format="json")
+    assert response.status_code == 201
+
+    response = api_client.post(TRANSACTION_LIST_URL, "{not json", content_type="application/json")
+    assert response.status_code == 400
+
+
+def test_orjson_renderer_renders_list_validation_errors(create_program):
+    """ ListField errors are keyed by item index (int keys); they render as a 400, not a 500 """
+    api_client = APIClient()
+    token = Token.objects.create(user=create_program.owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    response = api_client.post(POINT_BALANCE_BULK_URL, {"user_ids": ["1"], "program_ids": ["abc"]}, format="json")
+
+    assert response.status_code == 400
+    assert "0" in response.json()["program_ids"]
@@ -0,0 +1,100 @@
+import pytest
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier, PointBalance, SpecialTask, Transaction, UserTaskProgress
+from loyalty.services import task_completion_percent
+
+# API Endpoints
+MEMBER_SUMMARY_URL = "/api/point-balances/summary/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def program(owner):
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    for name, points in (("Silver", 100), ("Gold", 500), ("Platinum", 1000)):
+        LoyaltyTier.objects.create(program=program, tier_name=name, points_to_reach=points)
+    return program
+
+
+@pytest.fixture
+def auth_client(owner):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client
+
+
+def create_task(program, name, **requirements):
+    return SpecialTask.objects.create(name=name, program=program, description=f"{name} description", duration_days=30,
+                                      **requirements)
+
+
+def test_summary_of_a_member(auth_client, program):
+    for points in (150, 50, 30):
+        Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=points)
+    Transaction.objects.create(user_id="1", program=program, transaction_type="redeem", points=80)
+    Transaction.objects.create(user_id="2", program=program, transaction_type="earn", points=999)
+    spend = create_task(program, "Spend 500", points_required=500, reward_points=50)
+    visits = create_task(program, "Five visits", transactions_required=5)
+    done = create_task(program, "First purchase", transactions_required=1)
+    UserTaskProgress.objects.create(user_id="1", task=spend, points_earned=230, transactions_count=3)
+    UserTaskProgress.objects.create(user_id="1", task=done, transactions_count=1, completed_at=now())
+
+    response = auth_client.get(MEMBER_SUMMARY_URL, {"user_id": "1", "program_id": program.id, "transactions": 2})
+
+    assert response.status_code == 200
+    data = response.data
+    assert (data["balance"], data["total_points_earned"], data["tier"]) == (150, 230, "Silver")
+    assert (data["next_tier"], data["points_to_next_tier"]) == ("Gold", 270)
+    assert [(row["transaction_type"], row["points"]) for row in data["recent_transactions"]] == [
+        ("redeem", 80), ("earn", 30)]
+    assert [(task["task"], task["task_name"], task["points_earned"], task["percent"]) for task in data["tasks"]] == [
+        (spend.id, "Spend 500", 230, 46), (visits.id, "Five visits", 0, 0)]
+
+
+def test_summary_at_the_top_tier(auth_client, program):
+    PointBalance.objects.create(user_id="1", program=program, balance=5, total_points_earned=1200)
+
+    data = auth_client.get(MEMBER_SUMMARY_URL, {"user_id": "1", "program_id": program.id}).data
+
+    assert (data["tier"], data["next_tier"], data["points_to_next_tier"]) == ("Platinum", None, None)
+    assert data["recent_transactions"] == [] and data["tasks"] == []
+
+
+def test_summary_costs_a_fixed_number_of_queries(auth_client, program, django_assert_num_queries):
+    for number in range(10):
+        task = create_task(program, f"Task {number}", points_required=100, transactions_required=4)
+        UserTaskProgress.objects.create(user_id="1", task=task, points_earned=10 * number, transactions_count=number)
+        Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=number + 1)
+
+    with django_assert_num_queries(5):  # Token lookup + balance + tiers + transactions + tasks with progress
+        response = auth_client.get(MEMBER_SUMMARY_URL, {"user_id": "1", "program_id": program.id})
+
+    assert len(response.data["tasks"]) == 10
+    assert len(response.data["recent_transactions"]) == 10
+
+
+def test_summary_errors(auth_client, program):
+    assert auth_client.get(MEMBER_SUMMARY_URL, {"user_id": "1"}).status_code == 400
+    PointBalance.objects.create(user_id="1", program=program)
+    assert auth_client.get(MEMBER_SUMMARY_URL, {"user_id": "2", "program_id": program.id}).status_code == 404
+
+    intruder = User.objects.create_user(username="intruder", password="securepassword")
+    auth_client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=intruder).key}")
+    assert auth_client.get(MEMBER_SUMMARY_URL, {"user_id": "1", "program_id": program.id}).status_code == 403
+
+
+def test_completion_percent():
+    assert task_completion_percent(50, 100, 4, 4) == 50
+    assert task_completion_percent(300, 100, 1, 4) == 25
+    assert task_completion_percent(300, 100, 0, 0) == 100
+    assert task_completion_percent(0, 0, 0, 0) == 100
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from django.contrib.auth.models import User
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier, OutboxEvent, TaskProgressJob, Transaction
+
+# API Endpoints
+METRICS_URL = "/metrics"
+EARN_POINTS_URL = "/api/points/?action=earn"
+LOYALTY_TIER_LIST_URL = "/api/loyalty-tiers/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def auth_client():
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client, LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_and_service_latency_are_recorded(auth_client):
+    client, program = auth_client
+    requests_before = sample("loyalty_http_request_duration_seconds_count",
+                             route="points-list", method="POST", status="200")
+    earn_before = sample("loyalty_service_duration_seconds_count", operation="earn_points")
+    signal_before = sample("loyalty_service_duration_seconds_count", operation="balance_signal")
+    queries_before = sample("loyalty_db_query_duration_seconds_count", alias="default")
+
+    client.post(EARN_POINTS_URL, {"user_id": "1", "program_id": program.id, "points": 10}, format="json")
+    Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=5)
+
+    assert sample("loyalty_http_request_duration_seconds_count",
+                  route="points-list", method="POST", status="200") == requests_before + 1
+    assert sample("loyalty_service_duration_seconds_count", operation="earn_points") == earn_before + 1
+    assert sample("loyalty_service_duration_seconds_count", operation="balance_signal") == signal_before + 1
+    assert sample("loyalty_db_query_duration_seconds_count", alias="default") > queries_before
+
+
+def test_config_cache_hits_and_misses(auth_client):
+    client, program = auth_client
+    LoyaltyTier.objects.create(program=program, tier_name="Silver", points_to_reach=100)
+    hits = sample("loyalty_config_cache_requests_total", resource="tiers", result="hit")
+    misses = sample("loyalty_config_cache_requests_total", resource="tiers", result="miss")
+
+    client.get(LOYALTY_TIER_LIST_URL, {"program_id": program.id})
+    client.get(LOYALTY_TIER_LIST_URL, {"program_id": program.id})
+
+    assert sample("loyalty_config_cache_requests_total", resource="tiers", result="miss") == misses + 1
+    assert sample("loyalty_config_cache_requests_total", resource="tiers", result="hit") == hits + 1
+
+
+def test_metrics_endpoint_reports_queue_depths(auth_client):
+    client, program = auth_client
+    transaction = Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=5)
+    TaskProgressJob.objects.create(transaction=transaction, program=program)
+    TaskProgressJob.objects.create(transaction=transaction, program=program, status="failed")
+    OutboxEvent.record(program.id, "tier.changed", {"user_id": "1"})
+
+    response = APIClient().get(METRICS_URL)
+
+    assert response.status_code == 200
+    body = response.content.decode()
+    assert 'loyalty_queue_depth{queue="task_progress",status="pending"} 1.0' in body
+    assert 'loyalty_queue_depth{queue="task_progress",status="failed"} 1.0' in body
+    assert 'loyalty_queue_depth{queue="outbox",status="pending"} 1.0' in body
+    assert "loyalty_http_request_duration_seconds_bucket" in body
+
+
+def test_metrics_token(settings):
+    settings.LOYALTY_METRICS_TOKEN = "secret"
+
+    assert APIClient().get(METRICS_URL).status_code == 403
+    assert APIClient().get(METRICS_URL, HTTP_AUTHORIZATION="Bearer secret").status_code == 200
+
+
+def test_multiprocess_values_are_merged(tmp_path, monkeypatch):
+    """ Values written by other worker processes show up in /metrics """
+    code = (
+        "from loyalty.metrics import SERVICE_LATENCY; "
+        "SERVICE_LATENCY.labels('redeem_points').observe(0.25)"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True,
+                   env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path),
+                        "DJANGO_SETTINGS_MODULE": "Loyalty_system.settings.local"})
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    body = APIClient().get(METRICS_URL).content.decode()
+
+    assert 'loyalty_service_duration_seconds_sum{operation="redeem_points"} 0.25' in body
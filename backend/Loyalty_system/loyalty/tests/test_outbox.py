@@ -0,0 +1,147 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils.timezone import now
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier, OutboxEvent, PointBalance, SpecialTask, Transaction, \
+    UserTaskProgress
+from loyalty.outbox import dispatch_outbox_events
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def webhook_server():
+    """ Local stub webhook that records request bodies and can be told to fail """
+    received = []
+    state = {"fail_next": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if state["fail_next"]:
+                state["fail_next"] -= 1
+                self.send_response(500)
+            else:
+                received.append(json.loads(body))
+                self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/hook", received, state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def create_program(webhook_server):
+    """ Program with tiers whose owner registered the stub webhook """
+    url, _, _ = webhook_server
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner, webhook_url=url)
+    LoyaltyTier.objects.create(program=program, tier_name="Silver", points_to_reach=100)
+    LoyaltyTier.objects.create(program=program, tier_name="Gold", points_to_reach=500)
+    return program
+
+
+def test_tier_change_is_recorded_with_balance_update(create_program):
+    """ Earning past a tier threshold writes a tier.changed event, staying below it does not """
+    Transaction.objects.create(user_id="1", program=create_program, transaction_type="earn", points=50)
+    assert not OutboxEvent.objects.exists()
+
+    Transaction.objects.create(user_id="1", program=create_program, transaction_type="earn", points=60)
+
+    event = OutboxEvent.objects.get()
+    assert event.event_type == "tier.changed"
+    assert event.payload == {"user_id": "1", "previous_tier": None, "tier": "Silver", "total_points_earned": 110}
+
+
+def test_add_points_records_tier_change(create_program):
+    """ PointBalance.add_points goes through the same outbox path """
+    balance = PointBalance.objects.create(user_id="1", program=create_program, total_points_earned=400)
+    balance.add_points(150)
+
+    assert OutboxEvent.objects.get().payload["tier"] == "Gold"
+
+
+def test_task_completion_is_recorded(create_program):
+    """ Completing a special task writes a task.completed event """
+    task = SpecialTask.objects.create(name="Big spender", program=create_program, description="Earn 10",
+                                      points_required=10, duration_days=7)
+    progress = UserTaskProgress.objects.create(user_id="1", task=task, points_earned=10)
+    progress.reward_user()
+
+    event = OutboxEvent.objects.get(event_type="task.completed")
+    assert event.payload["task_id"] == task.id
+
+
+def test_dispatcher_delivers_batched_events(create_program, webhook_server):
+    """ All due events of a program are delivered in one POST and marked delivered """
+    _, received, _ = webhook_server
+    for user_id in ("1", "2", "3"):
+        OutboxEvent.record(create_program.id, "tier.changed", {"user_id": user_id})
+
+    assert dispatch_outbox_events() == (3, 0)
+
+    assert len(received) == 1
+    assert [event["data"]["user_id"] for event in received[0]["events"]] == ["1", "2", "3"]
+    assert set(OutboxEvent.objects.values_list("status", flat=True)) == {"delivered"}
+
+
+def test_dispatcher_retries_with_backoff(create_program, webhook_server):
+    """ A failed delivery is rescheduled and succeeds on a later attempt """
+    _, received, state = webhook_server
+    state["fail_next"] = 1
+    event = OutboxEvent.record(create_program.id, "tier.changed", {"user_id": "1"})
+
+    assert dispatch_outbox_events() == (0, 1)
+    event.refresh_from_db()
+    assert event.status == "pending"
+    assert event.attempts == 1
+    assert event.next_attempt_at > now()
+
+    assert dispatch_outbox_events() == (0, 0)  # Not due yet
+
+    OutboxEvent.objects.update(next_attempt_at=now())
+    assert dispatch_outbox_events() == (1, 0)
+    assert len(received) == 1
+
+
+def test_events_without_webhook_wait_for_one(create_program, webhook_server):
+    """ Programs without a webhook URL keep their events until one is configured """
+    url, received, _ = webhook_server
+    LoyaltyProgram.objects.filter(id=create_program.id).update(webhook_url="")
+    OutboxEvent.record(create_program.id, "tier.changed", {"user_id": "1"})
+
+    assert dispatch_outbox_events() == (0, 0)
+    assert OutboxEvent.objects.get().status == "pending"
+
+    LoyaltyProgram.objects.filter(id=create_program.id).update(webhook_url=url)
+    assert dispatch_outbox_events() == (1, 0)
+    assert len(received) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_webhooks_are_called_outside_the_claiming_transaction(create_program, monkeypatch):
+    """ Claimed events are leased and committed before delivery, so no row lock is held during the POST """
+    event = OutboxEvent.record(create_program.id, "tier.changed", {"user_id": "1"})
+    seen = {}
+
+    def post_webhook(url, events, timeout):
+        seen["in_transaction"] = connection.in_atomic_block
+        seen["next_attempt_at"] = OutboxEvent.objects.get(id=event.id).next_attempt_at
+
+    monkeypatch.setattr("loyalty.outbox.post_webhook", post_webhook)
+    assert dispatch_outbox_events(timeout=5) == (1, 0)
+
+    assert seen["in_transaction"] is False
+    assert seen["next_attempt_at"] > now()  # Leased: other dispatchers skip it meanwhile
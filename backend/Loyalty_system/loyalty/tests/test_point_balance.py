@@ -153,3 +153,72 @@ def test_get_point_balance_missing_params(auth_client):
 
     assert response.status_code == 400  # Bad Request
     assert response.data["error"] == "Both user_id and program_id are required."
+
+
+POINT_BALANCE_BULK_URL = f"{POINT_BALANCE_LIST_URL}bulk/"
+
+
+@pytest.fixture
+def create_many_balances(create_loyalty_program, create_loyalty_tiers):
+    """ Create balances for several users in two programs of the owner """
+    program = create_loyalty_program
+    other_program = LoyaltyProgram.objects.create(name="Coffee Club", owner=program.owner)
+    for index, earned in enumerate([0, 150, 350, 600]):
+        PointBalance.objects.create(user_id=str(index), program=program, balance=earned, total_points_earned=earned)
+    PointBalance.objects.create(user_id="1", program=other_program, balance=10, total_points_earned=10)
+    return program, other_program
+
+
+# ✅ **10. Test bulk lookup of many members in one program**
+def test_bulk_point_balances_for_members(auth_client, create_many_balances, django_assert_num_queries):
+    """ Test that many balances and their tiers are resolved with a single balance query """
+    api_client, _ = auth_client
+    program, _ = create_many_balances
+
+    with django_assert_num_queries(2):  # Token lookup + balances with tiers
+        response = api_client.post(
+            POINT_BALANCE_BULK_URL, {"user_ids": ["0", "1", "2", "3", "404"], "program_ids": [program.id]},
+            format="json"
+        )
+
+    assert response.status_code == 200
+    assert [(row["user_id"], row["tier"]) for row in response.data] == [
+        ("0", "No Tier"), ("1", "Bronze"), ("2", "Silver"), ("3", "Gold")
+    ]
+
+
+# ✅ **11. Test bulk lookup of one member across programs**
+def test_bulk_point_balances_across_programs(auth_client, create_many_balances):
+    """ Test fetching one user's balances in every program of the owner via GET """
+    api_client, _ = auth_client
+    program, other_program = create_many_balances
+
+    response = api_client.get(f"{POINT_BALANCE_BULK_URL}?user_ids=1")
+
+    assert response.status_code == 200
+    assert [row["program"] for row in response.data] == [program.id, other_program.id]
+
+
+# ✅ **12. Test bulk lookup is scoped to the owner's programs**
+def test_bulk_point_balances_only_owner(api_client, create_users, create_many_balances):
+    """ Test that another user gets no balances from programs they do not own """
+    _, another_user = create_users
+    token = Token.objects.create(user=another_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    response = api_client.get(f"{POINT_BALANCE_BULK_URL}?user_ids=0,1,2")
+
+    assert response.status_code == 200
+    assert response.data == []
+
+
+# ✅ **13. Test bulk lookup requires user ids**
+def test_bulk_point_balances_missing_user_ids(auth_client, create_many_balances):
+    """ Test that the lookup is rejected without user_ids """
+    api_client, _ = auth_client
+    program, _ = create_many_balances
+
+    response = api_client.get(f"{POINT_BALANCE_BULK_URL}?program_ids={program.id}")
+
+    assert response.status_code == 400
+    assert "user_ids" in response.data
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram
+from loyalty.profiling import collected_profiles
+
+# API Endpoints
+LOYALTY_PROGRAM_LIST_URL = "/api/loyalty-programs/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def auth_client():
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client
+
+
+def profiling(tmp_path, **overrides):
+    """ Middleware settings are read when the handler loads, which the test client does per request """
+    config = {"ENABLED": True, "SAMPLE_RATE": 1.0, "SLOW_REQUEST_MS": 0, "DIRECTORY": tmp_path, "MAX_PROFILES": 3}
+    return override_settings(LOYALTY_PROFILING={**config, **overrides})
+
+
+def test_profiles_are_written_with_metadata(auth_client, tmp_path):
+    with profiling(tmp_path):
+        response = auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    assert response.status_code == 200
+    [(path, metadata)] = collected_profiles(tmp_path)
+    assert path.suffix == ".prof"
+    assert metadata["view"] == "loyaltyprogram-list"
+    assert metadata["status"] == 200
+    assert metadata["query_count"] >= 2  # Token lookup and the program list
+
+
+def test_sampled_requests_are_kept_even_when_fast(auth_client, tmp_path):
+    with profiling(tmp_path, SLOW_REQUEST_MS=60_000):
+        auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    [(_, metadata)] = collected_profiles(tmp_path)
+    assert metadata["sampled"] is True
+
+
+def test_fast_unsampled_requests_are_not_profiled(auth_client, tmp_path):
+    with profiling(tmp_path, SAMPLE_RATE=0.0, SLOW_REQUEST_MS=60_000):
+        for _ in range(3):
+            auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    assert collected_profiles(tmp_path) == []
+
+
+def test_slow_unsampled_requests_get_their_view_profiled(auth_client, tmp_path):
+    """ A slow unprofiled request flags its view; the next slow request to it is profiled and kept """
+    with profiling(tmp_path, SAMPLE_RATE=0.0):
+        auth_client.get(LOYALTY_PROGRAM_LIST_URL)  # Only timed
+        assert collected_profiles(tmp_path) == []
+
+        auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+        [(_, metadata)] = collected_profiles(tmp_path)
+        assert (metadata["view"], metadata["sampled"]) == ("loyaltyprogram-list", False)
+
+        auth_client.get(LOYALTY_PROGRAM_LIST_URL)  # The flag was cleared: timed again
+        assert len(collected_profiles(tmp_path)) == 1
+
+
+def test_ring_keeps_newest_profiles(auth_client, tmp_path):
+    with profiling(tmp_path):
+        for _ in range(5):
+            auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    assert len(collected_profiles(tmp_path)) == 3
+    assert len(list(tmp_path.glob("*.json"))) == 3
+
+
+def test_disabled_by_default(auth_client, tmp_path, settings):
+    settings.LOYALTY_PROFILING = {"DIRECTORY": tmp_path, "SAMPLE_RATE": 1.0, "SLOW_REQUEST_MS": 0}
+    auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    assert not tmp_path.exists() or collected_profiles(tmp_path) == []
+
+
+def test_profile_report(auth_client, tmp_path):
+    with profiling(tmp_path):
+        auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+        auth_client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    out = io.StringIO()
+    call_command("profile_report", "--directory", str(tmp_path), "--limit", "5", stdout=out)
+
+    report = out.getvalue()
+    assert "2 profiles" in report
+    assert "loyaltyprogram-list" in report
+    assert "function calls" in report
@@ -0,0 +1,137 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Count, Sum
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, PointBalance, ProgramAggregate, Transaction
+
+# API Endpoints
+POINTS_URL = "/api/points/"
+POINT_BALANCE_URL = "/api/point-balances/"
+LIABILITY_URL = "/api/loyalty-programs/{}/liability/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def auth_client():
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client, LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+def totals_from_balances(program):
+    totals = PointBalance.objects.filter(program=program).aggregate(
+        outstanding=Sum("balance"), earned=Sum("total_points_earned"), members=Count("id"))
+    return totals["outstanding"], totals["earned"], totals["earned"] - totals["outstanding"], totals["members"]
+
+
+def stored_totals(program):
+    totals = ProgramAggregate.objects.filter(program=program).aggregate(
+        *(Sum(field) for field in ("outstanding_points", "lifetime_earned", "lifetime_redeemed", "member_count")))
+    return tuple(totals.values())
+
+
+def test_every_balance_change_updates_the_aggregate(auth_client):
+    client, program = auth_client
+    client.post(POINTS_URL + "?action=earn", {"user_id": "1", "program_id": program.id, "points": 100}, format="json")
+    client.post(POINTS_URL + "?action=redeem", {"user_id": "1", "program_id": program.id, "points": 30}, format="json")
+    Transaction.objects.create(user_id="2", program=program, transaction_type="earn", points=50)
+    Transaction.objects.create(user_id="2", program=program, transaction_type="redeem", points=80)  # Clamped to 50
+
+    assert stored_totals(program) == (70, 150, 80, 2)
+    assert stored_totals(program) == totals_from_balances(program)
+
+    balance = PointBalance.objects.get(user_id="1", program=program)
+    client.patch(f"{POINT_BALANCE_URL}{balance.id}/", {"balance": 90}, format="json")
+    client.delete(f"{POINT_BALANCE_URL}{PointBalance.objects.get(user_id='2').id}/")
+
+    assert stored_totals(program) == (90, 100, 10, 1)
+    assert stored_totals(program) == totals_from_balances(program)
+
+
+def test_aggregate_rolls_back_with_the_balance(auth_client):
+    _, program = auth_client
+    PointBalance.objects.create(user_id="1", program=program, balance=10, total_points_earned=10)
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            PointBalance.objects.get(user_id="1").add_points(25)
+            raise RuntimeError
+
+    assert stored_totals(program) == (10, 10, 0, 1)
+
+
+def test_members_are_spread_over_aggregate_rows(auth_client, settings):
+    """ Balance writes of different members land on different rows; a member always hits the same one """
+    _, program = auth_client
+    settings.LOYALTY_AGGREGATE_SLOTS = 4
+    for user_id in range(20):
+        PointBalance.objects.create(user_id=str(user_id), program=program, balance=5, total_points_earned=5)
+    PointBalance.objects.get(user_id="7").add_points(10)
+
+    slots = set(ProgramAggregate.objects.filter(program=program).values_list("slot", flat=True))
+    assert len(slots) > 1 and slots <= {0, 1, 2, 3}
+    member_row = ProgramAggregate.objects.get(program=program, slot=ProgramAggregate.slot_for("7"))
+    assert member_row.outstanding_points >= 15
+    assert stored_totals(program) == totals_from_balances(program) == (110, 110, 0, 20)
+
+    settings.LOYALTY_AGGREGATE_SLOTS = 3  # Members move to other rows; only the sums matter
+    PointBalance.objects.get(user_id="7").delete()
+    assert stored_totals(program) == totals_from_balances(program) == (95, 95, 0, 19)
+
+
+def test_liability_is_a_single_query(auth_client, django_assert_num_queries):
+    client, program = auth_client
+    for user_id in range(20):
+        PointBalance.objects.create(user_id=str(user_id), program=program, balance=5, total_points_earned=8)
+
+    with django_assert_num_queries(3):  # Token, program ownership, sum of the aggregate rows
+        response = client.get(LIABILITY_URL.format(program.id))
+
+    assert response.status_code == 200
+    assert {key: response.data[key] for key in
+            ("outstanding_points", "lifetime_earned", "lifetime_redeemed", "member_count")} == {
+        "outstanding_points": 100, "lifetime_earned": 160, "lifetime_redeemed": 60, "member_count": 20}
+
+
+def test_liability_of_program_without_members(auth_client):
+    client, program = auth_client
+
+    response = client.get(LIABILITY_URL.format(program.id))
+
+    assert (response.data["outstanding_points"], response.data["member_count"]) == (0, 0)
+
+
+def test_liability_requires_ownership(auth_client):
+    _, program = auth_client
+    intruder = User.objects.create_user(username="intruder", password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=intruder).key}")
+
+    assert client.get(LIABILITY_URL.format(program.id)).status_code == 403
+
+
+def test_reconcile_corrects_drift(auth_client):
+    _, program = auth_client
+    for user_id in ("1", "2"):
+        PointBalance.objects.create(user_id=user_id, program=program, balance=40, total_points_earned=50)
+    PointBalance.objects.filter(user_id="2").update(balance=0)  # Queryset updates bypass the aggregates
+    PointBalance.objects.filter(user_id="1").delete()
+
+    output = StringIO()
+    call_command("reconcile_program_aggregates", stdout=output)
+
+    assert f"Program {program.id}: outstanding_points off by +80" in output.getvalue()
+    assert stored_totals(program) == totals_from_balances(program) == (0, 50, 50, 1)
+    assert ProgramAggregate.objects.get(program=program, slot=0).member_count == 1  # Totals gathered on slot 0
+
+    output = StringIO()
+    call_command("reconcile_program_aggregates", "--program", str(program.id), stdout=output)
+    assert "Reconciled 1 program(s), corrected 0." in output.getvalue()
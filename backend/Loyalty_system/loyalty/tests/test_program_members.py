@@ -0,0 +1,104 @@
+import pytest
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from loyalty.models import LoyaltyProgram, LoyaltyTier, PointBalance
+
+# API endpoints
+PROGRAM_MEMBERS_URL = lambda pk: f"/api/loyalty-programs/{pk}/members/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def api_client():
+    """ Returns an APIClient instance """
+    return APIClient()
+
+
+@pytest.fixture
+def auth_client(api_client):
+    """ Returns an authenticated API client for the program owner """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    token = Token.objects.create(user=owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return api_client, owner
+
+
+@pytest.fixture
+def create_members(auth_client):
+    """ Program with Silver/Gold tiers and ten members earning 0..900 points """
+    _, owner = auth_client
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    LoyaltyTier.objects.create(program=program, tier_name="Silver", points_to_reach=300)
+    LoyaltyTier.objects.create(program=program, tier_name="Gold", points_to_reach=700)
+    for index in range(10):
+        PointBalance.objects.create(user_id=f"user-{index}", program=program,
+                                    balance=index * 10, total_points_earned=index * 100)
+    return program
+
+
+def test_list_members_with_tiers(auth_client, create_members):
+    """ Members come back with their tier computed in SQL """
+    api_client, _ = auth_client
+    response = api_client.get(PROGRAM_MEMBERS_URL(create_members.id))
+
+    assert response.status_code == 200
+    tiers = {row["user_id"]: row["tier"] for row in response.data["results"]}
+    assert tiers["user-0"] == "No Tier"
+    assert tiers["user-3"] == "Silver"
+    assert tiers["user-9"] == "Gold"
+    assert response.data["next"] is None
+
+
+@pytest.mark.parametrize("page_size", [2, 8])
+def test_members_page_is_one_query(auth_client, create_members, page_size, django_assert_num_queries):
+    """ A page costs the same number of queries whatever its size """
+    api_client, _ = auth_client
+
+    with django_assert_num_queries(3):  # Token lookup + program ownership + one page query
+        response = api_client.get(f"{PROGRAM_MEMBERS_URL(create_members.id)}?page_size={page_size}")
+
+    assert len(response.data["results"]) == page_size
+    assert response.data["next"] is not None
+
+
+def test_filter_members(auth_client, create_members):
+    """ Filters on tier, balance and total earned can be combined """
+    api_client, _ = auth_client
+    url = PROGRAM_MEMBERS_URL(create_members.id)
+
+    response = api_client.get(f"{url}?tier=Silver")
+    assert [row["user_id"] for row in response.data["results"]] == ["user-3", "user-4", "user-5", "user-6"]
+
+    response = api_client.get(f"{url}?min_balance=20&max_total_earned=400&ordering=-balance")
+    assert [row["user_id"] for row in response.data["results"]] == ["user-4", "user-3", "user-2"]
+
+
+def test_members_pagination_links(auth_client, create_members):
+    """ The last page has no next link and a previous link """
+    api_client, _ = auth_client
+    response = api_client.get(f"{PROGRAM_MEMBERS_URL(create_members.id)}?page_size=4&page=3")
+
+    assert [row["user_id"] for row in response.data["results"]] == ["user-8", "user-9"]
+    assert response.data["next"] is None
+    assert "page=2" in response.data["previous"]
+
+
+def test_members_invalid_filter(auth_client, create_members):
+    """ Non-numeric filters are rejected """
+    api_client, _ = auth_client
+    response = api_client.get(f"{PROGRAM_MEMBERS_URL(create_members.id)}?min_balance=abc")
+
+    assert response.status_code == 400
+
+
+def test_only_owner_can_list_members(api_client, create_members):
+    """ Another user cannot list the members of a program they don't own """
+    another_user = User.objects.create_user(username="anotheruser", password="securepassword")
+    token = Token.objects.create(user=another_user)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    response = api_client.get(PROGRAM_MEMBERS_URL(create_members.id))
+
+    assert response.status_code == 403
@@ -0,0 +1,94 @@
+import logging
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, PointBalance, SpecialTask, UserTaskProgress
+from loyalty.query_inspection import inspect_queries, sql_shape
+
+# API Endpoints
+USER_TASK_PROGRESS_URL = "/api/user-task-progress/"
+LOYALTY_PROGRAM_LIST_URL = "/api/loyalty-programs/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def auth_client():
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client, LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+@pytest.fixture
+def create_progress(auth_client):
+    """ Five members with progress on five different tasks """
+    _, program = auth_client
+    for index in range(5):
+        task = SpecialTask.objects.create(name=f"Task {index}", program=program, description="Earn points",
+                                          points_required=100, duration_days=7)
+        UserTaskProgress.objects.create(user_id=str(index), task=task, points_earned=10)
+
+
+def test_sql_shape_ignores_literals_and_in_lists():
+    assert sql_shape("SELECT * FROM t WHERE id = 5 AND name = 'x'") == "SELECT * FROM t WHERE id = 0 AND name = ?"
+    assert sql_shape("SELECT * FROM t WHERE id IN (%s, %s, %s)") == sql_shape("SELECT * FROM t WHERE id IN (%s)")
+    assert sql_shape("SELECT * FROM loyalty_transaction_p2024_05") == "SELECT * FROM loyalty_transaction_p2024_05"
+
+
+def test_repeated_shapes_are_reported_with_stack(auth_client):
+    _, program = auth_client
+    for user_id in ("1", "2", "3"):
+        PointBalance.objects.create(user_id=user_id, program=program)
+
+    with inspect_queries() as inspector:
+        [str(balance) for balance in PointBalance.objects.all()]  # __str__ loads the program row per balance
+
+    [repeated] = inspector.repeated()
+    assert repeated.count == 3
+    assert 'FROM "loyalty_loyaltyprogram"' in repeated.shape
+    assert "test_query_inspection.py" in "".join(repeated.stack)
+
+
+def test_fixture_fails_on_n_plus_one(auth_client, assert_no_n_plus_one):
+    _, program = auth_client
+    for user_id in ("1", "2", "3"):
+        PointBalance.objects.create(user_id=user_id, program=program)
+
+    with pytest.raises(pytest.fail.Exception, match="Possible N\\+1"):
+        with assert_no_n_plus_one():
+            [balance.program.name for balance in PointBalance.objects.all()]
+
+
+def test_task_progress_list_has_no_n_plus_one(auth_client, create_progress, assert_no_n_plus_one):
+    """ Task name and description come from one joined query """
+    client, _ = auth_client
+
+    with assert_no_n_plus_one():
+        response = client.get(USER_TASK_PROGRESS_URL)
+
+    assert len(response.data) == 5
+    assert response.data[0]["task_name"] == "Task 0"
+
+
+def test_slow_queries_are_logged(auth_client, caplog):
+    with caplog.at_level(logging.WARNING, logger="loyalty.queries"):
+        with inspect_queries(slow_query_ms=0):
+            LoyaltyProgram.objects.count()
+
+    assert "Slow query" in caplog.text
+    assert "test_query_inspection.py" in caplog.text
+
+
+def test_middleware_reports_per_request(auth_client, settings, caplog):
+    settings.LOYALTY_QUERY_INSPECTION = {"ENABLED": True, "REPEAT_THRESHOLD": 1, "SLOW_QUERY_MS": 10_000}
+    client, _ = auth_client
+
+    with caplog.at_level(logging.WARNING, logger="loyalty.queries"):
+        response = client.get(LOYALTY_PROGRAM_LIST_URL)
+
+    assert int(response["X-Query-Count"]) >= 2
+    assert "Possible N+1 in GET /api/loyalty-programs/" in caplog.text
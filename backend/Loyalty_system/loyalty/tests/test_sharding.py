@@ -0,0 +1,239 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier, OutboxEvent, PointBalance, ProgramShard, \
+    ShardMoveCapture, ShardMoveChange, SpecialTask, TaskProgressJob, Transaction, UserTaskProgress
+from loyalty.outbox import dispatch_outbox_events
+from loyalty.services import process_task_progress_jobs, program_liability
+from loyalty.sharding import ShardFanOut, configure_shard_sequences, mirror_program, move_program, shard_for_program, \
+    use_program_shard
+
+# API Endpoints
+POINTS_URL = "/api/points/"
+POINT_BALANCE_URL = "/api/point-balances/"
+BULK_BALANCE_URL = "/api/point-balances/bulk/"
+LOYALTY_TIER_LIST_URL = "/api/loyalty-tiers/"
+TRANSACTION_LIST_URL = "/api/transactions/"
+CREATE_AND_UPDATE_URL = "/api/transactions/create_and_update_task_progress/"
+USER_TASK_PROGRESS_URL = "/api/user-task-progress/"
+
+pytestmark = [
+    pytest.mark.django_db(databases=["default", "shard_1"]),
+    pytest.mark.usefixtures("two_shards"),
+]
+
+
+@pytest.fixture
+def two_shards():
+    """ Program data spread over 'default' and 'shard_1', with interleaved ids and no directory caching """
+    with override_settings(LOYALTY_SHARDS=["default", "shard_1"], LOYALTY_SHARD_DIRECTORY_TTL=0):
+        configure_shard_sequences()
+        yield
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def auth_client(owner):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client
+
+
+@pytest.fixture
+def programs(owner):
+    """ Two programs: the first lands on 'default', the second on 'shard_1' """
+    return (LoyaltyProgram.objects.create(name="Coffee Club", owner=owner),
+            LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner))
+
+
+def test_new_programs_are_spread_and_mirrored(programs):
+    coffee, vip = programs
+
+    assert shard_for_program(coffee.id) == "default"
+    assert shard_for_program(vip.id) == "shard_1"
+    mirror = LoyaltyProgram.objects.using("shard_1").get(id=vip.id)
+    assert (mirror.name, mirror.owner.username) == ("VIP Rewards", "owner")
+
+    vip.webhook_url = "https://merchant.example/hooks"
+    vip.save()
+    assert LoyaltyProgram.objects.using("shard_1").get(id=vip.id).webhook_url == "https://merchant.example/hooks"
+
+
+def test_api_writes_land_on_the_programs_shard(auth_client, programs):
+    _, vip = programs
+
+    response = auth_client.post(POINTS_URL + "?action=earn", {"user_id": "1", "program_id": vip.id, "points": 50},
+                                format="json")
+    auth_client.post(TRANSACTION_LIST_URL, {"user_id": "1", "program": vip.id, "transaction_type": "earn",
+                                            "points": 25}, format="json")
+
+    assert response.status_code == 200
+    assert not PointBalance.objects.using("default").exists()
+    balance = PointBalance.objects.using("shard_1").get(user_id="1", program_id=vip.id)
+    assert (balance.balance, balance.total_points_earned) == (75, 75)  # The signal ran on the shard too
+
+    response = auth_client.get(POINT_BALANCE_URL, {"user_id": "1", "program_id": vip.id})
+    assert response.data["balance"] == 75
+
+
+def test_bulk_lookup_fans_out_and_merges(auth_client, programs):
+    coffee, vip = programs
+    PointBalance.objects.using("default").create(user_id="1", program=coffee, balance=10)
+    PointBalance.objects.using("shard_1").create(user_id="1", program=vip, balance=20)
+    PointBalance.objects.using("shard_1").create(user_id="2", program=vip, balance=30)
+
+    response = auth_client.get(BULK_BALANCE_URL, {"user_ids": "1,2"})
+
+    assert [(row["program"], row["user_id"], row["balance"]) for row in response.data] == [
+        (coffee.id, "1", 10), (vip.id, "1", 20), (vip.id, "2", 30),
+    ]
+
+
+def test_listing_without_program_fans_out(auth_client, programs):
+    coffee, vip = programs
+    LoyaltyTier.objects.using("shard_1").create(program=vip, tier_name="Gold", points_to_reach=500)
+    LoyaltyTier.objects.using("default").create(program=coffee, tier_name="Silver", points_to_reach=100)
+
+    response = auth_client.get(LOYALTY_TIER_LIST_URL)
+    assert [tier["tier_name"] for tier in response.data] == ["Silver", "Gold"]
+
+    response = auth_client.get(LOYALTY_TIER_LIST_URL, {"program_id": vip.id})
+    assert [tier["tier_name"] for tier in response.data] == ["Gold"]
+
+
+def test_fan_out_merges_limited_reads_in_order(programs, django_assert_num_queries):
+    """ Slices read at most `stop` rows per shard, honour descending fields and skip copies left by a move """
+    coffee, vip = programs
+    for points in (100, 300, 500):
+        LoyaltyTier.objects.using("default").create(program=coffee, tier_name=f"Coffee {points}",
+                                                    points_to_reach=points)
+        LoyaltyTier.objects.using("shard_1").create(program=vip, tier_name=f"VIP {points + 100}",
+                                                   points_to_reach=points + 100)
+    mirror_program(coffee, "shard_1")  # As a move that hasn't cleaned up yet leaves it
+    LoyaltyTier.objects.using("shard_1").create(program=coffee, tier_name="Stale copy", points_to_reach=150)
+
+    tiers = ShardFanOut({alias: LoyaltyTier.objects.using(alias).order_by("-points_to_reach")
+                         for alias in ("default", "shard_1")})
+    with django_assert_num_queries(1), django_assert_num_queries(1, connection=connections["shard_1"]):
+        page = tiers[1:4]  # One query per shard
+    assert [tier.tier_name for tier in page] == ["Coffee 500", "VIP 400", "Coffee 300"]
+    assert len(tiers) == 6
+
+
+def test_detail_routes_find_objects_on_any_shard(auth_client, programs):
+    _, vip = programs
+    task = SpecialTask.objects.using("shard_1").create(name="Spend 100", program=vip, description="Spend",
+                                                       points_required=100, duration_days=7)
+
+    response = auth_client.post(USER_TASK_PROGRESS_URL, {"user_id": "1", "task": task.id, "points_earned": 40},
+                                format="json")
+    assert response.status_code == 201
+    progress = UserTaskProgress.objects.using("shard_1").get(user_id="1", task=task)
+
+    response = auth_client.patch(f"{USER_TASK_PROGRESS_URL}{progress.id}/", {"points_earned": 100}, format="json")
+    assert response.status_code == 200
+    assert response.data["completed_at"] is not None
+    assert OutboxEvent.objects.using("shard_1").filter(event_type="task.completed").count() == 1
+
+
+def test_workers_drain_every_shard(auth_client, programs):
+    coffee, vip = programs
+    for program in programs:
+        with use_program_shard(program.id):
+            SpecialTask.objects.create(name="Earn 10", program=program, description="Earn",
+                                       points_required=10, duration_days=7)
+        auth_client.post(CREATE_AND_UPDATE_URL, {"user_id": "1", "program": program.id, "transaction_type": "earn",
+                                                 "points": 10}, format="json")
+    assert TaskProgressJob.objects.using("shard_1").count() == 1
+
+    assert process_task_progress_jobs() == 2
+    assert UserTaskProgress.objects.using("default").get(task__program=coffee).completed_at is not None
+    assert UserTaskProgress.objects.using("shard_1").get(task__program=vip).completed_at is not None
+    assert dispatch_outbox_events() == (0, 0)  # No webhooks configured: events wait on both shards
+    assert OutboxEvent.objects.using("shard_1").get().status == "pending"
+
+
+def test_writes_are_refused_while_a_program_moves(auth_client, programs):
+    _, vip = programs
+    ProgramShard.objects.filter(program=vip).update(state="moving")
+
+    response = auth_client.post(POINTS_URL + "?action=earn", {"user_id": "1", "program_id": vip.id, "points": 5},
+                                format="json")
+    assert response.status_code == 503
+    assert auth_client.get(LOYALTY_TIER_LIST_URL, {"program_id": vip.id}).status_code == 200
+
+
+def test_move_program_between_shards(auth_client, programs):
+    coffee, _ = programs
+    LoyaltyTier.objects.create(program=coffee, tier_name="Silver", points_to_reach=10)
+    for points in (10, 20):
+        Transaction.objects.create(user_id="1", program=coffee, transaction_type="earn", points=points)
+    transaction_ids = set(Transaction.objects.using("default").values_list("id", flat=True))
+
+    output = StringIO()
+    call_command("move_program_shard", coffee.id, "shard_1", stdout=output)
+
+    assert f"Program {coffee.id} lives on shard_1." in output.getvalue()
+    assert shard_for_program(coffee.id) == "shard_1"
+    assert ProgramShard.objects.get(program=coffee).state == "active"
+    assert set(Transaction.objects.using("shard_1").values_list("id", flat=True)) == transaction_ids
+    assert not Transaction.objects.using("default").exists()
+    assert not PointBalance.objects.using("default").exists()
+    with use_program_shard(coffee.id):
+        assert program_liability(coffee.id).outstanding_points == 30
+
+    response = auth_client.get(POINT_BALANCE_URL, {"user_id": "1", "program_id": coffee.id})
+    assert (response.data["balance"], response.data["tier"]) == (30, "Silver")
+
+    assert move_program(coffee.id, "default", settle=0) == "default"  # And back
+    assert PointBalance.objects.using("default").get(user_id="1").balance == 30
+    assert not LoyaltyProgram.objects.using("shard_1").filter(id=coffee.id).exists()
+
+
+def test_move_catches_up_on_changes_made_during_the_copy(programs):
+    """ Rows written or deleted after the copy are caught up from the change log, nothing else is re-read """
+    coffee, _ = programs
+    silver = LoyaltyTier.objects.create(program=coffee, tier_name="Silver", points_to_reach=10)
+    gold = LoyaltyTier.objects.create(program=coffee, tier_name="Gold", points_to_reach=100)
+    for user_id in ("1", "2", "3"):
+        Transaction.objects.create(user_id=user_id, program=coffee, transaction_type="earn", points=10)
+
+    def during_move(message):
+        if message == "Freezing writes":  # The copy is done but the program still takes writes
+            Transaction.objects.create(user_id="1", program=coffee, transaction_type="earn", points=5)
+            LoyaltyTier.objects.filter(id=silver.id).update(points_to_reach=15)
+            gold.delete()
+        elif message.startswith("Catching up"):
+            # The transaction with its balance, aggregate slot and tier bucket, and the two tiers
+            assert message == "Catching up on 6 changed row(s)"
+
+    move_program(coffee.id, "shard_1", settle=0, log=during_move)
+
+    assert PointBalance.objects.using("shard_1").get(user_id="1").balance == 15
+    assert Transaction.objects.using("shard_1").filter(program=coffee).count() == 4
+    tiers = LoyaltyTier.objects.using("shard_1").filter(program=coffee)
+    assert list(tiers.values_list("tier_name", "points_to_reach")) == [("Silver", 15)]
+    assert not ShardMoveChange.objects.using("default").exists()
+    assert not ShardMoveCapture.objects.using("default").exists()
+
+
+def test_deleting_a_program_removes_its_shard_rows(programs):
+    _, vip = programs
+    Transaction.objects.using("shard_1").create(user_id="1", program=vip, transaction_type="earn", points=5)
+
+    vip.delete()
+
+    assert not PointBalance.objects.using("shard_1").exists()
+    assert not Transaction.objects.using("shard_1").exists()
+    assert not LoyaltyProgram.objects.using("shard_1").exists()
@@ -0,0 +1,133 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, SpecialTask, TaskProgressJob, Transaction, UserTaskProgress
+from loyalty.services import TASK_PROGRESS_MAX_ATTEMPTS, process_task_progress_jobs
+
+# API Endpoints
+CREATE_AND_UPDATE_URL = "/api/transactions/create_and_update_task_progress/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def api_client():
+    """Returns an APIClient instance"""
+    return APIClient()
+
+
+@pytest.fixture
+def auth_client(api_client):
+    """Authenticated API client for the program owner"""
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    token = Token.objects.create(user=owner)
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return api_client, owner
+
+
+@pytest.fixture
+def create_programs(auth_client):
+    """Creates two programs, each with one special task"""
+    _, owner = auth_client
+    programs = []
+    for name in ("VIP Rewards", "Coffee Club"):
+        program = LoyaltyProgram.objects.create(name=name, owner=owner)
+        SpecialTask.objects.create(
+            name="Buy twice",
+            program=program,
+            description="Make 2 purchases worth 100 points.",
+            points_required=100,
+            transactions_required=2,
+            duration_days=30,
+        )
+        programs.append(program)
+    return programs
+
+
+def test_endpoint_queues_job_instead_of_updating_progress(auth_client, create_programs):
+    """ The API records the transaction and a job, but leaves progress to the worker"""
+    api_client, _ = auth_client
+    program = create_programs[0]
+    data = {"user_id": "12345", "program": program.id, "transaction_type": "earn", "points": 60}
+
+    response = api_client.post(CREATE_AND_UPDATE_URL, data)
+
+    assert response.status_code == 201
+    assert TaskProgressJob.objects.filter(transaction_id=response.data["transaction"]["id"]).exists()
+    assert not UserTaskProgress.objects.exists()
+
+
+def test_worker_evaluates_jobs_grouped_by_program(create_programs):
+    """ A single worker batch applies every queued transaction to the right program's tasks"""
+    vip, coffee = create_programs
+    for program, user_id, points in [(vip, "1", 60), (vip, "1", 50), (coffee, "1", 30), (vip, "2", 10)]:
+        transaction = Transaction.objects.create(user_id=user_id, program=program, transaction_type="earn", points=points)
+        TaskProgressJob.objects.create(transaction=transaction, program=program)
+
+    assert process_task_progress_jobs(batch_size=10) == 4
+
+    vip_progress = UserTaskProgress.objects.get(user_id="1", task__program=vip)
+    assert vip_progress.points_earned == 110
+    assert vip_progress.transactions_count == 2
+    assert vip_progress.completed_at is not None
+
+    coffee_progress = UserTaskProgress.objects.get(user_id="1", task__program=coffee)
+    assert coffee_progress.points_earned == 30
+    assert coffee_progress.completed_at is None
+
+    assert UserTaskProgress.objects.get(user_id="2", task__program=vip).transactions_count == 1
+    assert not TaskProgressJob.objects.exists()
+
+
+def test_redeem_transactions_do_not_advance_progress(create_programs):
+    """ Only earn transactions count towards a task"""
+    program = create_programs[0]
+    transaction = Transaction.objects.create(user_id="1", program=program, transaction_type="redeem", points=40)
+    TaskProgressJob.objects.create(transaction=transaction, program=program)
+
+    process_task_progress_jobs()
+
+    progress = UserTaskProgress.objects.get(user_id="1", task__program=program)
+    assert progress.points_earned == 0
+    assert progress.transactions_count == 0
+
+
+def test_worker_command_drains_queue(create_programs):
+    """ The management command processes everything in batches and exits with --once"""
+    program = create_programs[0]
+    for _ in range(5):
+        transaction = Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=20)
+        TaskProgressJob.objects.create(transaction=transaction, program=program)
+
+    call_command("process_task_progress_jobs", "--once", "--batch-size", "2")
+
+    assert not TaskProgressJob.objects.exists()
+    assert UserTaskProgress.objects.get(user_id="1", task__program=program).transactions_count == 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_errors_at_commit_count_as_attempts(create_programs, monkeypatch):
+    """ A batch that fails when it commits (here a deferred foreign key check) still records the attempt """
+    program = create_programs[0]
+    transaction = Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=60)
+    job = TaskProgressJob.objects.create(transaction=transaction, program=program)
+
+    def dangling_progress(program_id, transactions):
+        UserTaskProgress.objects.create(user_id="1", task_id=2**31 - 1)
+
+    monkeypatch.setattr("loyalty.services.update_task_progress_for_transactions", dangling_progress)
+    assert process_task_progress_jobs() == 1
+
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ("pending", 1)
+    assert "foreign key" in job.last_error
+    assert not UserTaskProgress.objects.exists()
+
+    for _ in range(TASK_PROGRESS_MAX_ATTEMPTS - 1):
+        process_task_progress_jobs()
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ("failed", TASK_PROGRESS_MAX_ATTEMPTS)
+    assert process_task_progress_jobs() == 0  # No longer claimed
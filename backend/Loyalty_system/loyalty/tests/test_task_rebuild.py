@@ -0,0 +1,163 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, OutboxEvent, SpecialTask, TaskProgressBucket, TaskProgressJob, \
+    TaskRebuildJob, Transaction, UserTaskProgress
+from loyalty.services import enqueue_task_rebuild, process_task_rebuild_jobs, rebuild_task_progress
+
+# API Endpoints
+REBUILD_URL = "/api/special-tasks/{}/rebuild_progress/"
+
+pytestmark = pytest.mark.django_db
+
+TODAY = date(2024, 5, 20)
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def program(owner):
+    return LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner, webhook_url="https://merchant.example/hooks")
+
+
+def history(program, user_id, days_ago, points=10, transaction_type="earn", hour=12):
+    """ A transaction recorded `days_ago` days before TODAY """
+    transaction = Transaction.objects.create(user_id=user_id, program=program, transaction_type=transaction_type,
+                                             points=points)
+    timestamp = datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time(), tzinfo=dt_timezone.utc)
+    Transaction.objects.filter(id=transaction.id).update(timestamp=timestamp.replace(hour=hour))
+    return transaction
+
+
+def counts(task, user_id):
+    return UserTaskProgress.objects.filter(task=task, user_id=user_id).values_list(
+        "points_earned", "transactions_count").get()
+
+
+def test_rebuild_counts_the_task_window(program):
+    for user_id, days_ago, points in [("1", 0, 30), ("1", 6, 40), ("1", 7, 100), ("2", 3, 5), ("3", 30, 50)]:
+        history(program, user_id, days_ago, points)
+    history(program, "2", 1, 20, transaction_type="redeem")
+    task = SpecialTask.objects.create(name="Spend 50", program=program, description="Spend 50 in a week",
+                                      points_required=50, duration_days=7, reward_points=10)
+
+    assert rebuild_task_progress(task, today=TODAY) == (3, 1)
+
+    assert counts(task, "1") == (70, 2)  # Seven days ago is outside the window
+    assert counts(task, "2") == (5, 1)
+    assert counts(task, "3") == (0, 0)
+    assert UserTaskProgress.objects.get(task=task, user_id="1").completed_at is not None
+    assert OutboxEvent.objects.filter(event_type="task.completed").count() == 1
+
+
+def test_rebuild_overwrites_and_applies_conditions(program):
+    history(program, "1", 1, 60, hour=19)
+    history(program, "1", 2, 60, hour=9)
+    history(program, "1", 2, 10, hour=20)
+    task = SpecialTask.objects.create(name="Big evenings", program=program, description="Big evening purchases",
+                                      transactions_required=5, duration_days=30,
+                                      conditions={"min_points": 50, "hours": [18, 23]})
+    UserTaskProgress.objects.create(user_id="1", task=task, points_earned=999, transactions_count=9)
+
+    rebuild_task_progress(task, today=TODAY)
+
+    assert counts(task, "1") == (60, 1)
+
+
+def test_rebuild_leaves_queued_transactions_to_the_worker(program):
+    history(program, "1", 0, 10)
+    queued = history(program, "1", 0, 25)
+    TaskProgressJob.objects.create(transaction=queued, program=program)
+    task = SpecialTask.objects.create(name="Earn", program=program, description="Earn", duration_days=7)
+
+    rebuild_task_progress(task, today=TODAY)
+
+    assert counts(task, "1") == (10, 1)
+
+
+def test_rebuild_walks_members_in_chunks(program):
+    for user_id in ("a", "b", "c", "d", "e"):
+        history(program, user_id, 0, 10)
+    history(program, "c", 1, 15)
+    task = SpecialTask.objects.create(name="Earn", program=program, description="Earn", duration_days=7,
+                                      rolling_window=True)
+
+    assert rebuild_task_progress(task, chunk_size=2, today=TODAY) == (5, 5)
+
+    assert sorted(UserTaskProgress.objects.filter(task=task).values_list("user_id", "points_earned")) == [
+        ("a", 10), ("b", 10), ("c", 25), ("d", 10), ("e", 10)]
+    assert sorted(TaskProgressBucket.objects.filter(user_id="c").values_list("day", "points")) == [
+        (TODAY - timedelta(days=1), 15), (TODAY, 10)]
+
+
+def test_rebuild_endpoint_queues_a_job(owner, program):
+    """ The endpoint answers 202 with a job to poll; the worker runs the rebuild """
+    history(program, "1", 0, 10)
+    task = SpecialTask.objects.create(name="Earn", program=program, description="Earn", duration_days=7)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    assert client.get(REBUILD_URL.format(task.id)).status_code == 404
+
+    response = client.post(REBUILD_URL.format(task.id))
+    assert response.status_code == 202
+    assert (response.data["status"], response.data["members"]) == ("pending", 0)
+    assert response["Location"].endswith(REBUILD_URL.format(task.id))
+    assert not UserTaskProgress.objects.exists()
+    assert client.post(REBUILD_URL.format(task.id)).data["id"] == response.data["id"]  # Not queued twice
+
+    call_command("process_task_progress_jobs", "--once", "--rebuild-chunk-size", "1", stdout=StringIO())
+
+    response = client.get(REBUILD_URL.format(task.id))
+    assert (response.data["status"], response.data["members"], response.data["completed"]) == ("done", 1, 1)
+
+    intruder = User.objects.create_user(username="intruder", password="securepassword")
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=intruder).key}")
+    assert client.post(REBUILD_URL.format(task.id)).status_code == 403
+
+
+def test_rebuild_jobs_resume_from_their_cursor(program, monkeypatch):
+    """ Each chunk saves the job's cursor; a failed chunk is retried from it """
+    for user_id in ("a", "b", "c", "d", "e"):
+        history(program, user_id, 0, 10)
+    task = SpecialTask.objects.create(name="Earn", program=program, description="Earn", duration_days=7)
+    job = enqueue_task_rebuild(task)
+    TaskRebuildJob.objects.filter(id=job.id).update(created_at=datetime.combine(TODAY, datetime.min.time(),
+                                                                                 tzinfo=dt_timezone.utc))
+
+    assert process_task_rebuild_jobs(max_chunks=1, chunk_size=2) == 1
+    job.refresh_from_db()
+    assert (job.status, job.members, job.last_user_id) == ("running", 2, "b")
+
+    def broken_chunk(*args):
+        raise RuntimeError("Database went away")
+
+    monkeypatch.setattr("loyalty.services.rebuild_task_progress_chunk", broken_chunk)
+    process_task_rebuild_jobs(max_chunks=1, chunk_size=2)
+    job.refresh_from_db()
+    assert (job.attempts, job.last_user_id, job.last_error) == (1, "b", "Database went away")
+
+    monkeypatch.undo()
+    assert process_task_rebuild_jobs(chunk_size=2) == 3  # c-d, e, then the empty chunk that finishes the job
+    job.refresh_from_db()
+    assert (job.status, job.members) == ("done", 5)
+    assert sorted(UserTaskProgress.objects.filter(task=task).values_list("user_id", "points_earned")) == [
+        (user_id, 10) for user_id in "abcde"]
+    assert process_task_rebuild_jobs() == 0
+
+
+def test_rebuild_command(program):
+    history(program, "1", 0, 10)
+    task = SpecialTask.objects.create(name="Earn", program=program, description="Earn", duration_days=7)
+
+    output = StringIO()
+    call_command("rebuild_task_progress", str(task.id), "--chunk-size", "10", stdout=output)
+    assert f"Task {task.id}: rebuilt progress of 1 member(s), 1 newly completed." in output.getvalue()
@@ -0,0 +1,171 @@
+from datetime import datetime, timezone as dt_timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, SpecialTask, TaskProgressBucket, Transaction, UserTaskProgress
+from loyalty.rules import ProgramRules, compile_conditions, normalize_conditions
+from loyalty.services import update_task_progress_for_transactions
+
+# API Endpoints
+SPECIAL_TASK_LIST_URL = "/api/special-tasks/"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def program(owner):
+    return LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+def create_task(program, name, conditions=None, **fields):
+    fields.setdefault("transactions_required", 2)
+    return SpecialTask.objects.create(name=name, program=program, description=name, duration_days=30,
+                                      conditions=conditions or {}, **fields)
+
+
+def transaction(program, points=10, transaction_type="earn", hour=12, day=6, user_id="1"):
+    """ Unsaved transaction on a day of May 2024 (the 6th is a Monday) """
+    return Transaction(user_id=user_id, program=program, transaction_type=transaction_type, points=points,
+                       timestamp=datetime(2024, 5, day, hour, tzinfo=dt_timezone.utc))
+
+
+def counts(task, user_id="1"):
+    progress = UserTaskProgress.objects.get(task=task, user_id=user_id)
+    return progress.points_earned, progress.transactions_count
+
+
+def test_conditions_are_validated_and_normalized():
+    assert normalize_conditions({}) == {"transaction_types": ["earn"]}
+    assert normalize_conditions({"transaction_types": ["redeem", "earn", "earn"], "weekdays": [6, 5]}) == {
+        "transaction_types": ["earn", "redeem"], "weekdays": [5, 6]}
+    for conditions in ({"colour": "red"}, {"min_points": -1}, {"min_points": 10, "max_points": 5},
+                       {"hours": [9]}, {"hours": [8, 8]}, {"weekdays": [7]}, {"transaction_types": ["refund"]}):
+        with pytest.raises(ValueError):
+            normalize_conditions(conditions)
+
+
+def test_predicates(program):
+    big_evening = compile_conditions({"min_points": 50, "hours": [17, 22]})
+    assert big_evening(transaction(program, points=50, hour=17))
+    assert not big_evening(transaction(program, points=49, hour=17))
+    assert not big_evening(transaction(program, points=80, hour=22))
+    assert not big_evening(transaction(program, points=80, hour=18, transaction_type="redeem"))
+
+    night = compile_conditions({"hours": [22, 6], "transaction_types": ["earn", "redeem"]})
+    assert [night(transaction(program, hour=hour, transaction_type="redeem")) for hour in (23, 3, 6, 12)] == [
+        True, True, False, False]
+
+    weekend = compile_conditions({"weekdays": [5, 6]})
+    assert [weekend(transaction(program, day=day)) for day in (4, 5, 6)] == [True, True, False]
+
+
+def test_tasks_with_equal_conditions_share_a_predicate(program):
+    first = create_task(program, "Big spender", {"min_points": 100})
+    second = create_task(program, "Big spender II", {"min_points": 100, "transaction_types": ["earn"]})
+    other = create_task(program, "Anything")
+
+    rules = ProgramRules([first, second, other])
+
+    assert len(rules.groups) == 2
+    assert rules.tasks_advanced_by(transaction(program, points=150)) == [first, second, other]
+    assert rules.tasks_advanced_by(transaction(program, points=20)) == [other]
+
+
+def test_each_task_counts_only_matching_transactions(program):
+    plain = create_task(program, "Any purchase")
+    big = create_task(program, "Big purchase", {"min_points": 50})
+    evening = create_task(program, "Evening purchase", {"hours": [18, 23]})
+    redeemer = create_task(program, "Redeem", {"transaction_types": ["redeem"]})
+
+    update_task_progress_for_transactions(program.id, [
+        transaction(program, points=60, hour=10), transaction(program, points=20, hour=19),
+        transaction(program, points=30, hour=20, transaction_type="redeem"),
+    ])
+
+    assert counts(plain) == (80, 2)
+    assert counts(big) == (60, 1)
+    assert counts(evening) == (20, 1)
+    assert counts(redeemer) == (30, 1)
+    assert UserTaskProgress.objects.get(task=plain).completed_at is not None
+    assert UserTaskProgress.objects.get(task=big).completed_at is None
+
+
+def test_rolling_window_buckets_hold_matching_activity_only(program):
+    weekly_big = create_task(program, "Weekly big", {"min_points": 50}, rolling_window=True)
+    weekly = create_task(program, "Weekly", rolling_window=True)
+
+    update_task_progress_for_transactions(program.id, [transaction(program, points=60),
+                                                       transaction(program, points=10)])
+
+    assert sorted(TaskProgressBucket.objects.values_list("task_id", "points", "transactions")) == [
+        (weekly_big.id, 60, 1), (weekly.id, 70, 2)]
+    assert counts(weekly_big) == (60, 1)
+
+
+def test_rules_are_compiled_once_per_config_version(program):
+    task = create_task(program, "Big purchase", {"min_points": 50})
+    update_task_progress_for_transactions(program.id, [transaction(program, points=60)])
+
+    with CaptureQueriesContext(connection) as context:
+        update_task_progress_for_transactions(program.id, [transaction(program, points=60)])
+    task_queries = [query["sql"] for query in context.captured_queries if '"loyalty_specialtask"' in query["sql"]]
+    assert len(task_queries) == 1 and '"conditions"' not in task_queries[0]  # Only the existence check
+    assert counts(task) == (120, 2)
+
+    task.conditions = {"min_points": 100}
+    task.save()  # Bumps the config version: the next evaluation recompiles
+    update_task_progress_for_transactions(program.id, [transaction(program, points=60)])
+    assert counts(task) == (120, 2)
+
+
+def test_version_bumps_of_other_processes_are_seen(program):
+    """ The version is read from the database, so a change made by another worker recompiles the rules """
+    task = create_task(program, "Big purchase", {"min_points": 50})
+    update_task_progress_for_transactions(program.id, [transaction(program, points=60)])
+
+    SpecialTask.objects.filter(id=task.id).update(conditions={"min_points": 100})  # Another process: no signals
+    LoyaltyProgram.objects.filter(id=program.id).update(config_version=F("config_version") + 1)
+    update_task_progress_for_transactions(program.id, [transaction(program, points=60)])
+
+    assert counts(task) == (60, 1)
+
+
+def test_progress_is_only_built_for_existing_tasks(program):
+    """ Rules compiled before a task was deleted don't create progress rows pointing at it """
+    kept = create_task(program, "Kept")
+    deleted = create_task(program, "Deleted")
+    update_task_progress_for_transactions(program.id, [transaction(program)])
+    version = LoyaltyProgram.objects.get(id=program.id).config_version
+
+    deleted.delete()
+    LoyaltyProgram.objects.filter(id=program.id).update(config_version=version)  # The worker's rules are now stale
+    update_task_progress_for_transactions(program.id, [transaction(program, user_id="2")])
+
+    assert counts(kept, user_id="2") == (10, 1)
+    assert not UserTaskProgress.objects.filter(task_id=deleted.id).exists()
+
+
+def test_api_validates_conditions(owner, program):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    payload = {"name": "Happy hour", "program": program.id, "description": "Buy between 5 and 7 pm",
+               "duration_days": 30, "transactions_required": 3}
+
+    response = client.post(SPECIAL_TASK_LIST_URL, {**payload, "conditions": {"hours": [17, 19]}}, format="json")
+    assert response.status_code == 201
+    assert response.data["conditions"] == {"transaction_types": ["earn"], "hours": [17, 19]}
+
+    response = client.post(SPECIAL_TASK_LIST_URL, {**payload, "conditions": {"hours": [17, 25]}}, format="json")
+    assert response.status_code == 400
+    assert "hours" in str(response.data["conditions"])
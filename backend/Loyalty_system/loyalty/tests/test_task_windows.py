@@ -0,0 +1,92 @@
+from datetime import date, datetime, timezone as dt_timezone
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from loyalty.models import LoyaltyProgram, SpecialTask, TaskProgressBucket, Transaction, UserTaskProgress
+from loyalty.services import compact_task_buckets, enqueue_task_progress, process_task_progress_jobs, \
+    update_task_progress_for_transactions
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def program():
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    return LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+@pytest.fixture
+def weekly_task(program):
+    """ 3 purchases within any 7 days """
+    return SpecialTask.objects.create(name="Weekly regular", program=program, description="Buy 3 times in a week",
+                                      transactions_required=3, duration_days=7, rolling_window=True,
+                                      reward_points=50)
+
+
+def purchase(program, day, points=10, user_id="1"):
+    """ Unsaved earn transaction on a given day of May 2024 """
+    return Transaction(user_id=user_id, program=program, transaction_type="earn", points=points,
+                       timestamp=datetime(2024, 5, day, 12, tzinfo=dt_timezone.utc))
+
+
+def progress(task, user_id="1"):
+    return UserTaskProgress.objects.get(task=task, user_id=user_id)
+
+
+def test_only_the_last_days_count(program, weekly_task):
+    for day in (1, 5):
+        update_task_progress_for_transactions(program.id, [purchase(program, day)])
+    assert (progress(weekly_task).transactions_count, progress(weekly_task).points_earned) == (2, 20)
+
+    update_task_progress_for_transactions(program.id, [purchase(program, 10)])  # Window May 4-10: days 5 and 10
+    assert progress(weekly_task).transactions_count == 2
+    assert progress(weekly_task).completed_at is None
+
+    update_task_progress_for_transactions(program.id, [purchase(program, 11), purchase(program, 11)])
+    assert progress(weekly_task).transactions_count == 4
+    assert progress(weekly_task).completed_at is not None
+
+
+def test_buckets_hold_one_row_per_day(program, weekly_task):
+    update_task_progress_for_transactions(program.id, [purchase(program, 3, user_id=user_id)
+                                                       for user_id in ("1", "1", "2")])
+    update_task_progress_for_transactions(program.id, [purchase(program, 4, points=25)])
+
+    assert sorted(TaskProgressBucket.objects.values_list("user_id", "day", "points", "transactions")) == [
+        ("1", date(2024, 5, 3), 20, 2), ("1", date(2024, 5, 4), 25, 1), ("2", date(2024, 5, 3), 10, 1),
+    ]
+
+
+def test_lifetime_tasks_still_accumulate(program, weekly_task):
+    lifetime = SpecialTask.objects.create(name="Loyal", program=program, description="Buy 3 times",
+                                          transactions_required=3, duration_days=7)
+    for day in (1, 15, 30):
+        update_task_progress_for_transactions(program.id, [purchase(program, day)])
+
+    assert progress(lifetime).transactions_count == 3
+    assert progress(weekly_task).transactions_count == 1
+    assert not TaskProgressBucket.objects.filter(task=lifetime).exists()
+
+
+def test_worker_fills_buckets(program, weekly_task):
+    transaction = Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=10)
+    enqueue_task_progress(transaction)
+
+    assert process_task_progress_jobs() == 1
+    assert TaskProgressBucket.objects.get(task=weekly_task).day == transaction.timestamp.date()
+    assert progress(weekly_task).transactions_count == 1
+
+
+def test_compaction_removes_expired_buckets(program, weekly_task):
+    update_task_progress_for_transactions(program.id, [purchase(program, day) for day in (1, 10, 20)])
+
+    assert compact_task_buckets(today=date(2024, 5, 21)) == 2  # Days 1 and 10 are out of the 7-day window
+    assert list(TaskProgressBucket.objects.values_list("day", flat=True)) == [date(2024, 5, 20)]
+
+    SpecialTask.objects.filter(id=weekly_task.id).update(rolling_window=False)
+    output = StringIO()
+    call_command("compact_task_buckets", stdout=output)
+    assert "Deleted 1 expired task bucket(s)." in output.getvalue()
@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.checks import check_shared_caches
+from loyalty.models import LoyaltyProgram
+from loyalty.throttling import ProgramRateThrottle, TokenBucketThrottle, parse_rate
+
+# API Endpoints
+EARN_POINTS_URL = "/api/points/?action=earn"
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Frozen throttle clock that tests move forward by hand """
+    state = {"now": 1_000_000.0}
+    monkeypatch.setattr(TokenBucketThrottle, "timer", staticmethod(lambda: state["now"]))
+    return state
+
+
+@pytest.fixture
+def rates(settings):
+    settings.LOYALTY_THROTTLE_RATES = {
+        "program": {"rate": "1/s", "burst": 3},
+        "client": {"rate": "10/s", "burst": 100},
+    }
+    return settings.LOYALTY_THROTTLE_RATES
+
+
+def make_client(username):
+    owner = User.objects.create_user(username=username, password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client, LoyaltyProgram.objects.create(name=f"{username} rewards", owner=owner)
+
+
+def earn(client, program):
+    return client.post(EARN_POINTS_URL, {"user_id": "1", "program_id": program.id, "points": 10}, format="json")
+
+
+def test_parse_rate():
+    assert parse_rate("50/s") == 50
+    assert parse_rate("120/min") == 2
+    assert parse_rate("3600/hour") == 1
+
+
+def test_program_bucket_allows_burst_then_429(rates, clock):
+    """ A program gets `burst` requests at once, then 429 with Retry-After """
+    client, program = make_client("owner")
+
+    assert [earn(client, program).status_code for _ in range(3)] == [200, 200, 200]
+
+    response = earn(client, program)
+    assert response.status_code == 429
+    assert response["Retry-After"] == "1"
+
+
+def test_program_bucket_refills_at_sustained_rate(rates, clock):
+    """ Tokens come back at `rate`; rejected requests don't use any """
+    client, program = make_client("owner")
+    for _ in range(3):
+        earn(client, program)
+    assert earn(client, program).status_code == 429
+
+    clock["now"] += 1
+    assert earn(client, program).status_code == 200
+    assert earn(client, program).status_code == 429
+
+    clock["now"] += 10  # Idle long enough to be full again
+    assert [earn(client, program).status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_noisy_program_does_not_affect_others(rates, clock):
+    """ Buckets are per program: another merchant keeps its full budget """
+    noisy_client, noisy_program = make_client("noisy")
+    quiet_client, quiet_program = make_client("quiet")
+    for _ in range(4):
+        earn(noisy_client, noisy_program)
+
+    assert earn(noisy_client, noisy_program).status_code == 429
+    assert earn(quiet_client, quiet_program).status_code == 200
+
+
+def test_client_bucket(rates, clock):
+    """ A single API client is limited across all its programs """
+    rates["client"] = {"rate": "1/min", "burst": 2}
+    client, program = make_client("owner")
+    other_program = LoyaltyProgram.objects.create(name="Second", owner=program.owner)
+
+    assert earn(client, program).status_code == 200
+    assert earn(client, other_program).status_code == 200
+    response = earn(client, other_program)
+    assert response.status_code == 429
+    assert response["Retry-After"] == "60"
+
+
+def test_unconfigured_scope_is_not_throttled(settings, clock):
+    settings.LOYALTY_THROTTLE_RATES = {}
+    client, program = make_client("owner")
+
+    assert {earn(client, program).status_code for _ in range(20)} == {200}
+
+
+def test_other_users_cannot_drain_a_program_bucket(rates, clock):
+    """ Requests naming a program the caller doesn't own never touch that program's bucket """
+    client, program = make_client("owner")
+    intruder, _ = make_client("intruder")
+    for _ in range(5):
+        earn(intruder, program)
+
+    assert [earn(client, program).status_code for _ in range(3)] == [200, 200, 200]
+
+
+def test_program_ownership_is_cached(rates, clock, django_assert_num_queries):
+    """ After the first request, bucketing a program's requests doesn't look up its owner again """
+    client, program = make_client("owner")
+    earn(client, program)
+    request = SimpleNamespace(auth=None, user=User.objects.get(username="owner"), data={"program_id": program.id},
+                              query_params={})
+
+    with django_assert_num_queries(0):
+        assert ProgramRateThrottle().get_bucket_id(request, None) == str(program.id)
+
+
+def test_program_ids_are_normalized(rates, clock):
+    """ "5" and "05" share the program's bucket """
+    client, program = make_client("owner")
+    for program_id in (program.id, f"0{program.id}", f" {program.id}"):
+        client.post(EARN_POINTS_URL, {"user_id": "1", "program_id": program_id, "points": 10}, format="json")
+
+    assert earn(client, program).status_code == 429
+
+
+def test_throttle_buckets_require_a_shared_cache(settings, rates):
+    """ The deployment check reports per-process throttle buckets """
+    settings.LOYALTY_READ_REPLICAS = []
+    errors = check_shared_caches()
+    assert len(errors) == 1 and "LOYALTY_THROTTLE_CACHE" in errors[0].msg
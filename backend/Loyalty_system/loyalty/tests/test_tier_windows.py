@@ -0,0 +1,110 @@
+from datetime import date
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils.timezone import now
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.models import LoyaltyProgram, LoyaltyTier, OutboxEvent, PointBalance, TierPointsBucket, Transaction
+from loyalty.services import compact_tier_buckets, requalify_tiers, tier_window_start
+
+# API Endpoints
+POINTS_URL = "/api/points/"
+POINT_BALANCE_URL = "/api/point-balances/"
+
+pytestmark = pytest.mark.django_db
+
+TODAY = date(2024, 5, 20)
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="securepassword")
+
+
+@pytest.fixture
+def program(owner):
+    """ Tiers count the points of the last 12 months """
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner, tier_window_months=12)
+    LoyaltyTier.objects.create(program=program, tier_name="Silver", points_to_reach=100)
+    LoyaltyTier.objects.create(program=program, tier_name="Gold", points_to_reach=400)
+    return program
+
+
+@pytest.fixture
+def auth_client(owner):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client
+
+
+def test_window_start():
+    assert tier_window_start(12, TODAY) == date(2023, 6, 1)
+    assert tier_window_start(1, TODAY) == date(2024, 5, 1)
+    assert tier_window_start(5, date(2024, 1, 31)) == date(2023, 9, 1)
+
+
+def test_earning_fills_the_monthly_bucket(program, auth_client):
+    Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=30)
+    auth_client.post(POINTS_URL + "?action=earn", {"user_id": "1", "program_id": program.id, "points": 20},
+                     format="json")
+    Transaction.objects.create(user_id="1", program=program, transaction_type="redeem", points=10)
+
+    month = now().date().replace(day=1)
+    assert list(TierPointsBucket.objects.values_list("user_id", "month", "points")) == [("1", month, 50)]
+
+
+def test_tier_follows_qualifying_points(program, auth_client):
+    PointBalance.objects.create(user_id="1", program=program, balance=0, total_points_earned=500, qualifying_points=150)
+
+    response = auth_client.get(POINT_BALANCE_URL, {"user_id": "1", "program_id": program.id})
+    assert response.data["tier"] == "Silver"
+
+    Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=250)
+    balance = PointBalance.objects.get(user_id="1")
+    assert (balance.total_points_earned, balance.qualifying_points, balance.get_loyalty_tier()) == (750, 400, "Gold")
+    assert OutboxEvent.objects.get(event_type="tier.changed").payload == {
+        "user_id": "1", "previous_tier": "Silver", "tier": "Gold", "total_points_earned": 750,
+        "qualifying_points": 400}
+
+
+def test_requalification_downgrades_and_upgrades(program):
+    PointBalance.objects.create(user_id="1", program=program, total_points_earned=500)  # Gold on lifetime points
+    PointBalance.objects.create(user_id="2", program=program, total_points_earned=50, qualifying_points=50)
+    for user_id, month, points in [("1", date(2023, 5, 1), 400), ("1", date(2024, 1, 1), 100),
+                                   ("2", date(2023, 6, 1), 300), ("2", date(2024, 5, 1), 150)]:
+        TierPointsBucket.objects.create(program=program, user_id=user_id, month=month, points=points)
+
+    assert requalify_tiers(today=TODAY, chunk_size=1) == (2, 2)
+
+    assert list(PointBalance.objects.order_by("user_id").with_tier().values_list(
+        "qualifying_points", "tier_name")) == [(100, "Silver"), (450, "Gold")]
+    assert sorted((event.payload["user_id"], event.payload["previous_tier"], event.payload["tier"])
+                  for event in OutboxEvent.objects.filter(event_type="tier.changed")) == [
+        ("1", "Gold", "Silver"), ("2", None, "Gold")]
+    assert requalify_tiers(today=TODAY) == (0, 0)
+
+
+def test_removing_the_window_restores_lifetime_tiers(program):
+    PointBalance.objects.create(user_id="1", program=program, total_points_earned=500, qualifying_points=100)
+    program.tier_window_months = None
+    program.save()
+
+    assert requalify_tiers(today=TODAY) == (1, 1)
+    assert PointBalance.objects.with_tier().values_list("qualifying_points", "tier_name").get() == (None, "Gold")
+
+
+def test_command_requalifies_and_compacts(program):
+    PointBalance.objects.create(user_id="1", program=program, total_points_earned=500)
+    TierPointsBucket.objects.create(program=program, user_id="1", month=date(2000, 1, 1), points=500)
+    assert compact_tier_buckets(today=TODAY) == 1
+
+    TierPointsBucket.objects.create(program=program, user_id="1", month=date(2000, 1, 1), points=500)
+    output = StringIO()
+    call_command("requalify_tiers", "--program", str(program.id), stdout=output)
+
+    assert "Requalified 1 member(s), 1 tier change(s); deleted 1 expired bucket(s)." in output.getvalue()
+    assert PointBalance.objects.get().qualifying_points == 0
@@ -0,0 +1,175 @@
+import gzip
+import json
+from datetime import datetime, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from loyalty.archive import archive_transactions, read_archived_transactions
+from loyalty.models import BalanceCheckpoint, LoyaltyProgram, TaskProgressJob, Transaction, TransactionArchive
+
+# API Endpoints
+TRANSACTION_LIST_URL = "/api/transactions/"
+
+CUTOFF = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def archive_root(settings, tmp_path):
+    """ Archive files go to a temporary directory """
+    settings.LOYALTY_ARCHIVE_ROOT = tmp_path
+    return tmp_path
+
+
+@pytest.fixture
+def auth_client():
+    """ Authenticated API client for the owner user """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=owner).key}")
+    return client, owner
+
+
+@pytest.fixture
+def create_program(auth_client):
+    """ Program with transactions in two old months and one recent transaction """
+    _, owner = auth_client
+    program = LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+    for user_id, transaction_type, points, timestamp in (
+        ("1", "earn", 100, datetime(2020, 11, 5, tzinfo=timezone.utc)),
+        ("1", "redeem", 30, datetime(2020, 12, 10, tzinfo=timezone.utc)),
+        ("2", "earn", 70, datetime(2020, 12, 20, tzinfo=timezone.utc)),
+        ("1", "earn", 5, datetime(2022, 3, 1, tzinfo=timezone.utc)),
+    ):
+        transaction = Transaction.objects.create(user_id=user_id, program=program,
+                                                 transaction_type=transaction_type, points=points)
+        Transaction.objects.filter(id=transaction.id).update(timestamp=timestamp)
+    return program
+
+
+def test_archive_moves_old_rows_to_monthly_files(create_program, archive_root):
+    """ Old rows leave the hot table and land in one compressed file per month """
+    assert archive_transactions(CUTOFF) == {create_program.id: 3}
+
+    assert Transaction.objects.filter(program=create_program).count() == 1
+    archives = list(TransactionArchive.objects.order_by("month"))
+    assert [(archive.month.month, archive.row_count) for archive in archives] == [(11, 1), (12, 2)]
+
+    with gzip.open(archive_root / archives[1].path, "rt") as archive_file:
+        rows = [json.loads(line) for line in archive_file]
+    assert [(row["user_id"], row["transaction_type"], row["points"]) for row in rows] == [
+        ("1", "redeem", 30), ("2", "earn", 70)]
+
+    create_program.refresh_from_db()
+    assert create_program.archived_before == CUTOFF
+
+
+def test_archive_leaves_balance_checkpoints(create_program):
+    """ Archived totals per member are kept, and accumulate over several runs """
+    archive_transactions(datetime(2020, 12, 1, tzinfo=timezone.utc))
+    archive_transactions(CUTOFF)
+
+    checkpoints = {checkpoint.user_id: checkpoint for checkpoint in BalanceCheckpoint.objects.all()}
+    assert (checkpoints["1"].points_earned, checkpoints["1"].points_redeemed) == (100, 30)
+    assert checkpoints["1"].transaction_count == 2
+    assert checkpoints["1"].balance == 70
+    assert checkpoints["2"].balance == 70
+    assert checkpoints["1"].archived_before == CUTOFF
+
+
+def test_archive_removes_queued_jobs_of_archived_rows(create_program):
+    """ Jobs pointing at archived transactions are removed with them """
+    old = Transaction.objects.filter(program=create_program).order_by("timestamp").first()
+    TaskProgressJob.objects.create(transaction=old, program=create_program)
+
+    archive_transactions(CUTOFF)
+
+    assert not TaskProgressJob.objects.exists()
+
+
+def test_history_reads_through_to_archive(auth_client, create_program):
+    """ A date range reaching past the cutoff includes archived rows, oldest first """
+    client, _ = auth_client
+    archive_transactions(CUTOFF)
+
+    response = client.get(TRANSACTION_LIST_URL, {"program_id": create_program.id, "start_date": "2020-12-01"})
+
+    assert response.status_code == 200
+    assert [row["points"] for row in response.data["results"]] == [30, 70, 5]
+    assert response.data["results"][0]["timestamp"] == "2020-12-10T00:00:00Z"
+
+
+def test_history_read_through_applies_filters(auth_client, create_program):
+    """ user_id and end_date filter archived rows too """
+    client, _ = auth_client
+    archive_transactions(CUTOFF)
+
+    response = client.get(TRANSACTION_LIST_URL, {
+        "program_id": create_program.id, "user_id": "1", "start_date": "2020-01-01", "end_date": "2020-12-31",
+    })
+
+    assert [row["points"] for row in response.data["results"]] == [100, 30]
+
+
+def test_history_without_start_date_reads_archive_on_request(auth_client, create_program, archive_root):
+    """ Without start_date the archive is read when end_date is before the cutoff or include_archived is set """
+    client, _ = auth_client
+    archive_transactions(CUTOFF)
+
+    response = client.get(TRANSACTION_LIST_URL, {"program_id": create_program.id, "end_date": "2020-12-31"})
+    assert [row["points"] for row in response.data["results"]] == [100, 30, 70]
+
+    response = client.get(TRANSACTION_LIST_URL, {"program_id": create_program.id, "include_archived": "true"})
+    assert [row["points"] for row in response.data["results"]] == [100, 30, 70, 5]
+
+    for path in archive_root.rglob("*.ndjson.gz"):
+        path.unlink()
+    response = client.get(TRANSACTION_LIST_URL, {"program_id": create_program.id})  # Live rows only
+    assert [row["points"] for row in response.data] == [5]
+
+
+def test_history_pages_through_archive_and_live_rows(auth_client, create_program, archive_root):
+    """ Pages run through the archive in manifest order, then the live rows; a page only opens its files """
+    client, _ = auth_client
+    archive_transactions(CUTOFF)
+    params = {"program_id": create_program.id, "include_archived": "true", "page_size": 2}
+
+    first = client.get(TRANSACTION_LIST_URL, params).data
+    second = client.get(TRANSACTION_LIST_URL, {**params, "page": 2}).data
+    assert [row["points"] for row in first["results"]] == [100, 30]
+    assert [row["points"] for row in second["results"]] == [70, 5]
+    assert first["next"] is not None and second["next"] is None
+
+    response = client.get(TRANSACTION_LIST_URL, {**params, "user_id": "1", "page": 2})
+    assert [row["points"] for row in response.data["results"]] == [5]
+
+    november = TransactionArchive.objects.get(month__month=11)
+    (archive_root / november.path).unlink()
+    response = client.get(TRANSACTION_LIST_URL, {**params, "page_size": 1, "page": 2})
+    assert [row["points"] for row in response.data["results"]] == [30]  # November is skipped by its row count
+
+
+def test_history_without_old_range_skips_archive(auth_client, create_program, archive_root):
+    """ Requests starting at or after the cutoff never open archive files """
+    client, _ = auth_client
+    archive_transactions(CUTOFF)
+    for path in archive_root.rglob("*.ndjson.gz"):
+        path.unlink()
+
+    response = client.get(TRANSACTION_LIST_URL, {"program_id": create_program.id, "start_date": "2021-06-01"})
+
+    assert [row["points"] for row in response.data] == [5]
+    assert read_archived_transactions(create_program.id, start=datetime(2021, 6, 1, tzinfo=timezone.utc)) == []
+
+
+def test_archive_command(create_program):
+    """ The management command archives up to the given date """
+    call_command("archive_transactions", "--before", "2020-12-01")
+
+    assert TransactionArchive.objects.get().row_count == 1
+    assert Transaction.objects.filter(program=create_program).count() == 3
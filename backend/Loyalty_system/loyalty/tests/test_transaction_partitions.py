@@ -0,0 +1,91 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.contrib.auth.models import User
+
+from loyalty.models import LoyaltyProgram, Transaction
+from loyalty.partitions import DEFAULT_PARTITION, ensure_month_partition, detach_partitions_before, \
+    month_partitions, partition_name
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != "postgresql", reason="Table partitioning needs PostgreSQL"),
+]
+
+
+@pytest.fixture
+def create_program(db):
+    """ Creates a loyalty program """
+    owner = User.objects.create_user(username="owner", password="securepassword")
+    return LoyaltyProgram.objects.create(name="VIP Rewards", owner=owner)
+
+
+def create_transaction_at(program, timestamp):
+    """ Transactions use auto_now_add, so move the row to the wanted time after inserting it """
+    transaction = Transaction.objects.create(user_id="1", program=program, transaction_type="earn", points=10)
+    Transaction.objects.filter(id=transaction.id).update(timestamp=timestamp)
+    return transaction
+
+
+def stored_in(transaction):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT tableoid::regclass::text FROM loyalty_transaction WHERE id = %s", [transaction.id])
+        return cursor.fetchone()[0]
+
+
+def test_new_transactions_land_in_current_month(create_program):
+    """ Migrations create the current month's partition up front """
+    transaction = Transaction.objects.create(user_id="1", program=create_program, transaction_type="earn", points=10)
+
+    assert stored_in(transaction) == partition_name(date.today())
+
+
+def test_command_creates_future_partitions():
+    """ The management command pre-creates partitions ahead of time """
+    call_command("manage_transaction_partitions", "--months-ahead", "14")
+
+    months = [month for month, _ in month_partitions()]
+    current = date.today().replace(day=1)
+    assert current in months
+    assert date(current.year + 1, current.month, 1) in months
+
+
+def test_partition_creation_moves_rows_out_of_default(create_program):
+    """ Rows that fell into the default partition are moved when their month is created """
+    transaction = create_transaction_at(create_program, datetime(2019, 5, 17, tzinfo=timezone.utc))
+    assert stored_in(transaction) == DEFAULT_PARTITION
+
+    assert ensure_month_partition(date(2019, 5, 1)) is True
+    assert stored_in(transaction) == "loyalty_transaction_p2019_05"
+
+
+def test_date_filter_prunes_partitions(create_program):
+    """ A date-range query only scans the partitions that overlap the range """
+    ensure_month_partition(date(2019, 5, 1))
+    ensure_month_partition(date(2019, 6, 1))
+
+    plan = Transaction.objects.filter(
+        program=create_program,
+        timestamp__range=[datetime(2019, 5, 2, tzinfo=timezone.utc), datetime(2019, 5, 20, tzinfo=timezone.utc)],
+    ).explain()
+
+    assert "loyalty_transaction_p2019_05" in plan
+    assert "loyalty_transaction_p2019_06" not in plan
+    assert partition_name(date.today()) not in plan
+
+
+def test_detach_old_months(create_program):
+    """ Detaching a month removes its rows from the table without deleting them row by row """
+    ensure_month_partition(date(2019, 5, 1))
+    old = create_transaction_at(create_program, datetime(2019, 5, 17, tzinfo=timezone.utc))
+    recent = Transaction.objects.create(user_id="1", program=create_program, transaction_type="earn", points=10)
+
+    assert detach_partitions_before(date(2019, 6, 1)) == ["loyalty_transaction_p2019_05"]
+
+    assert not Transaction.objects.filter(id=old.id).exists()
+    assert Transaction.objects.filter(id=recent.id).exists()
+    with connection.cursor() as cursor:  # The detached month is kept as a standalone table
+        cursor.execute("SELECT COUNT(*) FROM loyalty_transaction_p2019_05")
+        assert cursor.fetchone()[0] == 1
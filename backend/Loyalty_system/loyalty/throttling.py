@@ -0,0 +1,123 @@
+"""
+Token-bucket throttles for the points endpoints.
+
+Buckets live in the cache (settings.LOYALTY_THROTTLE_CACHE) and are configured per scope in
+settings.LOYALTY_THROTTLE_RATES, e.g. {'program': {'rate': '50/s', 'burst': 100}}: `rate` is the
+sustained refill rate and `burst` the bucket size. A scope without a configuration is not throttled.
+
+Each bucket is stored as a single integer, the "theoretical arrival time" of the generic cell rate
+algorithm (a token bucket expressed as a time). A check is a constant number of cache operations
+built around an atomic incr, so it is O(1) and safe to share between workers. The cache must be
+shared (Redis, memcached) for the limits to hold across processes: `manage.py check --deploy`
+reports a per-process cache (loyalty/checks.py).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .api_keys import ApiKeyClaims
+from .cache import get_program_owner_id
+
+MICROSECONDS = 1_000_000
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """ '50/s', '3000/min', '10/hour' -> tokens per second """
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class; subclasses set `scope` and implement `get_bucket_id()`.
+    Rejected requests get 429 with a Retry-After header computed by `wait()`.
+    """
+    scope = None
+    timer = time.time
+
+    def get_bucket_id(self, request, view):
+        raise NotImplementedError('.get_bucket_id() must be overridden')
+
+    def get_config(self):
+        config = getattr(settings, 'LOYALTY_THROTTLE_RATES', {}).get(self.scope)
+        if not config:
+            return None
+        return parse_rate(config['rate']), int(config.get('burst', 1))
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        config = self.get_config()
+        bucket_id = self.get_bucket_id(request, view) if config else None
+        if bucket_id is None:
+            return True
+
+        rate, burst = config
+        interval = max(1, int(MICROSECONDS / rate))  # Time one token takes to refill
+        capacity = burst * interval
+        cache = caches[getattr(settings, 'LOYALTY_THROTTLE_CACHE', 'default')]
+        key = f"loyalty:throttle:{self.scope}:{bucket_id}"
+        now = int(self.timer() * MICROSECONDS)
+        timeout = int((capacity + interval) / MICROSECONDS) + 1  # A bucket left alone that long is full again
+
+        arrival = cache.get(key)
+        if arrival is None or arrival < now:
+            # Bucket is full; restart it from now (races here only ever let through a full bucket)
+            arrival = now + interval
+            cache.set(key, arrival, timeout)
+        else:
+            try:
+                arrival = cache.incr(key, interval)
+            except ValueError:  # Expired between get() and incr()
+                arrival = now + interval
+                cache.set(key, arrival, timeout)
+            else:
+                cache.touch(key, timeout)
+
+        if arrival - now <= capacity:
+            return True
+
+        try:
+            cache.decr(key, interval)  # The rejected request doesn't consume a token
+        except ValueError:
+            pass
+        self.retry_after = (arrival - now - capacity) / MICROSECONDS
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+
+class ProgramRateThrottle(TokenBucketThrottle):
+    """
+    One bucket per loyalty program, shared by every client sending requests for it.
+    Only the program's own traffic is counted: the program of an API key, or a program the
+    authenticated user owns. Requests naming someone else's program only spend their client bucket.
+    """
+    scope = 'program'
+
+    def get_bucket_id(self, request, view):
+        if isinstance(request.auth, ApiKeyClaims):
+            return str(request.auth.program_id)
+        data = request.data if hasattr(request.data, 'get') else {}
+        try:
+            program_id = int(data.get('program_id') or request.query_params.get('program_id'))
+        except (TypeError, ValueError):
+            return None
+        # Cached: throttling must not add a query to every request
+        owned = request.user and request.user.is_authenticated and get_program_owner_id(program_id) == request.user.pk
+        return str(program_id) if owned else None
+
+
+class ClientRateThrottle(TokenBucketThrottle):
+    """ One bucket per API client: the API key, the authenticated user, or the client IP for anonymous requests """
+    scope = 'client'
+
+    def get_bucket_id(self, request, view):
+        if isinstance(request.auth, ApiKeyClaims):
+            return f"key-{request.auth.key_id}"
+        if request.user and request.user.is_authenticated:
+            return f"user-{request.user.pk}"
+        return f"ip-{self.get_ident(request)}"
@@ -1,27 +1,11 @@
 from django.urls import path, include
-from rest_framework import permissions
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.routers import DefaultRouter
+from .docs import openapi_schema, swagger_ui
+from .metrics import metrics_view
 from .views import LoyaltyProgramViewSet, PointBalanceViewSet, TransactionViewSet, PointsViewSet, LoyaltyTierViewSet, \
     UserTaskProgressViewSet, SpecialTaskViewSet, RegisterView, LoginView, LogoutView
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Loyalty System API",
-        default_version='v1',
-        description="API documentation for the Loyalty System project",
-        terms_of_service="https://www.example.com/terms/",
-        contact=openapi.Contact(email="support@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    authentication_classes=[TokenAuthentication],
-    permission_classes=(permissions.AllowAny,),
-)
-
 router = DefaultRouter()
 router.register(r'loyalty-programs', LoyaltyProgramViewSet)
 router.register(r'point-balances', PointBalanceViewSet)
@@ -34,7 +18,9 @@ router.register(r'user-task-progress', UserTaskProgressViewSet, basename='user-t
 
 urlpatterns = [
     path('api/', include(router.urls)),
-    path('', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('', swagger_ui, name='schema-swagger-ui'),
+    path('openapi.json', openapi_schema, name='schema-json'),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape target
     path('api/register/', RegisterView.as_view(), name='register'),  #  Register
     path('api/login/', LoginView.as_view(), name='login'),
     path('api/logout/', LogoutView.as_view(), name='logout'),  #  Logout
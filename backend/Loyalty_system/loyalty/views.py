@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
+from django.db import IntegrityError, router, transaction as db_transaction
 from django.db.models import Q
-from rest_framework import viewsets, status, permissions, generics
+from rest_framework import viewsets, status, permissions, generics, serializers
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -9,11 +10,23 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from .api_keys import ProgramApiKeyMixin, issue_api_key, revoke_api_key
+from .archive import ArchiveReadThrough, parse_bound
+from .cache import bump_program_config_version
+from .fast_serializers import serialize_transactions, serialize_point_balances, serialize_members, MEMBER_COLUMNS
+from .pagination import NoCountPageNumberPagination
+from .etags import ProgramConfigETagMixin, make_etag, etag_matches, not_modified
 from .permissions import IsOwnerOfLoyaltyProgram
-from .models import LoyaltyProgram, PointBalance, Transaction, LoyaltyTier, UserTaskProgress, SpecialTask
+from .models import LoyaltyProgram, PointBalance, Transaction, LoyaltyTier, UserTaskProgress, SpecialTask, \
+    ProgramApiKey
 from .serializers import LoyaltyProgramSerializer, PointBalanceSerializer, TransactionSerializer, LoyaltyTierSerializer, \
-    UserTaskProgressSerializer, SpecialTaskSerializer, UserSerializer
-from .services import redeem_points, earn_points, update_task_progress_for_transaction
+    UserTaskProgressSerializer, SpecialTaskSerializer, UserSerializer, BulkPointBalanceLookupSerializer, \
+    MemberFilterSerializer, ProgramLiabilitySerializer, ProgramApiKeySerializer, ProgramBulkSerializer, \
+    SpecialTaskBulkSerializer, MemberSummaryQuerySerializer, TaskRebuildJobSerializer
+from .sharding import ProgramShardMixin, group_by_shard, is_sharded, locate, use_program_shard
+from .throttling import ProgramRateThrottle, ClientRateThrottle
+from .services import redeem_points, earn_points, enqueue_task_progress, program_liability, enqueue_task_rebuild, \
+    member_summary
 
 
 class RegisterView(generics.CreateAPIView):
@@ -64,7 +77,7 @@ class LoyaltyProgramViewSet(viewsets.ModelViewSet):
         """ Ensure object exists and check ownership before returning """
         obj = super().get_object()
 
-        if obj.owner != self.request.user:
+        if obj.owner_id != self.request.user.id:
             raise PermissionDenied("You do not have permission to access this Loyalty Program.")
 
         return obj
@@ -72,10 +85,172 @@ class LoyaltyProgramViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-class LoyaltyTierViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=["get"])
+    def members(self, request, pk=None):
+        """
+        Paginated list of the program's members with balance, total earned and tier.
+        Filters: min_balance, max_balance, min_total_earned, max_total_earned, tier; sort with `ordering`.
+        The tier is computed in the same SELECT, so a page costs one query whatever its size.
+        """
+        program = self.get_object()
+        params = MemberFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        lookups = {
+            "min_balance": "balance__gte",
+            "max_balance": "balance__lte",
+            "min_total_earned": "total_points_earned__gte",
+            "max_total_earned": "total_points_earned__lte",
+            "tier": "tier_name",
+        }
+        members = PointBalance.objects.filter(program=program).with_tier().filter(
+            **{lookup: filters[name] for name, lookup in lookups.items() if name in filters}
+        ).order_by(filters["ordering"], "id")
+
+        paginator = NoCountPageNumberPagination()
+        with use_program_shard(program.id):
+            page = paginator.paginate_queryset(members.values_list(*MEMBER_COLUMNS), request, view=self)
+        return paginator.get_paginated_response(serialize_members(page))
+
+    @action(detail=True, methods=["get"])
+    def liability(self, request, pk=None):
+        """
+        Outstanding points (the points liability), lifetime earned / redeemed and member count.
+        Served from the program's running aggregates: a sum over a few rows whatever the number of members.
+        """
+        program = self.get_object()
+        with use_program_shard(program.id):
+            aggregate = program_liability(program.id)
+        return Response(ProgramLiabilitySerializer(aggregate).data)
+
+    @action(detail=True, methods=["get", "post"], url_path="api-keys")
+    def api_keys(self, request, pk=None):
+        """
+        GET lists the program's API keys; POST issues one from `name`, `scopes` and an optional `expires_at`.
+        The key string is only ever returned in the POST response.
+        """
+        program = self.get_object()
+        if request.method == "GET":
+            return Response(ProgramApiKeySerializer(program.api_keys.order_by("id"), many=True).data)
+
+        serializer = ProgramApiKeySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        api_key, key = issue_api_key(program, **serializer.validated_data)
+        return Response({**ProgramApiKeySerializer(api_key).data, "key": key}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["post"], url_path=r"api-keys/(?P<key_id>[0-9a-f]+)/revoke")
+    def revoke_api_key(self, request, pk=None, key_id=None):
+        """ Revoke one of the program's API keys """
+        program = self.get_object()
+        try:
+            api_key = program.api_keys.get(key_id=key_id)
+        except ProgramApiKey.DoesNotExist:
+            return Response({"error": "API key not found."}, status=status.HTTP_404_NOT_FOUND)
+        if api_key.revoked_at is None:
+            revoke_api_key(api_key)
+        return Response(ProgramApiKeySerializer(api_key).data)
+
+class ProgramConfigBulkMixin:
+    """
+    `POST .../bulk/` creates and `PATCH .../bulk/` updates many rows of one program's configuration,
+    from {"program": id, "items": [...]} (PATCH items carry their `id`).
+    The owner is checked once, every item is validated before anything is written, and the rows are
+    written with one bulk_create / bulk_update in a DB transaction that bumps the config version once.
+    """
+    bulk_serializer_class = None
+    bulk_unique_field = None  # Field that must stay unique within a program
+
+    @action(detail=False, methods=["post", "patch"])
+    def bulk(self, request):
+        payload = ProgramBulkSerializer(data=request.data)
+        payload.is_valid(raise_exception=True)
+        program_id, items = payload.validated_data["program"], payload.validated_data["items"]
+        if not LoyaltyProgram.objects.filter(id=program_id, owner=request.user).exists():
+            raise serializers.ValidationError({"program": "Invalid program or you do not have permission."})
+
+        model = self.queryset.model
+        creating = request.method == "POST"
+        if creating:
+            items_serializer = self.bulk_serializer_class(data=items, many=True)
+            if not items_serializer.is_valid():
+                raise serializers.ValidationError({"items": items_serializer.errors})
+            rows = [model(program_id=program_id, **data) for data in items_serializer.validated_data]
+            fields = []
+        else:
+            rows, fields = self.validate_bulk_update(model, program_id, items)
+        self.validate_bulk_unique(model, program_id, rows)
+
+        try:
+            with db_transaction.atomic(using=router.db_for_write(model)):
+                if creating:
+                    model.objects.bulk_create(rows)
+                elif fields:
+                    model.objects.bulk_update(rows, fields)
+                bump_program_config_version(program_id)  # Bulk writes send no post_save signals
+        except IntegrityError:  # e.g. two tiers swapping names: constraints are checked row by row
+            raise serializers.ValidationError({"items": "The items conflict with each other or existing rows."})
+
+        return Response(self.bulk_serializer_class(rows, many=True).data,
+                        status=status.HTTP_201_CREATED if creating else status.HTTP_200_OK)
+
+    def validate_bulk_update(self, model, program_id, items):
+        """ Program rows with every item's changes applied (unsaved), and the changed fields """
+        ids = [item.get("id") for item in items]
+        if not all(isinstance(row_id, int) for row_id in ids) or len(set(ids)) != len(ids):
+            raise serializers.ValidationError({"items": "Every item needs a distinct integer `id`."})
+        rows_by_id = model.objects.filter(program_id=program_id).in_bulk(ids)
+        missing = [row_id for row_id in ids if row_id not in rows_by_id]
+        if missing:
+            raise serializers.ValidationError({"items": f"Not found in this program: {missing}."})
+
+        item_serializers = [self.bulk_serializer_class(rows_by_id[item["id"]], data=item, partial=True)
+                            for item in items]
+        errors = [{} if item_serializer.is_valid() else item_serializer.errors for item_serializer in item_serializers]
+        if any(errors):
+            raise serializers.ValidationError({"items": errors})
+
+        fields = set()
+        for item_serializer in item_serializers:
+            for name, value in item_serializer.validated_data.items():
+                setattr(item_serializer.instance, name, value)
+                fields.add(name)
+        return [item_serializer.instance for item_serializer in item_serializers], sorted(fields)
+
+    def validate_bulk_unique(self, model, program_id, rows):
+        """ Refuse payloads that would repeat `bulk_unique_field` within the program """
+        name = self.bulk_unique_field
+        if name is None:
+            return
+        values = dict(model.objects.filter(program_id=program_id).exclude(
+            id__in=[row.id for row in rows if row.id]).values_list("id", name))
+        seen = set(values.values())
+        for row in rows:
+            value = getattr(row, name)
+            if value in seen:
+                raise serializers.ValidationError({"items": f"Duplicate {name}: {value}."})
+            seen.add(value)
+
+
+class LoyaltyTierViewSet(ProgramApiKeyMixin, ProgramConfigBulkMixin, ProgramConfigETagMixin, ProgramShardMixin,
+                         viewsets.ModelViewSet):
     queryset = LoyaltyTier.objects.all()
     serializer_class = LoyaltyTierSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOfLoyaltyProgram]
+    api_key_resource = "tiers"
+    etag_resource = "tiers"
+    bulk_serializer_class = LoyaltyTierSerializer
+    bulk_unique_field = "tier_name"
+
+    def get_queryset(self):
+        """ Filter tiers by program_id if provided in query parameters. """
+        if getattr(self, "swagger_fake_view", False):  # OpenAPI generation has no request (loyalty/docs.py)
+            return LoyaltyTier.objects.none()
+        queryset = super().get_queryset()
+        program_id = self.request.query_params.get('program_id')
+        if program_id:
+            queryset = queryset.filter(program_id=program_id)
+        return queryset
 
     def perform_create(self, serializer):
         """Automatically set the loyalty program based on request data."""
@@ -90,10 +265,11 @@ class LoyaltyTierViewSet(viewsets.ModelViewSet):
 
         serializer.save(program=program)  #  Set program before saving
 
-class PointBalanceViewSet(viewsets.ModelViewSet):
+class PointBalanceViewSet(ProgramApiKeyMixin, ProgramShardMixin, viewsets.ModelViewSet):
     queryset = PointBalance.objects.all()
     serializer_class = PointBalanceSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOfLoyaltyProgram]
+    api_key_resource = "balances"
 
 
     def list(self, request, *args, **kwargs):
@@ -104,19 +280,89 @@ class PointBalanceViewSet(viewsets.ModelViewSet):
         if not user_id or not program_id:
             return Response({"error": "Both user_id and program_id are required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if the loyalty program exists and belongs to the current user
+        # Cheap version check on the (user_id, program) unique index; answers If-None-Match before serializing
+        versions = PointBalance.objects.filter(
+            user_id=user_id, program_id=program_id, program__owner=request.user
+        ).values_list('id', 'version', 'program__config_version').first()
+
+        if versions is None:
+            return self.missing_balance_response(request, program_id)
+
+        etag = make_etag("balance", *versions)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        point_balance = PointBalance.objects.with_tier().get(id=versions[0])
+        serializer = self.get_serializer(point_balance)
+        return Response(serializer.data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+    @staticmethod
+    def missing_balance_response(request, program_id):
+        """ 403 if the loyalty program doesn't exist or isn't the current user's, else 404 """
         if not PointBalance.objects.filter(program_id=program_id, program__owner=request.user).exists():
             return Response({"error": "Unauthorized or invalid program."}, status=status.HTTP_403_FORBIDDEN)
+        return Response({"error": "Point balance not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        try:
-            point_balance = PointBalance.objects.get(user_id=user_id, program_id=program_id)
-            serializer = self.get_serializer(point_balance)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except PointBalance.DoesNotExist:
-            return Response({"error": "Point balance not found."}, status=status.HTTP_404_NOT_FOUND)
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """
+        Everything a member's wallet shows, in one call: balance, tier, points to the next tier,
+        the latest `transactions` (10 by default) and progress on tasks not completed yet.
+        Four queries whatever the number of tiers, tasks or transactions.
+        """
+        params = MemberSummaryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        user_id, program_id = params.validated_data["user_id"], params.validated_data["program_id"]
+
+        balance = PointBalance.objects.filter(user_id=user_id, program_id=program_id,
+                                              program__owner=request.user).first()
+        if balance is None:
+            return self.missing_balance_response(request, program_id)
+        return Response(member_summary(balance, params.validated_data["transactions"]), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get", "post"])
+    def bulk(self, request):
+        """
+        Look up many balances in one query.
+        GET takes comma-separated `user_ids` / `program_ids`, POST takes them as JSON lists.
+        Only balances in programs owned by the current user are returned, each with its tier.
+        """
+        if request.method == "GET":
+            data = {
+                key: [value for value in request.query_params.get(key, "").split(",") if value]
+                for key in ("user_ids", "program_ids") if key in request.query_params
+            }
+        else:
+            data = request.data
+
+        lookup = BulkPointBalanceLookupSerializer(data=data)
+        lookup.is_valid(raise_exception=True)
+        if is_sharded():
+            return Response(self.bulk_across_shards(request.user, lookup.validated_data), status=status.HTTP_200_OK)
+
+        filters = {"program__owner": request.user, "user_id__in": lookup.validated_data["user_ids"]}
+        if lookup.validated_data.get("program_ids"):
+            filters["program_id__in"] = lookup.validated_data["program_ids"]
+
+        balances = PointBalance.objects.filter(**filters).order_by("program_id", "user_id")
+        return Response(serialize_point_balances(balances), status=status.HTTP_200_OK)
+
+    @staticmethod
+    def bulk_across_shards(owner, lookup):
+        """ The bulk lookup fanned out to every shard holding one of the owner's programs, merged in order """
+        programs = LoyaltyProgram.objects.filter(owner=owner)
+        if lookup.get("program_ids"):
+            programs = programs.filter(id__in=lookup["program_ids"])
+
+        rows = []
+        for alias, program_ids in group_by_shard(programs.values_list("id", flat=True)).items():
+            rows += serialize_point_balances(
+                PointBalance.objects.using(alias).filter(program_id__in=program_ids, user_id__in=lookup["user_ids"])
+            )
+        return sorted(rows, key=lambda row: (row["program"], row["user_id"]))
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(ProgramApiKeyMixin, ProgramShardMixin, viewsets.ModelViewSet):
     """
     Handles transactions where users earn or redeem points.
     Transactions can be filtered by user_id, program_id, and date range.
@@ -124,12 +370,15 @@ class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOfLoyaltyProgram]
+    api_key_resource = "transactions"
 
     def get_queryset(self):
         """
         Filters transactions based on user_id, program_id, and optional date range.
         Ensures only the owner of the loyalty program can access transactions.
         """
+        if getattr(self, "swagger_fake_view", False):  # OpenAPI generation has no request (loyalty/docs.py)
+            return Transaction.objects.none()
         user = self.request.user
         queryset = super().get_queryset()
 
@@ -147,6 +396,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
         except LoyaltyProgram.DoesNotExist:
             raise PermissionDenied("Program not found.")  # 🚨 Deny access if program doesn't exist
 
+        self.program = program  # Used by list() to read through to archived transactions
+
         # Apply filters if user is the owner
         filters = {"program_id": program_id}
         user_id = self.request.query_params.get("user_id")
@@ -164,30 +415,66 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
         return queryset.filter(**filters)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Read-only fast path: rows are serialized straight from values() tuples.
+        A range reaching below the program's archive cutoff (`start_date` or `end_date` before it), or
+        `include_archived=true`, reads through to archived rows, oldest first, a page at a time.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        archive = self.get_archive_read_through(queryset)
+        if archive is not None:
+            paginator = NoCountPageNumberPagination()
+            return paginator.get_paginated_response(paginator.paginate_queryset(archive, request, view=self))
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        return Response(serialize_transactions(queryset))
+
+    def get_archive_read_through(self, queryset):
+        """ Archived then live rows matching the request filters (loyalty/archive.py); None skips the archive """
+        program = getattr(self, "program", None)
+        if program is None or program.archived_before is None:
+            return None
+        params = self.request.query_params
+        start = parse_bound(params["start_date"]) if params.get("start_date") else None
+        end = parse_bound(params["end_date"]) if params.get("end_date") else None
+        if (params.get("start_date") and start is None) or (params.get("end_date") and end is None):
+            return None  # Unparseable bounds: the ORM filter decides
+        below_cutoff = any(bound is not None and bound < program.archived_before for bound in (start, end))
+        if not below_cutoff and params.get("include_archived") != "true":
+            return None
+        if start is not None and start >= program.archived_before:
+            return None
+        return ArchiveReadThrough(program.id, queryset, user_id=params.get("user_id") or None, start=start, end=end)
+
     @action(detail=False, methods=["post"])
     def create_and_update_task_progress(self, request):
         """
-        Creates a transaction and automatically checks user task progress.
+        Creates a transaction and queues a user task progress update.
+        Progress is evaluated by the `process_task_progress_jobs` worker, not inside this request.
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        transaction = serializer.save()
 
-        # Update related user task progress
-        update_task_progress_for_transaction(transaction)
+        with db_transaction.atomic(using=router.db_for_write(Transaction)):
+            transaction = serializer.save()
+            enqueue_task_progress(transaction)  # Queued in the same DB transaction as the ledger row
 
         return Response(
-            {"message": "Transaction created and progress updated!", "transaction": serializer.data},
+            {"message": "Transaction created and progress update queued!", "transaction": serializer.data},
             status=status.HTTP_201_CREATED
         )
 
-class PointsViewSet(viewsets.ModelViewSet):
+class PointsViewSet(ProgramApiKeyMixin, ProgramShardMixin, viewsets.ModelViewSet):
     """
     A viewset for handling point-related actions (earn/redeem points).
     """
     queryset = PointBalance.objects.all()
     serializer_class = PointBalanceSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOfLoyaltyProgram]
+    api_key_resource = "points"
+    throttle_classes = [ProgramRateThrottle, ClientRateThrottle]  # Token buckets, see LOYALTY_THROTTLE_RATES
+
     def create(self, request, *args, **kwargs):
         """
         Override the create method to handle earn/redeem actions via `action` query parameter.
@@ -216,7 +503,8 @@ class PointsViewSet(viewsets.ModelViewSet):
 
 
 
-class SpecialTaskViewSet(viewsets.ModelViewSet):
+class SpecialTaskViewSet(ProgramApiKeyMixin, ProgramConfigBulkMixin, ProgramConfigETagMixin, ProgramShardMixin,
+                         viewsets.ModelViewSet):
     """
     A viewset for managing Special Tasks.
     Supports CRUD operations and filtering by program_id.
@@ -224,21 +512,52 @@ class SpecialTaskViewSet(viewsets.ModelViewSet):
     queryset = SpecialTask.objects.all()
     serializer_class = SpecialTaskSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOfLoyaltyProgram]
+    api_key_resource = "tasks"
+    etag_resource = "tasks"
+    bulk_serializer_class = SpecialTaskBulkSerializer
     def get_queryset(self):
         """
         Filter tasks by program_id if provided in query parameters.
         """
+        if getattr(self, "swagger_fake_view", False):  # OpenAPI generation has no request (loyalty/docs.py)
+            return SpecialTask.objects.none()
         queryset = super().get_queryset()
         program_id = self.request.query_params.get('program_id')
         if program_id:
             queryset = queryset.filter(program_id=program_id)
         return queryset
 
+    @action(detail=True, methods=["get", "post"])
+    def rebuild_progress(self, request, pk=None):
+        """
+        POST queues a recount of members' progress on this task from their transactions of the last
+        `duration_days` days and answers 202; the `process_task_progress_jobs` worker runs it in chunks
+        of members. A rebuild already queued or running is returned instead of a second one.
+        GET polls the latest rebuild of the task.
+        """
+        task = self.get_object()
+        if request.method == "GET":
+            with use_program_shard(task.program_id):
+                job = task.rebuild_jobs.order_by("-id").first()
+            if job is None:
+                return Response({"error": "No rebuild was requested for this task."}, status=status.HTTP_404_NOT_FOUND)
+            return Response(TaskRebuildJobSerializer(job).data)
+
+        job = enqueue_task_rebuild(task)
+        return Response(TaskRebuildJobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                        headers={"Location": request.build_absolute_uri(request.path)})
 
-class UserTaskProgressViewSet(viewsets.ModelViewSet):
-    queryset = UserTaskProgress.objects.all()
+
+class UserTaskProgressViewSet(ProgramApiKeyMixin, ProgramShardMixin, viewsets.ModelViewSet):
+    queryset = UserTaskProgress.objects.select_related('task')  # Serializer reads task.name / task.description
     serializer_class = UserTaskProgressSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOfLoyaltyProgram]
+    api_key_resource = "tasks"
+
+    def get_shard_program_id(self, request):
+        """ Progress rows belong to the program of their task """
+        task_id = request.data.get('task') if isinstance(request.data, dict) else None
+        return locate(SpecialTask, task_id)[1] if str(task_id).isdigit() else None
 
     def create(self, request, *args, **kwargs):
         """